@@ -0,0 +1,162 @@
+"""
+Server-Sent Events for new alerts (GET /api/notifications/stream).
+
+Each server process has one AlertStream. Alerts are published to it as soon as
+the transaction that created them commits (alerts.create_alert). A background
+poller picks up alerts committed by other processes (other server workers,
+worker.py) with one small query every ALERT_STREAM_POLL_INTERVAL seconds. It
+re-reads the last ALERT_STREAM_POLL_OVERLAP seconds of alerts each time, because
+ids and timestamps are assigned before commit: on PostgreSQL an alert can commit
+after one with a higher id. Open streams only touch the database when an alert is
+addressed to them.
+
+Event ids are alert ids, so a reconnecting EventSource sends Last-Event-ID and
+gets the alerts it missed. A comment line goes out every ALERT_STREAM_HEARTBEAT
+seconds so proxies don't close idle streams.
+
+Every listener holds its connection open. Serve the app with workers that can
+park many idle connections cheaply, e.g.
+    gunicorn -k gevent --worker-connections 1000 app:app
+(gunicorn and gevent are in requirements.txt; gevent patches the threading
+primitives used here). With sync workers each listener occupies a whole worker.
+"""
+import os
+import json
+import time
+import threading
+from datetime import timedelta
+from collections import deque
+from sqlalchemy import event, func
+from db_config import RoutingSession
+from models import db, ph_time, Alert, AlertReceipt
+
+EVENT_BACKLOG = 1000 # Recent alerts kept in memory to wake streams
+CATCH_UP_LIMIT = 100 # Alerts replayed at most after Last-Event-ID
+
+class AlertStream:
+    def __init__(self, app=None):
+        self.app = None
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=EVENT_BACKLOG) # (seq, alert_id, recipient ids)
+        self._known = set() # Alert ids in _events, so the poller doesn't publish them twice
+        self._seq = 0
+        self._poller_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ALERT_STREAM_HEARTBEAT', 15)
+        app.config.setdefault('ALERT_STREAM_POLL_INTERVAL', 1.0)
+        app.config.setdefault('ALERT_STREAM_POLL_OVERLAP', 30) # Seconds an alert may take to commit
+        app.config.setdefault('ALERT_STREAM_RETRY_MS', 5000)
+        self.app = app
+
+    def publish(self, alert_id, recipient_ids):
+        """
+        Wakes the streams of the recipients (and every admin/developer stream).
+        """
+        with self._cond:
+            if alert_id in self._known:
+                return
+            if len(self._events) == self._events.maxlen:
+                self._known.discard(self._events[0][1])
+            self._seq += 1
+            self._events.append((self._seq, alert_id, frozenset(recipient_ids)))
+            self._known.add(alert_id)
+            self._cond.notify_all()
+
+    def publish_on_commit(self, alert_id, recipient_ids):
+        db.session.info.setdefault('new_alerts', []).append((alert_id, list(recipient_ids)))
+
+    def wait(self, seq, user_id, is_admin, timeout):
+        """
+        Blocks until alerts newer than `seq` arrive or `timeout` passes. Returns the
+        current seq and the ids of the new alerts addressed to the user.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            ids = [alert_id for event_seq, alert_id, recipients in self._events
+                   if event_seq > seq and (is_admin or user_id in recipients)]
+            return self._seq, ids
+
+    def events(self, user_id, is_admin, last_event_id=None):
+        """
+        The SSE body for one listener. Runs outside the request context, opening an
+        app context only around each query so idle streams hold no DB connection.
+        """
+        from alerts import get_stream_alerts, inbox_item_json
+        self._start_poller()
+        with self._cond:
+            seq = self._seq
+        heartbeat = self.app.config['ALERT_STREAM_HEARTBEAT']
+        delivered = deque(maxlen=EVENT_BACKLOG)
+
+        yield f"retry: {self.app.config['ALERT_STREAM_RETRY_MS']}\n\n"
+        pending = {'after': last_event_id} if last_event_id is not None else None
+        while True:
+            if pending:
+                with self.app.app_context():
+                    items = [inbox_item_json(alert, is_read) for alert, is_read in
+                             get_stream_alerts(user_id, is_admin, limit=CATCH_UP_LIMIT, **pending)]
+                for item in items:
+                    if item['id'] in delivered:
+                        continue
+                    delivered.append(item['id'])
+                    yield f"id: {item['id']}\nevent: alert\ndata: {json.dumps(item)}\n\n"
+            seq, ids = self.wait(seq, user_id, is_admin, heartbeat)
+            pending = {'ids': ids} if ids else None
+            if not ids:
+                yield ": heartbeat\n\n"
+
+    # --- Alerts committed by other processes ---
+    def _start_poller(self):
+        with self._cond:
+            if self._poller_pid == os.getpid():
+                return
+            # One poller per process; started lazily so each forked server worker gets its own
+            self._poller_pid = os.getpid()
+        threading.Thread(target=self._poll, name='spim-alert-stream', daemon=True).start()
+
+    def _poll(self):
+        watermark = None # Newest alert timestamp seen
+        seen = {} # Alert ids inside the overlap window -> timestamp
+        while True:
+            try:
+                with self.app.app_context():
+                    overlap = timedelta(seconds=self.app.config['ALERT_STREAM_POLL_OVERLAP'])
+                    if watermark is None:
+                        # Start from now: alerts already committed are not news
+                        watermark = db.session.query(func.max(Alert.timestamp)).scalar() or ph_time()
+                        seen = {alert_id: timestamp for alert_id, timestamp in
+                                db.session.query(Alert.id, Alert.timestamp).filter(Alert.timestamp >= watermark - overlap)}
+                    rows = db.session.query(Alert.id, Alert.timestamp)\
+                        .filter(Alert.timestamp >= watermark - overlap)\
+                        .order_by(Alert.timestamp, Alert.id).all()
+                    new = [(alert_id, timestamp) for alert_id, timestamp in rows if alert_id not in seen]
+                    if new:
+                        new_ids = [alert_id for alert_id, _ in new]
+                        recipients = {alert_id: [] for alert_id in new_ids}
+                        for alert_id, user_id in db.session.query(AlertReceipt.alert_id, AlertReceipt.user_id)\
+                                .filter(AlertReceipt.alert_id.in_(new_ids)):
+                            recipients[alert_id].append(user_id)
+                        for alert_id, timestamp in new:
+                            self.publish(alert_id, recipients[alert_id])
+                            seen[alert_id] = timestamp
+                        watermark = max(watermark, new[-1][1])
+                    seen = {alert_id: timestamp for alert_id, timestamp in seen.items()
+                            if timestamp >= watermark - overlap}
+            except Exception as e:
+                print(f"✗ Alert stream poll failed: {e}")
+            time.sleep(self.app.config['ALERT_STREAM_POLL_INTERVAL'])
+
+alert_stream = AlertStream()
+
+def _after_commit(session):
+    for alert_id, recipient_ids in session.info.pop('new_alerts', []):
+        alert_stream.publish(alert_id, recipient_ids)
+
+def _after_rollback(session):
+    session.info.pop('new_alerts', None)
+
+event.listen(RoutingSession, 'after_commit', _after_commit)
+event.listen(RoutingSession, 'after_rollback', _after_rollback)
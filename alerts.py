@@ -0,0 +1,211 @@
+"""
+Alerts sent to farmers (manual alerts from the dashboard and auto-alerts from the
+infestation threshold check).
+
+Each alert is stored once (Alert: message, level, source, time) and delivered with
+one AlertReceipt row per recipient holding only (alert_id, user_id, is_read). The
+farmer API reads a farmer's receipts; the admin log lists alerts with their
+recipient counts, and deleting an alert removes its receipts by key. New alerts
+are pushed to open notification streams once committed (see alert_stream.py).
+"""
+import json
+import base64
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import insert, literal, func, case
+from sqlalchemy.orm import joinedload
+from models import db, ph_time, Alert, AlertReceipt
+from analytics import invalidate_notifications_on_commit
+from alert_stream import alert_stream
+
+def create_alert(message, level, recipient_ids, from_user_id=None):
+    """
+    Adds an alert and a receipt for every recipient to the session (caller commits).
+    """
+    alert = Alert(message=message, level=level, from_user_id=from_user_id, timestamp=ph_time())
+    db.session.add(alert)
+    db.session.flush() # Receipts need alert.id
+    recipient_ids = sorted(set(int(user_id) for user_id in recipient_ids))
+    if recipient_ids:
+        db.session.execute(insert(AlertReceipt), [
+            {'alert_id': alert.id, 'user_id': user_id, 'is_read': False} for user_id in recipient_ids
+        ])
+    invalidate_notifications_on_commit()
+    alert_stream.publish_on_commit(alert.id, recipient_ids)
+    return alert
+
+def delete_alerts(alert_ids):
+    """
+    Deletes alerts and their receipts (caller commits). Returns the number of alerts deleted.
+    """
+    alert_ids = [int(alert_id) for alert_id in alert_ids]
+    if not alert_ids:
+        return 0
+    AlertReceipt.query.filter(AlertReceipt.alert_id.in_(alert_ids)).delete(synchronize_session=False)
+    deleted = Alert.query.filter(Alert.id.in_(alert_ids)).delete(synchronize_session=False)
+    invalidate_notifications_on_commit()
+    return deleted
+
+def mark_read(user_id, alert_ids=None):
+    """
+    Marks a farmer's receipts as read, all unread ones if alert_ids is None (caller commits).
+    Returns the number of receipts changed.
+    """
+    query = AlertReceipt.query.filter_by(user_id=user_id, is_read=False)
+    if alert_ids is not None:
+        query = query.filter(AlertReceipt.alert_id.in_(alert_ids))
+    changed = query.update({'is_read': True, 'read_at': ph_time()}, synchronize_session=False)
+    if changed:
+        invalidate_notifications_on_commit()
+    return changed
+
+def get_inbox(user_id, include_read=False):
+    """
+    A farmer's alerts as (Alert, is_read) pairs, newest first; unread only unless include_read.
+    """
+    query = db.session.query(Alert, AlertReceipt.is_read)\
+        .join(AlertReceipt, AlertReceipt.alert_id == Alert.id)\
+        .options(joinedload(Alert.from_user))\
+        .filter(AlertReceipt.user_id == user_id)
+    if not include_read:
+        query = query.filter(AlertReceipt.is_read == False)
+    return query.order_by(Alert.timestamp.desc(), Alert.id.desc()).all()
+
+def count_unread(user_id):
+    return AlertReceipt.query.filter_by(user_id=user_id, is_read=False).count()
+
+# --- Delta sync (mobile inbox) ---
+# Alert timestamps and read_at are set before commit, so on PostgreSQL a change can become
+# visible after a later one (like the stream's poller, see alert_stream.py). The cursor
+# therefore re-reads this window behind its watermarks and lists the ids inside it that
+# the client already has, so nothing is skipped and nothing is sent twice.
+SYNC_OVERLAP = timedelta(seconds=30)
+
+@dataclass
+class SyncCursor:
+    alert_time: Optional[datetime] = None # Newest alert timestamp handed out
+    seen: frozenset = frozenset() # Alert ids within SYNC_OVERLAP of alert_time
+    read_time: Optional[datetime] = None # Newest read_at handed out
+    read_seen: frozenset = frozenset() # Read alert ids within SYNC_OVERLAP of read_time
+    after_id: int = 0 # Older cursors (a bare alert id): everything above this id
+
+def encode_sync_cursor(cursor):
+    raw = json.dumps({
+        't': cursor.alert_time.isoformat() if cursor.alert_time else None, 's': sorted(cursor.seen),
+        'r': cursor.read_time.isoformat() if cursor.read_time else None, 'rs': sorted(cursor.read_seen),
+    }).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_sync_cursor(cursor):
+    """
+    SyncCursor from a `since` value. A bare alert id, or a cursor from before the
+    watermarks ([alert id, read_at]), resumes by id once; without a read watermark
+    every read receipt up to that id is reported.
+    """
+    def parse_time(value):
+        return datetime.fromisoformat(value) if value else None
+
+    if cursor.isdigit():
+        return SyncCursor(after_id=int(cursor))
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if isinstance(raw, list):
+            alert_id, read_at = raw
+            return SyncCursor(after_id=int(alert_id), read_time=parse_time(read_at))
+        return SyncCursor(parse_time(raw['t']), frozenset(int(i) for i in raw['s']),
+                          parse_time(raw['r']), frozenset(int(i) for i in raw['rs']))
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("invalid since cursor")
+
+def get_inbox_changes(user_id, since, include_read=False):
+    """
+    A farmer's inbox changes after a `since` cursor: (new (Alert, is_read) pairs newest
+    first, ids of older alerts read since, cursor for the next call).
+    Raises ValueError on a bad cursor.
+    """
+    cursor = decode_sync_cursor(since)
+    # The next cursor is built from these same rows, so an alert that commits meanwhile is never marked seen unsent
+    inbox = db.session.query(Alert, AlertReceipt.is_read)\
+        .join(AlertReceipt, AlertReceipt.alert_id == Alert.id)\
+        .options(joinedload(Alert.from_user))\
+        .filter(AlertReceipt.user_id == user_id)
+    if cursor.alert_time:
+        inbox = inbox.filter(Alert.timestamp >= cursor.alert_time - SYNC_OVERLAP)
+    else:
+        inbox = inbox.filter(Alert.id > cursor.after_id)
+    window = inbox.order_by(Alert.timestamp.desc(), Alert.id.desc()).all()
+    new_ids = {alert.id for alert, _ in window} - cursor.seen
+    new_items = [(alert, is_read) for alert, is_read in window
+                 if alert.id in new_ids and (include_read or not is_read)]
+
+    reads = db.session.query(AlertReceipt.alert_id, AlertReceipt.read_at)\
+        .filter(AlertReceipt.user_id == user_id, AlertReceipt.is_read == True)
+    if cursor.read_time is not None:
+        reads = reads.filter(AlertReceipt.read_at >= cursor.read_time - SYNC_OVERLAP)
+    reads = reads.order_by(AlertReceipt.alert_id).all()
+    read_ids = [alert_id for alert_id, _ in reads
+                if alert_id not in cursor.read_seen and alert_id not in new_ids
+                and (cursor.alert_time or alert_id <= cursor.after_id)]
+
+    # Next watermarks; with nothing to go on yet they start from the user's newest alert, or now
+    alert_time = max([alert.timestamp for alert, _ in window] + [cursor.alert_time or datetime.min])
+    if alert_time == datetime.min:
+        alert_time = db.session.query(func.max(Alert.timestamp))\
+            .join(AlertReceipt, AlertReceipt.alert_id == Alert.id)\
+            .filter(AlertReceipt.user_id == user_id).scalar() or ph_time()
+    seen = {alert.id for alert, _ in window if alert.timestamp >= alert_time - SYNC_OVERLAP}
+    if not cursor.alert_time:
+        # Id-based cursor: alerts up to that id were delivered before
+        seen |= {alert_id for (alert_id,) in db.session.query(Alert.id)
+                 .join(AlertReceipt, AlertReceipt.alert_id == Alert.id)
+                 .filter(AlertReceipt.user_id == user_id, Alert.id <= cursor.after_id,
+                         Alert.timestamp >= alert_time - SYNC_OVERLAP)}
+    read_time = max([read_at for _, read_at in reads if read_at] + [cursor.read_time or datetime.min])
+    if read_time == datetime.min:
+        read_time = ph_time()
+    read_seen = {alert_id for alert_id, read_at in reads if read_at and read_at >= read_time - SYNC_OVERLAP}
+
+    next_cursor = SyncCursor(alert_time, frozenset(seen), read_time, frozenset(read_seen))
+    return new_items, read_ids, encode_sync_cursor(next_cursor)
+
+def inbox_etag(user_id, *variant):
+    """
+    ETag for a farmer's inbox: changes when an alert arrives, is read or is deleted.
+    `variant` holds the request options that shape the response.
+    """
+    total, max_id, unread, max_read_at = db.session.query(
+        func.count(AlertReceipt.alert_id), func.max(AlertReceipt.alert_id),
+        func.sum(case((AlertReceipt.is_read == False, 1), else_=0)), func.max(AlertReceipt.read_at)
+    ).filter(AlertReceipt.user_id == user_id).one()
+    state = json.dumps([user_id, total, max_id, unread or 0, str(max_read_at), *variant])
+    return 'inbox-' + hashlib.sha1(state.encode()).hexdigest()[:20]
+
+def get_stream_alerts(user_id, is_admin, after=None, ids=None, limit=100):
+    """
+    Alerts for the notification stream as (Alert, is_read) pairs, oldest first: those
+    with id > after (resuming from Last-Event-ID) or the given ids. Admins and
+    developers get every alert, farmers only their own.
+    """
+    if is_admin:
+        query = db.session.query(Alert, literal(False))
+    else:
+        query = db.session.query(Alert, AlertReceipt.is_read)\
+            .join(AlertReceipt, AlertReceipt.alert_id == Alert.id)\
+            .filter(AlertReceipt.user_id == user_id)
+    if after is not None:
+        query = query.filter(Alert.id > after)
+    if ids is not None:
+        query = query.filter(Alert.id.in_(ids))
+    return query.options(joinedload(Alert.from_user)).order_by(Alert.id).limit(limit).all()
+
+def inbox_item_json(alert, is_read):
+    return {
+        'id': alert.id,
+        'message': alert.message,
+        'level': alert.level,
+        'timestamp': alert.timestamp.strftime('%Y-%m-%d %H:%M'),
+        'is_read': is_read,
+        'from_user': alert.from_user.full_name if alert.from_user else "System"
+    }
@@ -0,0 +1,766 @@
+"""
+Dashboard analytics shared by the admin, developer and farmer drill-down views.
+
+Results are plain dataclasses (no ORM objects), so they can be memoized between
+requests in the result cache (cache.py), which can be shared by every server worker.
+Entries are keyed on the view's timeframe/filters or farmer and expire after
+RESULT_CACHE_TTL seconds. Ingest and delete paths call invalidate_on_commit(user_id),
+and alert changes invalidate_notifications_on_commit(); the affected entries are
+dropped in every worker once the transaction commits.
+
+The same transactions bump an IngestWatermark row, so every worker can tell whether
+the data changed since a given version. /api/heatmap uses it for ETag/Last-Modified.
+The watermark is split over WATERMARK_SHARDS rows picked by farmer, so concurrent
+uploads from different farmers don't queue on one row lock (PostgreSQL); readers
+add the shard versions up.
+"""
+import math
+import json
+import base64
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import event, func, select, case, union_all, literal, null, and_, or_
+from sqlalchemy.orm import aliased
+from db_config import RoutingSession
+from models import db, ph_time, User, DetectionRecord, CountingRecord, CountItem, Alert, AlertReceipt, IngestWatermark, DailyRollup
+from tallies import upsert_insert, as_date
+from cache import result_cache
+from utils import MIXED_COUNT_LABEL
+
+RECORDS_TAG = 'records' # Cache tag of results computed from records/farmers ('records:<user_id>' for one farmer)
+NOTIFICATIONS_TAG = 'notifications'
+WATERMARK = 'records'
+WATERMARK_SHARDS = 16
+ROLLING_TIMEFRAMES = {'weekly': 7, 'monthly': 30, 'past3ds': 3} # name -> days back from now
+CLUSTER_MAX_ZOOM = 15 # From this map zoom up every farm is its own marker
+CLUSTER_CELL_PX = 60 # Grid cell size on screen below that zoom
+
+# --- Result types ---
+@dataclass(frozen=True)
+class Timeframe:
+    name: str # daily, weekly, monthly, past3ds, custom
+    start: datetime
+    end: Optional[datetime] # Exclusive; only set for custom ranges
+    display: str
+    start_param: str = ''
+    end_param: str = ''
+
+    @property
+    def key(self):
+        # Rolling windows are keyed by name only; the cache TTL bounds how far they drift
+        return (self.name, self.start_param, self.end_param)
+
+    @property
+    def rolling(self):
+        return self.end is None and self.name in ROLLING_TIMEFRAMES
+
+@dataclass(frozen=True)
+class ChartSeries:
+    labels: list
+    counts: list
+
+@dataclass(frozen=True)
+class HeatmapMarker:
+    lat: float
+    lng: float
+    name: str
+    color: str
+    pests: int
+    beneficials: int
+    farms: int = 1 # > 1 for a cluster
+
+@dataclass(frozen=True)
+class LogUser:
+    id: int
+    full_name: str
+    municipality: str
+    street_barangay: str
+
+@dataclass(frozen=True)
+class LogEntry:
+    type: str # Identify, Count
+    id: int
+    timestamp: datetime
+    user: Optional[LogUser]
+    insect_name: str
+    is_beneficial: Optional[bool] # None for unreadable (Mixed Count) breakdowns
+    count_val: int
+    confidence: Optional[float]
+    image_file: str
+
+@dataclass(frozen=True)
+class ChartData:
+    granularity: str # day, week, month
+    start: Optional[date] # First and last day covered (inclusive)
+    end: Optional[date]
+    trend: ChartSeries # One point per bucket, empty buckets included
+    insects: ChartSeries # Totals over the range, largest first
+
+@dataclass
+class DashboardData:
+    unique_insects: list
+
+    def template_context(self):
+        return {
+            'unique_insects': self.unique_insects,
+        }
+
+@dataclass(frozen=True)
+class AdminAlert:
+    # One row of the admin alert log
+    id: int
+    message: str
+    level: str
+    timestamp: str # '%Y-%m-%d %H:%M'
+    is_read: bool # Every recipient has read it
+    from_user: str
+    recipient_name: str
+
+@dataclass(frozen=True)
+class AlertPage:
+    alerts: list # AdminAlert
+    next_cursor: Optional[str] # None on the last page
+    total: int # Alerts matching the filters over the whole history
+
+@dataclass
+class FarmerStats:
+    insect_breakdown: dict = field(default_factory=dict)
+    pests: int = 0
+    beneficials: int = 0
+
+    def template_context(self):
+        return {
+            'insect_breakdown': self.insect_breakdown,
+            'pests': self.pests,
+            'beneficials': self.beneficials,
+        }
+
+
+# --- Memoization ---
+def memoized(kind, key, user_id, compute, tag=RECORDS_TAG):
+    """
+    Returns the cached result for (kind, key) or computes and stores it.
+    user_id tags farmer-specific entries (None = covers all farmers).
+    """
+    tags = (f"{tag}:{user_id}",) if user_id is not None else (tag,)
+    return result_cache.get_or_compute(repr((kind, key)), tags, compute)
+
+def invalidate_analytics(user_ids=None):
+    """
+    Drops cached results that include the given farmers (all entries if None).
+    """
+    if user_ids is None:
+        result_cache.invalidate()
+        return
+    result_cache.invalidate({RECORDS_TAG} | {f"{RECORDS_TAG}:{user_id}" for user_id in user_ids})
+
+def invalidate_on_commit(user_id):
+    """
+    Marks a farmer's data as changed; their cached results are dropped when the
+    current transaction commits (nothing happens on rollback).
+    """
+    db.session.info.setdefault('analytics_changed', set()).add(int(user_id))
+
+def invalidate_notifications_on_commit():
+    """
+    Marks alerts as changed (sent, read or deleted); the cached admin alert log is
+    dropped when the current transaction commits.
+    """
+    db.session.info['notifications_changed'] = True
+
+def _before_commit(session):
+    changed = session.info.get('analytics_changed')
+    if changed:
+        bump_watermark(session, changed)
+
+def _after_commit(session):
+    changed = session.info.pop('analytics_changed', None)
+    if changed:
+        invalidate_analytics(changed)
+    if session.info.pop('notifications_changed', None):
+        result_cache.invalidate({NOTIFICATIONS_TAG})
+
+def _after_rollback(session):
+    session.info.pop('analytics_changed', None)
+    session.info.pop('notifications_changed', None)
+
+event.listen(RoutingSession, 'before_commit', _before_commit)
+event.listen(RoutingSession, 'after_commit', _after_commit)
+event.listen(RoutingSession, 'after_rollback', _after_rollback)
+
+
+# --- Ingest watermark ---
+def watermark_shard(user_id):
+    return f"{WATERMARK}:{int(user_id) % WATERMARK_SHARDS}"
+
+def bump_watermark(session, user_ids):
+    """
+    Bumps the watermark shard of every changed farmer, in a fixed order so two
+    transactions touching the same shards can't deadlock.
+    """
+    now = ph_time()
+    for name in sorted({watermark_shard(user_id) for user_id in user_ids}):
+        stmt = upsert_insert(IngestWatermark).values(name=name, version=1, updated_at=now)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'version': IngestWatermark.version + 1, 'updated_at': stmt.excluded.updated_at}
+        ))
+
+def get_watermark():
+    """
+    (version, updated_at) of the last committed record/farmer change; (0, None) before the first one.
+    The version is the sum over the shards (and the pre-shard 'records' row), so it only grows.
+    """
+    version, updated_at = db.session.query(func.sum(IngestWatermark.version), func.max(IngestWatermark.updated_at))\
+        .filter(or_(IngestWatermark.name == WATERMARK, IngestWatermark.name.like(f"{WATERMARK}:%"))).one()
+    return int(version or 0), updated_at
+
+
+# --- Timeframes ---
+def parse_timeframe(args, now=None):
+    """
+    Reads timeframe/start_date/end_date from the query string. Custom end dates are
+    inclusive (the whole day is covered); bad or missing dates fall back to today.
+    """
+    name = args.get('timeframe', 'daily')
+    # Rolling windows move once a minute, so repeated requests can be answered with a 304
+    now = (now or ph_time()).replace(second=0, microsecond=0)
+    today = now.replace(hour=0, minute=0)
+
+    if name == 'weekly':
+        return Timeframe(name, now - timedelta(days=7), None, "Last 7 Days")
+    if name == 'monthly':
+        return Timeframe(name, now - timedelta(days=30), None, "Last 30 Days")
+    if name == 'past3ds':
+        return Timeframe(name, now - timedelta(days=3), None, "Past 3 Days")
+    if name == 'custom':
+        s_str = args.get('start_date', '')
+        e_str = args.get('end_date', '')
+        if not (s_str and e_str):
+            return Timeframe(name, today, None, "Today")
+        try:
+            start = datetime.strptime(s_str, '%Y-%m-%d')
+            end = datetime.strptime(e_str, '%Y-%m-%d') + timedelta(days=1)
+        except ValueError:
+            return Timeframe(name, today, None, "Invalid Date Range (Showing Today)")
+        return Timeframe(name, start, end, f"{s_str} to {e_str}", s_str, e_str)
+    return Timeframe('daily', today, None, "Today")
+
+
+# --- Heatmap ---
+def heatmap_color(pests, beneficials):
+    if pests == 0 and beneficials == 0:
+        return 'gray'
+    if beneficials > pests:
+        return 'green'
+    # Pests are dominant or equal
+    if pests > 15:
+        return 'red'
+    if pests > 5: # 6 to 15
+        return 'orange'
+    return 'yellow' # 1 to 5
+
+def day_start(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def raw_activity(start_date, end_date):
+    """
+    Per-user pest/beneficial sums straight from the records, for partial days.
+    """
+    d_query = select(
+        DetectionRecord.user_id.label('user_id'),
+        func.sum(case((DetectionRecord.is_beneficial == True, 0), else_=1)).label('pests'),
+        func.sum(case((DetectionRecord.is_beneficial == True, 1), else_=0)).label('beneficials')
+    ).where(DetectionRecord.timestamp >= start_date, DetectionRecord.timestamp < end_date)\
+     .group_by(DetectionRecord.user_id)
+    c_query = select(
+        CountingRecord.user_id.label('user_id'),
+        func.sum(case((CountItem.is_beneficial == True, 0), else_=CountItem.count)).label('pests'),
+        func.sum(case((CountItem.is_beneficial == True, CountItem.count), else_=0)).label('beneficials')
+    ).join(CountItem, CountItem.counting_record_id == CountingRecord.id)\
+     .where(CountingRecord.timestamp >= start_date, CountingRecord.timestamp < end_date)\
+     .group_by(CountingRecord.user_id)
+    return [d_query, c_query]
+
+def get_heatmap_data(start_date, end_date=None):
+    """
+    Pest/beneficial totals per farm for [start_date, end_date) as map markers.
+    Whole days are summed from DailyRollup; only a window edge that falls mid-day
+    (the rolling timeframes) reads the records. One query, joined to the users.
+    """
+    full_from = start_date.date() if start_date == day_start(start_date) else start_date.date() + timedelta(days=1)
+    parts = []
+    if start_date != day_start(start_date):
+        first_end = day_start(start_date) + timedelta(days=1)
+        parts += raw_activity(start_date, min(first_end, end_date) if end_date else first_end)
+    if end_date and end_date != day_start(end_date) and end_date.date() >= full_from:
+        parts += raw_activity(max(day_start(end_date), start_date), end_date)
+
+    r_query = select(
+        DailyRollup.user_id.label('user_id'),
+        func.sum(DailyRollup.pests).label('pests'),
+        func.sum(DailyRollup.beneficials).label('beneficials')
+    ).where(DailyRollup.day >= full_from)
+    if end_date:
+        r_query = r_query.where(DailyRollup.day < end_date.date())
+    parts.append(r_query.group_by(DailyRollup.user_id))
+
+    activity = union_all(*parts).subquery() if len(parts) > 1 else parts[0].subquery()
+    totals = select(
+        activity.c.user_id,
+        func.sum(activity.c.pests).label('pests'),
+        func.sum(activity.c.beneficials).label('beneficials')
+    ).group_by(activity.c.user_id).subquery()
+
+    rows = db.session.query(
+        User.latitude, User.longitude, User.full_name,
+        func.coalesce(totals.c.pests, 0), func.coalesce(totals.c.beneficials, 0)
+    ).outerjoin(totals, totals.c.user_id == User.id)\
+     .filter(User.latitude.isnot(None), User.longitude.isnot(None))\
+     .order_by(User.id).all()
+
+    markers = []
+    for lat, lng, name, pests, beneficials in rows:
+        if not (lat and lng):
+            continue
+        pests = int(pests)
+        beneficials = int(beneficials)
+        markers.append(HeatmapMarker(lat, lng, name, heatmap_color(pests, beneficials), pests, beneficials))
+    return markers
+
+def get_heatmap(timeframe, version):
+    """
+    get_heatmap_data for a timeframe, memoized per watermark version so workers never
+    serve markers older than the version they put in the ETag.
+    """
+    return memoized('heatmap', (timeframe.start, timeframe.end, version), None,
+                    lambda: get_heatmap_data(timeframe.start, timeframe.end))
+
+def parse_map_view(args):
+    """
+    (zoom, bbox) from ?zoom=&bbox=south,west,north,east. Without zoom the map wants
+    every farm, (None, None). Raises ValueError on bad input.
+    """
+    zoom = args.get('zoom')
+    if zoom in (None, ''):
+        return None, None
+    zoom = int(zoom)
+    if not 0 <= zoom <= 22:
+        raise ValueError("zoom must be between 0 and 22")
+    bbox = args.get('bbox')
+    if bbox:
+        bbox = tuple(float(v) for v in bbox.split(','))
+        if len(bbox) != 4:
+            raise ValueError("bbox must be south,west,north,east")
+    return zoom, bbox or None
+
+def dominant_color(colors):
+    """
+    Most common color among a cluster's active farms (ties go to the more severe one);
+    gray only when none of them had activity.
+    """
+    active = [c for c in colors if c != 'gray']
+    if not active:
+        return 'gray'
+    severity = ['red', 'orange', 'yellow', 'green']
+    return max(set(active), key=lambda c: (active.count(c), -severity.index(c)))
+
+def cluster_markers(markers, zoom, bbox=None):
+    """
+    Markers inside bbox, merged per grid cell (about CLUSTER_CELL_PX on screen) below
+    CLUSTER_MAX_ZOOM. Clusters sit at their farms' centroid with summed counts, so the
+    payload depends on the viewport, not on how many farmers there are.
+    """
+    if bbox:
+        south, west, north, east = bbox
+        markers = [m for m in markers if south <= m.lat <= north and west <= m.lng <= east]
+    if zoom >= CLUSTER_MAX_ZOOM:
+        return markers
+
+    cell = 360.0 / (256 * 2 ** zoom) * CLUSTER_CELL_PX # degrees
+    cells = {}
+    for m in markers:
+        cells.setdefault((math.floor(m.lat / cell), math.floor(m.lng / cell)), []).append(m)
+
+    clustered = []
+    for members in cells.values():
+        if len(members) == 1:
+            clustered.append(members[0])
+            continue
+        clustered.append(HeatmapMarker(
+            lat=sum(m.lat for m in members) / len(members),
+            lng=sum(m.lng for m in members) / len(members),
+            name=f"{len(members)} farms",
+            color=dominant_color([m.color for m in members]),
+            pests=sum(m.pests for m in members),
+            beneficials=sum(m.beneficials for m in members),
+            farms=len(members)
+        ))
+    return clustered
+
+def heatmap_validators(timeframe, version, updated_at, zoom=None, bbox=None):
+    """
+    (ETag, Last-Modified as UTC) for a heatmap response. The markers only change when
+    the watermark moves or, for rolling windows, when the window slides (every minute).
+    Clusters also depend on the map view, so zoom and bbox are part of the ETag.
+    """
+    end = f"{timeframe.end:%Y%m%d}" if timeframe.end else ''
+    view = '' if zoom is None else f"z{zoom}" + (':' + ','.join(f"{v:.6f}" for v in bbox) if bbox else '')
+    etag = f"heatmap-{version}-{timeframe.name}-{timeframe.start:%Y%m%d%H%M}-{end}-{view}"
+
+    if timeframe.rolling:
+        moved_at = timeframe.start + timedelta(days=ROLLING_TIMEFRAMES[timeframe.name])
+    else:
+        moved_at = min(timeframe.start, ph_time()) # Today's window starts at midnight
+    changed_at = max(updated_at, moved_at) if updated_at else moved_at
+    # Timestamps are PH local time (UTC+8)
+    last_modified = (changed_at - timedelta(hours=8)).replace(tzinfo=timezone.utc)
+    return etag, last_modified
+
+
+# --- Report logs ---
+LOG_PAGE_SIZE = 50
+MAX_LOG_PAGE_SIZE = 200
+TIMELINE_PAGE_SIZE = 24 # Cards on the farmer dashboard (rows of 4)
+LOG_TYPES = ('Identify', 'Count')
+
+@dataclass(frozen=True)
+class LogFilters:
+    insect: str = ''
+    barangay: str = ''
+    type: str = '' # Identify, Count or '' for both
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None # Exclusive
+    search: str = ''
+    user_id: Optional[int] = None # One farmer's records (timeline)
+
+def parse_log_filters(args):
+    """
+    Reads insect/barangay/type/date/start_date/end_date/q from the query string.
+    'all' means no filter, like the dashboard dropdowns. Raises ValueError on bad input.
+    """
+    def value(name):
+        v = (args.get(name) or '').strip()
+        return '' if v.lower() == 'all' else v
+
+    log_type = value('type')
+    if log_type and log_type not in LOG_TYPES:
+        raise ValueError(f"type must be one of {', '.join(LOG_TYPES)}")
+
+    date_from = date_to = None
+    day = value('date')
+    if day:
+        date_from = datetime.strptime(day, '%Y-%m-%d')
+        date_to = date_from + timedelta(days=1)
+    else:
+        if value('start_date'):
+            date_from = datetime.strptime(value('start_date'), '%Y-%m-%d')
+        if value('end_date'):
+            date_to = datetime.strptime(value('end_date'), '%Y-%m-%d') + timedelta(days=1) # Inclusive
+
+    return LogFilters(value('insect'), value('barangay'), log_type, date_from, date_to, value('q'))
+
+def encode_log_cursor(timestamp, log_type, row_id):
+    raw = json.dumps([timestamp.isoformat(), log_type, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_log_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, log_type, row_id = json.loads(raw)
+        if log_type not in LOG_TYPES:
+            raise ValueError
+        return datetime.fromisoformat(timestamp), log_type, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+def log_branch(log_type, filters, cursor, limit):
+    """
+    One side of the log UNION: detections (one row each) or count items (one row per
+    insect, id = the counting record). Filters and the keyset condition are applied
+    here so each side can walk its (timestamp, id) index and stop after `limit` rows.
+    """
+    if log_type == 'Identify':
+        timestamp, row_id = DetectionRecord.timestamp, DetectionRecord.id
+        query = select(
+            timestamp.label('timestamp'), literal(log_type).label('type'), row_id.label('row_id'),
+            DetectionRecord.id.label('id'), DetectionRecord.user_id.label('user_id'),
+            DetectionRecord.insect_name.label('insect_name'), DetectionRecord.is_beneficial.label('is_beneficial'),
+            literal(1).label('count_val'), DetectionRecord.confidence.label('confidence'),
+            DetectionRecord.image_file.label('image_file')
+        ).select_from(DetectionRecord).outerjoin(User, User.id == DetectionRecord.user_id)
+        insect = DetectionRecord.insect_name
+    else:
+        timestamp, row_id = CountingRecord.timestamp, CountItem.id
+        query = select(
+            timestamp.label('timestamp'), literal(log_type).label('type'), row_id.label('row_id'),
+            CountingRecord.id.label('id'), CountingRecord.user_id.label('user_id'),
+            CountItem.insect_name.label('insect_name'), CountItem.is_beneficial.label('is_beneficial'),
+            CountItem.count.label('count_val'), null().label('confidence'),
+            CountingRecord.image_file.label('image_file')
+        ).select_from(CountingRecord).join(CountItem, CountItem.counting_record_id == CountingRecord.id)\
+         .outerjoin(User, User.id == CountingRecord.user_id)
+        insect = CountItem.insect_name
+
+    if filters.user_id is not None:
+        query = query.where((DetectionRecord.user_id if log_type == 'Identify' else CountingRecord.user_id) == filters.user_id)
+    if filters.insect:
+        query = query.where(insect == filters.insect)
+    if filters.barangay:
+        query = query.where(User.street_barangay.ilike(f"%{filters.barangay}%"))
+    if filters.date_from:
+        query = query.where(timestamp >= filters.date_from)
+    if filters.date_to:
+        query = query.where(timestamp < filters.date_to)
+    if filters.search:
+        pattern = f"%{filters.search}%"
+        query = query.where(or_(insect.ilike(pattern), User.full_name.ilike(pattern),
+                                User.street_barangay.ilike(pattern), User.municipality.ilike(pattern)))
+
+    if cursor:
+        # Rows sort by (timestamp, type, row_id) descending; keep those after the cursor
+        c_timestamp, c_type, c_row_id = cursor
+        if log_type == c_type:
+            query = query.where(or_(timestamp < c_timestamp, and_(timestamp == c_timestamp, row_id < c_row_id)))
+        elif log_type < c_type:
+            query = query.where(timestamp <= c_timestamp)
+        else:
+            query = query.where(timestamp < c_timestamp)
+
+    return query.order_by(timestamp.desc(), row_id.desc()).limit(limit).subquery()
+
+def get_log_page(filters, cursor=None, limit=LOG_PAGE_SIZE):
+    """
+    One page of report logs, newest first. Returns (entries, next_cursor); next_cursor
+    is None on the last page. Only `limit` + 1 rows are read per record type.
+    """
+    cursor = decode_log_cursor(cursor) if cursor else None
+    branches = [log_branch(t, filters, cursor, limit + 1) for t in LOG_TYPES
+                if not filters.type or filters.type == t]
+    logs = union_all(*[select(b) for b in branches]).subquery() if len(branches) > 1 else branches[0]
+
+    rows = db.session.query(logs, User.full_name, User.municipality, User.street_barangay)\
+        .outerjoin(User, User.id == logs.c.user_id)\
+        .order_by(logs.c.timestamp.desc(), logs.c.type.desc(), logs.c.row_id.desc())\
+        .limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_log_cursor(last.timestamp, last.type, last.row_id)
+
+    entries = [LogEntry(
+        row.type, row.id, row.timestamp,
+        LogUser(row.user_id, row.full_name, row.municipality, row.street_barangay) if row.full_name is not None else None,
+        row.insect_name,
+        None if row.type == 'Count' and row.insect_name == MIXED_COUNT_LABEL else row.is_beneficial,
+        row.count_val, row.confidence, row.image_file
+    ) for row in rows]
+    return entries, next_cursor
+
+def get_insect_names():
+    """
+    Every insect name seen in detections or counts, for the log filter dropdown.
+    """
+    return [name for (name,) in db.session.query(DailyRollup.insect_name).distinct().order_by(DailyRollup.insect_name)]
+
+
+# --- Admin/developer dashboard ---
+def get_dashboard_data():
+    """
+    Filter options for the admin and developer views. The heatmap (/api/heatmap),
+    report logs (/api/logs) and charts (/api/charts) are fetched by the page.
+    """
+    def compute():
+        return DashboardData(unique_insects=get_insect_names())
+    return memoized('dashboard', 'all', None, compute)
+
+ALERT_PAGE_SIZE = 10
+MAX_ALERT_PAGE_SIZE = 100
+
+def encode_alert_cursor(timestamp, alert_id):
+    raw = json.dumps([timestamp.isoformat(), alert_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_alert_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, alert_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(alert_id)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+def get_admin_alert_page(day=None, severity=None, cursor=None, limit=ALERT_PAGE_SIZE, page=None):
+    """
+    One page of the admin/developer alert log, newest first, optionally on `day`
+    ('YYYY-MM-DD'; anything else is ignored, as the log always did) at `severity`.
+    Returns AlertPage; pass its next_cursor back for the next page. Older clients
+    can ask for a page number instead (an OFFSET, used only without a cursor).
+    Raises ValueError on a bad cursor.
+    """
+    try:
+        day = datetime.strptime(day, '%Y-%m-%d') if day else None
+    except ValueError:
+        day = None
+    after = decode_alert_cursor(cursor) if cursor else None
+    offset = (page - 1) * limit if page and page > 1 and not after else 0
+
+    def compute():
+        filters = []
+        if day:
+            filters += [Alert.timestamp >= day, Alert.timestamp < day + timedelta(days=1)]
+        if severity:
+            filters.append(Alert.level == severity)
+
+        # The page's alerts come off the (timestamp, id) index; only their receipts are grouped
+        page_query = select(Alert.id, Alert.timestamp, Alert.message, Alert.level, Alert.from_user_id).where(*filters)
+        if after:
+            page_query = page_query.where(or_(Alert.timestamp < after[0],
+                                              and_(Alert.timestamp == after[0], Alert.id < after[1])))
+        page = page_query.order_by(Alert.timestamp.desc(), Alert.id.desc()).offset(offset).limit(limit + 1).subquery()
+
+        sender = aliased(User)
+        recipient = aliased(User)
+        rows = db.session.execute(
+            select(page.c.id, page.c.timestamp, page.c.message, page.c.level, sender.full_name.label('from_name'),
+                   func.count(AlertReceipt.user_id).label('recipients'),
+                   func.sum(case((AlertReceipt.is_read == False, 1), else_=0)).label('unread'),
+                   func.max(recipient.full_name).label('recipient_name')) # The name when there is one recipient
+            .select_from(page)
+            .outerjoin(sender, sender.id == page.c.from_user_id)
+            .outerjoin(AlertReceipt, AlertReceipt.alert_id == page.c.id)
+            .outerjoin(recipient, recipient.id == AlertReceipt.user_id)
+            .group_by(page.c.id, page.c.timestamp, page.c.message, page.c.level, sender.full_name)
+            .order_by(page.c.timestamp.desc(), page.c.id.desc())
+        ).all()
+
+        entries = []
+        for row in rows[:limit]:
+            if row.recipients > 1:
+                to_display = f"All Farmers ({row.recipients} recipients)"
+            else:
+                to_display = (row.recipient_name if row.recipients else None) or "Unknown"
+            entries.append(AdminAlert(row.id, row.message, row.level, row.timestamp.strftime('%Y-%m-%d %H:%M'),
+                                      not row.unread, row.from_name or "System", to_display))
+        next_cursor = encode_alert_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+        total = db.session.query(func.count(Alert.id)).filter(*filters).scalar()
+        return AlertPage(entries, next_cursor, total)
+    return memoized('admin_alerts', (day, severity or None, after, offset, limit), None, compute, tag=NOTIFICATIONS_TAG)
+
+
+# --- Charts ---
+CHART_MAX_POINTS = 90
+CHART_GRANULARITIES = ('day', 'week', 'month')
+
+def parse_chart_request(args):
+    """
+    (start, end, granularity) from ?start_date=&end_date= (inclusive, default: all
+    history) and ?granularity=auto|day|week|month. Raises ValueError on bad input.
+    """
+    start = args.get('start_date')
+    end = args.get('end_date')
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    if start and end and start > end:
+        raise ValueError("start_date is after end_date")
+    granularity = args.get('granularity') or 'auto'
+    if granularity != 'auto' and granularity not in CHART_GRANULARITIES:
+        raise ValueError(f"granularity must be auto, {', '.join(CHART_GRANULARITIES)}")
+    return start, end, granularity
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday()) # Weeks start on Monday
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_bucket(day, granularity):
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    if granularity == 'month':
+        return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=1)
+
+def pick_granularity(start, end):
+    """
+    Finest granularity that keeps the trend at or below CHART_MAX_POINTS points.
+    """
+    span = (end - start).days + 1
+    if span <= CHART_MAX_POINTS:
+        return 'day'
+    if math.ceil(span / 7) <= CHART_MAX_POINTS:
+        return 'week'
+    return 'month'
+
+def get_chart_data(user_id=None, start=None, end=None, granularity='auto'):
+    """
+    Activity trend and per-insect totals for one farmer (or everyone if user_id is
+    None), summed from DailyRollup: one row per day goes in, at most about
+    CHART_MAX_POINTS buckets come out when granularity is 'auto'.
+    """
+    def compute():
+        total = func.sum(DailyRollup.pests + DailyRollup.beneficials)
+        per_day = db.session.query(DailyRollup.day, total)
+        per_insect = db.session.query(DailyRollup.insect_name, total)
+        conditions = []
+        if user_id is not None:
+            conditions.append(DailyRollup.user_id == user_id)
+        if start:
+            conditions.append(DailyRollup.day >= start)
+        if end:
+            conditions.append(DailyRollup.day <= end)
+        days = {as_date(day): int(count or 0) for day, count in
+                per_day.filter(*conditions).group_by(DailyRollup.day)}
+        insects = per_insect.filter(*conditions).group_by(DailyRollup.insect_name)\
+            .order_by(total.desc(), DailyRollup.insect_name).all()
+
+        first = start or (min(days) if days else None)
+        last = end or (max(days) if days else None)
+        if not (first and last):
+            return ChartData('day' if granularity == 'auto' else granularity, first, last,
+                             ChartSeries([], []), ChartSeries([], []))
+
+        chosen = pick_granularity(first, last) if granularity == 'auto' else granularity
+        buckets = {}
+        bucket = bucket_start(first, chosen)
+        while bucket <= last:
+            buckets[bucket] = 0
+            bucket = next_bucket(bucket, chosen)
+        for day, count in days.items():
+            buckets[bucket_start(day, chosen)] += count
+
+        label_format = '%Y-%m' if chosen == 'month' else '%Y-%m-%d'
+        return ChartData(
+            granularity=chosen, start=first, end=last,
+            trend=ChartSeries([b.strftime(label_format) for b in buckets], list(buckets.values())),
+            insects=ChartSeries([name for name, _ in insects], [int(count or 0) for _, count in insects])
+        )
+    return memoized('charts', (user_id, start, end, granularity), user_id, compute)
+
+
+# --- Farmer dashboard / drill-down ---
+def get_timeline_page(user_id, cursor=None, limit=TIMELINE_PAGE_SIZE):
+    """
+    One page of a farmer's Identify/Count timeline, newest first, as (entries, next_cursor).
+    Same UNION and cursor as the report logs, restricted to the farmer's records.
+    """
+    return get_log_page(LogFilters(user_id=user_id), cursor, limit)
+
+def get_farmer_stats(user_id):
+    """
+    A farmer's per-insect totals and pest/beneficial sums, from DailyRollup.
+    Their charts come from get_chart_data.
+    """
+    def compute():
+        rows = db.session.query(DailyRollup.insect_name, func.sum(DailyRollup.pests), func.sum(DailyRollup.beneficials))\
+            .filter(DailyRollup.user_id == user_id)\
+            .group_by(DailyRollup.insect_name).order_by(DailyRollup.insect_name).all()
+        return FarmerStats(
+            insect_breakdown={name: int(pests or 0) + int(beneficials or 0) for name, pests, beneficials in rows},
+            pests=sum(int(pests or 0) for _, pests, _ in rows),
+            beneficials=sum(int(beneficials or 0) for _, _, beneficials in rows)
+        )
+    return memoized('farmer_stats', user_id, user_id, compute)
@@ -3,23 +3,60 @@ import json
 import random
 import io
 import csv
+from dataclasses import asdict
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_from_directory, make_response
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, flash, send_from_directory, make_response
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.http import is_resource_modified
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from flask_cors import CORS
-from models import db, User, DetectionRecord, CountingRecord, Notification, Recommendation
-from utils import get_insect_status, is_beneficial
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from db_config import configure_database, replica_reads
+from models import db, ph_time, User, DetectionRecord, CountingRecord, CountItem, Alert, AlertReceipt, Recommendation, IdempotencyKey, ChunkedUpload
+from utils import get_insect_status, is_beneficial, parse_breakdown, MIXED_COUNT_LABEL
+from storage_backends import init_storage
+from storage import store_image, store_local_file, file_sha256, release_images, discard_files, image_url
+from uploads import create_upload, upload_status, append_chunk, reset_upload, part_path, MAX_UPLOAD_SIZE
+from images import enqueue_variants
+from tasks import task_queue
+from cache import result_cache
+from alerts import create_alert, delete_alerts, mark_read, get_inbox, get_inbox_changes, inbox_item_json, inbox_etag
+from alert_stream import alert_stream
+from push import push_sender
+from tallies import add_to_tally, remove_from_tally, pests_on, get_counters, remove_farmer_from_counters
+from analytics import parse_timeframe, get_dashboard_data, get_timeline_page, get_farmer_stats, invalidate_on_commit
+from analytics import parse_log_filters, get_log_page, LOG_PAGE_SIZE, MAX_LOG_PAGE_SIZE, TIMELINE_PAGE_SIZE
+from analytics import get_watermark, get_heatmap, heatmap_validators, parse_map_view, cluster_markers
+from analytics import parse_chart_request, get_chart_data, invalidate_notifications_on_commit
+from analytics import get_admin_alert_page, ALERT_PAGE_SIZE, MAX_ALERT_PAGE_SIZE
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'spim_secret_key_change_in_production' # TODO: Change this in production!
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///spim.db'
+configure_database(app) # SPIM_DATABASE_URL etc., see db_config.py
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
 app.config['RECOMMENDATION_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads', 'recommendations')
+app.config['TASK_QUEUE'] = os.environ.get('SPIM_TASK_QUEUE', 'thread') # thread, db (run worker.py) or inline
+# Dashboard result cache: memory (per worker) or sqlite (shared by all workers on the host), see cache.py
+app.config['RESULT_CACHE'] = os.environ.get('SPIM_RESULT_CACHE', 'sqlite')
+if os.environ.get('SPIM_RESULT_CACHE_PATH'):
+    app.config['RESULT_CACHE_PATH'] = os.environ['SPIM_RESULT_CACHE_PATH']
+# Notification stream: seconds between heartbeats on idle streams, see alert_stream.py
+app.config['ALERT_STREAM_HEARTBEAT'] = int(os.environ.get('SPIM_ALERT_STREAM_HEARTBEAT', 15))
+# Push notifications: firebase or fake (offline testing), multicast chunks in flight, see push.py
+app.config['FCM_BACKEND'] = os.environ.get('SPIM_FCM_BACKEND', 'firebase')
+app.config['FCM_MAX_WORKERS'] = int(os.environ.get('SPIM_FCM_MAX_WORKERS', 2))
+
+# Image storage: local folders above (default) or an S3-compatible bucket, see storage_backends.py
+app.config['STORAGE_BACKEND'] = os.environ.get('SPIM_STORAGE_BACKEND', 'local')
+app.config['S3_BUCKET'] = os.environ.get('SPIM_S3_BUCKET')
+app.config['S3_ENDPOINT_URL'] = os.environ.get('SPIM_S3_ENDPOINT_URL') # e.g. http://localhost:9000 for MinIO
+app.config['S3_REGION'] = os.environ.get('SPIM_S3_REGION')
+app.config['S3_PREFIX'] = os.environ.get('SPIM_S3_PREFIX', '')
+app.config['S3_PUBLIC_URL'] = os.environ.get('SPIM_S3_PUBLIC_URL') # Unset: serve with presigned URLs
 
 # CORS configuration for Android app
 CORS(app, supports_credentials=True)
@@ -35,6 +72,12 @@ if not os.path.exists(app.config['RECOMMENDATION_FOLDER']):
     os.makedirs(app.config['RECOMMENDATION_FOLDER'])
 
 db.init_app(app)
+task_queue.init_app(app)
+result_cache.init_app(app)
+alert_stream.init_app(app)
+push_sender.init_app(app)
+init_storage(app)
+app.add_template_global(image_url)
 
 # Initialize Firebase Admin SDK
 try:
@@ -101,6 +144,12 @@ NAIC_BARANGAY_COORDS = {
     "Timalan Concepcion": (14.3366, 120.7798)
 }
 
+# Max detections/counts accepted in one /api/sync/batch request
+MAX_BATCH_ITEMS = 500
+
+# Batch item type -> endpoint name its idempotency keys are shared with
+BATCH_ENDPOINTS = {'identify': 'sync_identify', 'count': 'sync_count'}
+
 # --- API Routes ---
 
 @app.route('/api/register', methods=['POST'])
@@ -152,6 +201,8 @@ def api_register():
         longitude=final_lng
     )
     db.session.add(new_user)
+    db.session.flush()
+    invalidate_on_commit(new_user.id) # New farm marker on the heatmap
     db.session.commit()
     return jsonify({"message": "User registered successfully", "latitude": final_lat, "longitude": final_lng}), 201
 
@@ -179,31 +230,30 @@ def sync_identify():
     insect_name = request.form.get('insect_name')
     confidence = request.form.get('confidence')
 
+    # Retries of an already committed upload replay the original response
+    key = get_idempotency_key()
+    entry = find_idempotency_key(key, 'sync_identify')
+    if entry:
+        return replay_idempotent_response(entry)
+
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
+    user = find_sync_user(user_id)
+    if not user:
+        return jsonify({"error": "Missing or unknown user_id"}), 400
     
     if file:
-        filename = secure_filename(f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Determine beneficial status
-        beneficial = is_beneficial(insect_name)
-
-        new_record = DetectionRecord(
-            user_id=user_id,
-            insect_name=insect_name,
-            confidence=float(confidence) if confidence else 0.0,
-            image_file=filename, # Store relative filename
-            is_beneficial=beneficial
-        )
-        db.session.add(new_record)
-        db.session.commit()
-        
-        # Check for infestation
-        user = User.query.get(user_id)
-        if user:
-            check_infestation_threshold(user_id, user.municipality)
+        image, is_new = store_image(file)
+        record = create_detection(user.id, insect_name, confidence, image.path)
+        entry = commit_with_idempotency_key(key, 'sync_identify', record, {"message": "Detection saved"},
+                                            new_files=[image.path] if is_new else [])
+        if entry:
+            return replay_idempotent_response(entry)
+        
+        # Thumbnails and infestation check run in the background
+        if is_new:
+            enqueue_variants(image.path)
+        enqueue_threshold_check(user_id)
             
         return jsonify({"message": "Detection saved"}), 201
     
@@ -220,32 +270,330 @@ def sync_count():
     total_count = request.form.get('total_count')
     breakdown = request.form.get('breakdown') # JSON String
 
+    # Retries of an already committed upload replay the original response
+    key = get_idempotency_key()
+    entry = find_idempotency_key(key, 'sync_count')
+    if entry:
+        return replay_idempotent_response(entry)
+
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
+    user = find_sync_user(user_id)
+    if not user:
+        return jsonify({"error": "Missing or unknown user_id"}), 400
     
     if file:
-        filename = secure_filename(f"count_{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        new_record = CountingRecord(
-            user_id=user_id,
-            total_count=int(total_count) if total_count else 0,
-            image_file=filename,
-            breakdown=breakdown 
-        )
-        db.session.add(new_record)
-        db.session.commit()
-
-        # Check for infestation
-        user = User.query.get(user_id)
-        if user:
-            check_infestation_threshold(user_id, user.municipality)
+        image, is_new = store_image(file)
+        record = create_count(user.id, total_count, breakdown, image.path)
+        entry = commit_with_idempotency_key(key, 'sync_count', record, {"message": "Count record saved"},
+                                            new_files=[image.path] if is_new else [])
+        if entry:
+            return replay_idempotent_response(entry)
+
+        # Thumbnails and infestation check run in the background
+        if is_new:
+            enqueue_variants(image.path)
+        enqueue_threshold_check(user_id)
 
         return jsonify({"message": "Count record saved"}), 201
 
     return jsonify({"error": "Failed to save"}), 500
 
+@app.route('/api/sync/batch', methods=['POST'])
+def sync_batch():
+    """
+    Offline queue upload: many detections and counts in one multipart request.
+    Form Fields:
+        user_id: Default owner for items that don't carry their own user_id
+        items: JSON array, e.g. [{"type": "identify", "client_id": "a1", "insect_name": "Aphids",
+               "confidence": 0.9, "image": "img_0"}, {"type": "count", "total_count": 5,
+               "breakdown": {"Aphids": 5}, "image": "img_1"}]
+        <image field>: One file part per item, named by the item's "image" key
+    All valid items are inserted in a single transaction and one background
+    infestation threshold check is queued per affected user afterwards.
+    Items may carry an "idempotency_key"; keys already used on this or the single
+    sync endpoints are reported as "duplicate" with the original record id.
+    """
+    try:
+        items = json.loads(request.form.get('items') or '')
+    except ValueError:
+        return jsonify({"error": "items must be a JSON array"}), 400
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty JSON array"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"Too many items (max {MAX_BATCH_ITEMS})"}), 400
+
+    default_user_id = request.form.get('user_id')
+
+    # One user lookup for the whole batch
+    user_ids = set()
+    for item in items:
+        if isinstance(item, dict):
+            user_ids.add(str(item.get('user_id') or default_user_id))
+    valid_ids = [int(uid) for uid in user_ids if uid.isdigit()]
+    users = {str(u.id): u for u in User.query.filter(User.id.in_(valid_ids)).all()} if valid_ids else {}
+
+    # Look up every idempotency key in the batch with one query per endpoint
+    keyed = {}
+    for item in items:
+        if isinstance(item, dict) and item.get('idempotency_key') and item.get('type') in BATCH_ENDPOINTS:
+            keyed.setdefault(BATCH_ENDPOINTS[item['type']], set()).add(str(item['idempotency_key'])[:100])
+    used_keys = {}
+    for endpoint, keys in keyed.items():
+        for entry in IdempotencyKey.query.filter(IdempotencyKey.endpoint == endpoint, IdempotencyKey.key.in_(keys)).all():
+            used_keys[(endpoint, entry.key)] = entry.record_id
+
+    results = []
+    created = []  # (result, record, user, key), ids are known after flush
+    batch_keys = {}  # key -> record created earlier in this batch
+    repeated = []  # (result, record) for keys repeated within this batch
+    new_files = []  # Files first written by this request, removed again on rollback
+
+    for index, item in enumerate(items):
+        result = {"index": index}
+        results.append(result)
+
+        if not isinstance(item, dict):
+            result.update({"status": "error", "error": "Item must be an object"})
+            continue
+
+        result["client_id"] = item.get('client_id')
+        result["type"] = item_type = item.get('type')
+        user = users.get(str(item.get('user_id') or default_user_id))
+        file = request.files.get(item.get('image') or '')
+
+        key = None
+        if item.get('idempotency_key') and item_type in BATCH_ENDPOINTS:
+            key = (BATCH_ENDPOINTS[item_type], str(item['idempotency_key'])[:100])
+            if key in used_keys:
+                result.update({"status": "duplicate", "id": used_keys[key]})
+                continue
+            if key in batch_keys:
+                result["status"] = "duplicate"
+                repeated.append((result, batch_keys[key]))
+                continue
+
+        error = None
+        if item_type not in ('identify', 'count'):
+            error = "Unknown item type"
+        elif not user:
+            error = "User not found"
+        elif not file or file.filename == '':
+            error = "No image part"
+        elif item_type == 'identify' and not item.get('insect_name'):
+            error = "Missing insect_name"
+        else:
+            try:
+                float(item.get('confidence') or 0)
+                int(item.get('total_count') or 0)
+            except (TypeError, ValueError):
+                error = "Invalid confidence or total_count"
+
+        if error:
+            result.update({"status": "error", "error": error})
+            continue
+
+        breakdown = item.get('breakdown')
+        if breakdown is not None and not isinstance(breakdown, str):
+            breakdown = json.dumps(breakdown)
+
+        image, is_new = store_image(file)
+        if is_new:
+            new_files.append(image.path)
+
+        if item_type == 'identify':
+            record = create_detection(user.id, item.get('insect_name'), item.get('confidence'), image.path)
+        else:
+            record = create_count(user.id, item.get('total_count'), breakdown, image.path)
+
+        if key:
+            batch_keys[key] = record
+        created.append((result, record, user, key))
+
+    if created:
+        try:
+            db.session.flush()
+            for result, record, user, key in created:
+                if key:
+                    body = {"message": "Detection saved" if key[0] == 'sync_identify' else "Count record saved"}
+                    db.session.add(IdempotencyKey(key=key[1], endpoint=key[0], record_id=record.id,
+                                                  status_code=201, response=json.dumps(body)))
+            db.session.commit()
+        except Exception as e:
+            # Includes a concurrent retry committing the same idempotency key first
+            db.session.rollback()
+            discard_files(new_files)
+            print(f"✗ Batch sync failed: {e}")
+            return jsonify({"error": "Failed to save batch"}), 500
+
+    affected_users = {}
+    for result, record, user, key in created:
+        result.update({"status": "created", "id": record.id})
+        affected_users[user.id] = user
+
+    for result, record in repeated:
+        result["id"] = record.id
+
+    for path in new_files:
+        enqueue_variants(path)
+
+    # Evaluate thresholds once per affected user, after everything is committed
+    for user in affected_users.values():
+        enqueue_threshold_check(user.id)
+
+    duplicates = sum(1 for r in results if r.get("status") == "duplicate")
+    failed = len(results) - len(created) - duplicates
+    return jsonify({
+        "message": "Batch processed",
+        "created": len(created),
+        "duplicates": duplicates,
+        "failed": failed,
+        "results": results
+    }), 201 if created or duplicates else 400
+
+# --- Resumable (chunked) uploads, see uploads.py ---
+@app.route('/api/upload/init', methods=['POST'])
+def upload_init():
+    data = request.get_json(silent=True) or request.form
+    user = find_sync_user(data.get('user_id'))
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        total_size = int(data['total_size']) if data.get('total_size') not in (None, '') else None
+        chunk_size = int(data['chunk_size']) if data.get('chunk_size') not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid total_size or chunk_size"}), 400
+    if total_size is not None and not 0 < total_size <= MAX_UPLOAD_SIZE:
+        return jsonify({"error": f"total_size must be between 1 and {MAX_UPLOAD_SIZE} bytes"}), 413
+    if chunk_size is not None and chunk_size <= 0:
+        return jsonify({"error": "Invalid total_size or chunk_size"}), 400
+
+    upload = create_upload(user.id, filename=data.get('filename'), total_size=total_size,
+                           sha256=data.get('sha256'), chunk_size=chunk_size)
+    db.session.commit()
+    return jsonify(upload_status(upload)), 201
+
+@app.route('/api/upload/<string:upload_id>', methods=['GET'])
+def upload_get_status(upload_id):
+    # Clients call this after reconnecting to find where to resume
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(upload_status(upload)), 200
+
+@app.route('/api/upload/<string:upload_id>/chunk/<int:index>', methods=['PUT', 'POST'])
+def upload_chunk(upload_id, index):
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    if upload.status != 'uploading':
+        return jsonify({"error": "Upload already finalized", **upload_status(upload)}), 409
+
+    # Raw body (application/octet-stream) or a multipart "chunk" part
+    data = request.files['chunk'].read() if 'chunk' in request.files else request.get_data()
+    if not data:
+        return jsonify({"error": "Empty chunk"}), 400
+    if len(data) > upload.chunk_size:
+        return jsonify({"error": f"Chunk larger than chunk_size ({upload.chunk_size} bytes)"}), 413
+    limit = upload.total_size or MAX_UPLOAD_SIZE
+    if index == upload.next_chunk and upload.received_bytes + len(data) > limit:
+        return jsonify({"error": "Upload exceeds its declared size"}), 413
+
+    result = append_chunk(upload, index, data)
+    if result == 'out_of_order':
+        return jsonify({"error": "Unexpected chunk, resume from next_chunk", **upload_status(upload)}), 409
+    db.session.refresh(upload)
+    return jsonify({"chunk": index, "result": result, **upload_status(upload)}), 200
+
+@app.route('/api/upload/<string:upload_id>/finalize', methods=['POST'])
+def upload_finalize(upload_id):
+    upload = db.session.get(ChunkedUpload, upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    if upload.status == 'complete':
+        return finalized_upload_response(upload, replayed=True)
+
+    data = request.get_json(silent=True) or request.form
+    kind = data.get('type')
+    if kind not in BATCH_ENDPOINTS:
+        return jsonify({"error": "type must be 'identify' or 'count'"}), 400
+    if kind == 'identify' and not data.get('insect_name'):
+        return jsonify({"error": "Missing insect_name"}), 400
+    try:
+        float(data.get('confidence') or 0)
+        int(data.get('total_count') or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid confidence or total_count"}), 400
+    # Normalized before the file is moved: a JSON body sends breakdown as an object, like sync_batch
+    breakdown = data.get('breakdown')
+    if breakdown is not None and not isinstance(breakdown, str):
+        breakdown = json.dumps(breakdown)
+
+    if upload.received_bytes == 0 or (upload.total_size and upload.received_bytes != upload.total_size):
+        return jsonify({"error": "Upload incomplete", **upload_status(upload)}), 409
+
+    path = part_path(upload)
+    try:
+        # Bytes past received_bytes come from an append that never committed
+        if os.path.getsize(path) != upload.received_bytes:
+            return jsonify({"error": "Upload data does not match received_bytes, resume from next_chunk",
+                            **upload_status(upload)}), 409
+        sha, _ = file_sha256(path)
+    except OSError:
+        return missing_upload_response(upload)
+    if upload.sha256 and sha != upload.sha256:
+        reset_upload(upload)
+        return jsonify({"error": "Checksum mismatch, upload restarted", **upload_status(upload)}), 422
+
+    try:
+        image, is_new = store_local_file(path, upload.filename, sha=sha)
+    except OSError:
+        db.session.rollback()
+        return missing_upload_response(upload)
+    if kind == 'identify':
+        record = create_detection(upload.user_id, data.get('insect_name'), data.get('confidence'), image.path)
+    else:
+        record = create_count(upload.user_id, data.get('total_count'), breakdown, image.path)
+    db.session.flush()
+
+    # Claim the upload in the same transaction, so only one finalize creates a record
+    claimed = ChunkedUpload.query.filter_by(id=upload.id, status='uploading').update({
+        'status': 'complete',
+        'record_type': 'detection' if kind == 'identify' else 'count',
+        'record_id': record.id
+    })
+    if not claimed:
+        db.session.rollback()
+        discard_files([image.path] if is_new else [])
+        upload = db.session.get(ChunkedUpload, upload_id)
+        return finalized_upload_response(upload, replayed=True)
+    db.session.commit()
+
+    # Thumbnails and infestation check run in the background
+    if is_new:
+        enqueue_variants(image.path)
+    enqueue_threshold_check(upload.user_id)
+
+    db.session.refresh(upload)
+    return finalized_upload_response(upload)
+
+def missing_upload_response(upload):
+    # The temp file is gone: a concurrent finalize moved it, or the upload was purged
+    db.session.refresh(upload)
+    if upload.status == 'complete':
+        return finalized_upload_response(upload, replayed=True)
+    return jsonify({"error": "Upload data missing, start a new upload"}), 410
+
+def finalized_upload_response(upload, replayed=False):
+    message = "Detection saved" if upload.record_type == 'detection' else "Count record saved"
+    response = jsonify({"message": message, "upload_id": upload.id,
+                        "record_type": upload.record_type, "record_id": upload.record_id})
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response, 201
+
 
 @app.route('/api/recommendation', methods=['POST'])
 def api_recommendation():
@@ -265,18 +613,19 @@ def api_recommendation():
         return jsonify({"error": "No selected file"}), 400
     
     if file:
-        filename = secure_filename(f"rec_{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}")
-        file_path = os.path.join(app.config['RECOMMENDATION_FOLDER'], filename)
-        file.save(file_path)
+        image, is_new = store_image(file, 'RECOMMENDATION_FOLDER')
         
         new_rec = Recommendation(
             user_id=user_id,
             insect_name=insect_name,
             description=description,
-            image_path=filename
+            image_path=image.path
         )
         db.session.add(new_rec)
         db.session.commit()
+
+        if is_new:
+            enqueue_variants(image.path, 'RECOMMENDATION_FOLDER')
         
         # Optional: Notify logic could go here
         
@@ -284,28 +633,10 @@ def api_recommendation():
 
     return jsonify({"error": "Failed to save"}), 500
 @app.route('/api/stats/dashboard', methods=['GET'])
+@replica_reads
 def api_stats_dashboard():
-    # Sum Pests vs Beneficials from DetectionRecord
-    pest_count = DetectionRecord.query.filter_by(is_beneficial=False).count()
-    beneficial_count = DetectionRecord.query.filter_by(is_beneficial=True).count()
-    
-    # You might also want to parse CountingRecord breakdown if it contributes to the total specific counts,
-    # but for this scaffold we'll stick to the requested "Sum all Pests vs. Beneficials from both tables".
-    # Since CountingRecord breakdown is JSON, it's harder to query directly in SQL without JSON support extensions.
-    # For now, we will iterate (not efficient for huge DBs but fine for MVP/Scaffold).
-    
-    counting_records = CountingRecord.query.all()
-    for record in counting_records:
-        if record.breakdown:
-            try:
-                data = json.loads(record.breakdown)
-                for insect, count in data.items():
-                    if is_beneficial(insect):
-                        beneficial_count += count
-                    else:
-                        pest_count += count
-            except:
-                pass # Ignore malformed JSON
+    # All-time pests vs beneficials (optionally ?municipality=), from the running counters in tallies.py
+    pest_count, beneficial_count = get_counters(request.args.get('municipality') or None)
 
     return jsonify({
         "pests": pest_count,
@@ -314,59 +645,175 @@ def api_stats_dashboard():
 
 
 
-# --- FCM Push Notification Helper ---
-def send_fcm_notification(user_ids, title, body, data=None):
+@app.route('/api/heatmap', methods=['GET'])
+@login_required
+@replica_reads
+def api_heatmap():
     """
-    Send Firebase Cloud Messaging notification to multiple users
-    Args:
-        user_ids: List of user IDs or single user ID
-        title: Notification title
-        body: Notification message body
-        data: Optional dict of additional data
+    Heatmap markers for ?timeframe=daily|past3ds|weekly|monthly|custom (&start_date, &end_date).
+    With &zoom= (and &bbox=south,west,north,east) nearby farms are merged into clusters.
+    Answers 304 Not Modified when nothing was ingested since the client's copy.
     """
-    if not isinstance(user_ids, list):
-        user_ids = [user_ids]
-    
-    if not firebase_admin._apps:
-        print("⚠ FCM: Firebase not initialized, skipping push notification")
-        return
-    
-    success_count = 0
-    for user_id in user_ids:
-        user = User.query.get(user_id)
-        if not user or not user.fcm_token:
-            continue
-        
-        try:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body,
-                ),
-                data=data or {},
-                token=user.fcm_token,
-                android=messaging.AndroidConfig(
-                    priority='high',
-                    notification=messaging.AndroidNotification(
-                        channel_id='SPIM_ALERTS',
-                        priority='max',
-                        sound='default',
-                    )
-                )
-            )
-            response = messaging.send(message)
-            success_count += 1
-            print(f"✓ FCM sent to user {user_id}: {response}")
-        except Exception as e:
-            print(f"✗ FCM failed for user {user_id}: {e}")
-            # If token is invalid, clear it
-            if 'registration-token-not-registered' in str(e) or 'invalid-registration-token' in str(e):
-                user.fcm_token = None
-                db.session.commit()
-    
-    return success_count
+    if current_user.role not in ['admin', 'developer']:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        zoom, bbox = parse_map_view(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    timeframe = parse_timeframe(request.args)
+    version, updated_at = get_watermark()
+    etag, last_modified = heatmap_validators(timeframe, version, updated_at, zoom, bbox)
+
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        markers = get_heatmap(timeframe, version)
+        if zoom is not None:
+            markers = cluster_markers(markers, zoom, bbox)
+        response = jsonify({
+            "timeframe": timeframe.name,
+            "display": timeframe.display,
+            "start_date": timeframe.start_param,
+            "end_date": timeframe.end_param,
+            "markers": [{
+                "lat": round(m.lat, 6),
+                "lng": round(m.lng, 6),
+                "name": m.name,
+                "color": m.color,
+                "pests": m.pests,
+                "beneficials": m.beneficials,
+                "farms": m.farms
+            } for m in markers]
+        })
+    else:
+        response = make_response('', 304)
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True # Browsers revalidate with If-None-Match every time
+    return response
+
+@app.route('/api/charts', methods=['GET'])
+@login_required
+@replica_reads
+def api_charts():
+    """
+    Activity trend and insect totals for the dashboard charts.
+    ?start_date=&end_date= (inclusive, default all history), ?granularity=auto|day|week|month.
+    Farmers get their own data; admins/developers get everyone's, or one farmer's with ?user_id=.
+    """
+    if current_user.role in ['admin', 'developer']:
+        user_id = request.args.get('user_id', type=int)
+    else:
+        user_id = current_user.id
+
+    try:
+        start, end, granularity = parse_chart_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    chart = get_chart_data(user_id, start, end, granularity)
+    return jsonify({
+        "granularity": chart.granularity,
+        "start_date": chart.start.isoformat() if chart.start else None,
+        "end_date": chart.end.isoformat() if chart.end else None,
+        "trend": {"labels": chart.trend.labels, "counts": chart.trend.counts},
+        "insects": {"labels": chart.insects.labels, "counts": chart.insects.counts}
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+@login_required
+def api_cache_stats():
+    """
+    Hit/miss counters of the dashboard result cache in the worker that answers (see cache.py).
+    """
+    if current_user.role not in ['admin', 'developer']:
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify(result_cache.stats())
+
+@app.route('/api/logs', methods=['GET'])
+@login_required
+@replica_reads
+def api_logs():
+    """
+    Report logs for the admin/developer dashboards, one page at a time (newest first).
+    Pass next_cursor back as ?cursor= to get the following page.
+    """
+    if current_user.role not in ['admin', 'developer']:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        filters = parse_log_filters(request.args)
+        limit = min(max(int(request.args.get('limit', LOG_PAGE_SIZE)), 1), MAX_LOG_PAGE_SIZE)
+        entries, next_cursor = get_log_page(filters, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    return jsonify({
+        "data": [log_entry_json(log) for log in entries],
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    })
+
+@app.route('/api/timeline', methods=['GET'])
+@login_required
+@replica_reads
+def api_timeline():
+    """
+    A farmer's Identify/Count timeline, one page at a time (newest first).
+    Farmers get their own; admins/developers pass ?user_id=. Pass next_cursor back as ?cursor=.
+    """
+    if current_user.role in ['admin', 'developer']:
+        user_id = request.args.get('user_id', type=int)
+        if user_id is None:
+            return jsonify({"error": "user_id parameter required"}), 400
+    else:
+        user_id = current_user.id
+
+    try:
+        limit = min(max(int(request.args.get('limit', TIMELINE_PAGE_SIZE)), 1), MAX_LOG_PAGE_SIZE)
+        entries, next_cursor = get_timeline_page(user_id, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+    return jsonify({
+        "data": [{
+            "type": entry.type,
+            "id": entry.id,
+            "timestamp": entry.timestamp.strftime('%Y-%m-%d %H:%M'),
+            "desc": entry.insect_name,
+            "count": entry.count_val,
+            "status": 'Beneficial' if entry.is_beneficial else 'Pest',
+            "image_url": image_url(entry.image_file),
+            "preview_url": image_url(entry.image_file, 'preview')
+        } for entry in entries],
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    })
+
+def log_entry_json(log):
+    return {
+        "type": log.type,
+        "id": log.id,
+        "timestamp": log.timestamp.strftime('%Y-%m-%d %H:%M'),
+        "user": {
+            "id": log.user.id,
+            "full_name": log.user.full_name,
+            "street_barangay": log.user.street_barangay,
+            "municipality": log.user.municipality
+        } if log.user else None,
+        "insect_name": log.insect_name,
+        "is_beneficial": log.is_beneficial,
+        "count_val": log.count_val,
+        "confidence": log.confidence,
+        "image_url": image_url(log.image_file),
+        "thumb_url": image_url(log.image_file, 'thumb')
+    }
+
 
 
+# --- FCM Push Notifications (sent by push.py) ---
 # API endpoint to register device FCM token
 @app.route('/api/register_device_token', methods=['POST'])
 def register_device_token():
@@ -393,6 +840,106 @@ def register_device_token():
     return jsonify({"message": "Device token registered successfully"}), 200
 
 
+# Helper Functions for Idempotent Sync
+def get_idempotency_key():
+    """
+    Client-generated key from the Idempotency-Key header or idempotency_key form field.
+    """
+    key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    return key.strip()[:100] if key and key.strip() else None
+
+def find_idempotency_key(key, endpoint):
+    if not key:
+        return None
+    return IdempotencyKey.query.filter_by(key=key, endpoint=endpoint).first()
+
+def replay_idempotent_response(entry):
+    response = make_response(entry.response or '{}', entry.status_code)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def commit_with_idempotency_key(key, endpoint, record, body, status_code=201, new_files=()):
+    """
+    Commits the pending record together with its idempotency key in one transaction.
+    Returns None on success. If a concurrent retry committed the same key first,
+    rolls back, discards new files and returns the winning IdempotencyKey entry.
+    """
+    if key:
+        db.session.flush()
+        db.session.add(IdempotencyKey(key=key, endpoint=endpoint, record_id=record.id,
+                                      status_code=status_code, response=json.dumps(body)))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        discard_files(new_files)
+        entry = find_idempotency_key(key, endpoint)
+        if entry is None:
+            raise
+        return entry
+    return None
+
+
+# Helper Functions for Sync Ingest
+def find_sync_user(user_id):
+    # The farmer a synced record belongs to; None if user_id is missing, malformed or unknown
+    if not str(user_id or '').isdigit():
+        return None
+    return db.session.get(User, int(user_id))
+
+def create_detection(user_id, insect_name, confidence, image_file):
+    """
+    Adds a DetectionRecord to the session and the owner's daily tally (caller commits).
+    """
+    record = DetectionRecord(
+        user_id=user_id,
+        insect_name=insect_name,
+        confidence=float(confidence) if confidence else 0.0,
+        image_file=image_file, # Store relative filename
+        is_beneficial=is_beneficial(insect_name),
+        timestamp=ph_time()
+    )
+    db.session.add(record)
+    add_to_tally(record)
+    invalidate_on_commit(record.user_id)
+    return record
+
+def create_count(user_id, total_count, breakdown, image_file):
+    """
+    Adds a CountingRecord and its CountItem rows to the session and the owner's
+    daily tally (caller commits).
+    """
+    record = CountingRecord(
+        user_id=user_id,
+        total_count=int(total_count) if total_count else 0,
+        image_file=image_file,
+        breakdown=breakdown,
+        timestamp=ph_time()
+    )
+    build_count_items(record)
+    db.session.add(record)
+    add_to_tally(record)
+    invalidate_on_commit(record.user_id)
+    return record
+
+
+# Helper Function for Counting Record Breakdown
+def build_count_items(record):
+    """
+    Parses a CountingRecord's breakdown once and attaches one CountItem per insect.
+    Records without a readable breakdown get a single Mixed Count pest row holding total_count.
+    """
+    record.items = []
+    parsed = parse_breakdown(record.breakdown)
+    if parsed is None:
+        record.items.append(CountItem(insect_name=MIXED_COUNT_LABEL, count=record.total_count or 0, is_beneficial=False))
+        return record
+    for name, count in parsed:
+        record.items.append(CountItem(insect_name=name, count=count, is_beneficial=is_beneficial(name)))
+    return record
+
+
 # Helper Function for Auto-Threshold
 def check_infestation_threshold(user_id, municipality, is_test=False):
     # Logic: Align with Heatmap Legend
@@ -404,31 +951,8 @@ def check_infestation_threshold(user_id, municipality, is_test=False):
     now_ph = datetime.utcnow() + timedelta(hours=8)
     today_start = now_ph.replace(hour=0, minute=0, second=0, microsecond=0)
     
-    # 1. Count Pests TODAY
-    # Detections
-    pests = DetectionRecord.query.filter_by(user_id=user_id, is_beneficial=False)\
-        .filter(DetectionRecord.timestamp >= today_start).count()
-    
-    # Counts
-    counts = CountingRecord.query.filter_by(user_id=user_id)\
-        .filter(CountingRecord.timestamp >= today_start).all()
-        
-    for c in counts:
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                for insect, val in data.items():
-                    safe_count = 0
-                    if isinstance(val, (int, float)): safe_count = int(val)
-                    elif isinstance(val, str) and val.isdigit(): safe_count = int(val)
-                    elif isinstance(val, dict): safe_count = int(val.get('count', 0))
-                    
-                    if not is_beneficial(insect):
-                        pests += safe_count
-            except:
-                pests += c.total_count # Assume pest if mixed/fail
-        else:
-             pests += c.total_count
+    # 1. Count Pests TODAY (maintained incrementally, see tallies.py)
+    pests = pests_on(user_id, today_start.date())
 
     # 2. Determine Severity
     level = None
@@ -448,9 +972,9 @@ def check_infestation_threshold(user_id, municipality, is_test=False):
     # - Max 1 Low alert per day (unless upgrades to Medium/High)
     # - 1 Hour cooldown between ANY alert for this user
     
-    last_notif = Notification.query.filter_by(from_user_id=user_id)\
-        .filter(Notification.timestamp >= today_start)\
-        .order_by(Notification.timestamp.desc()).first()
+    last_notif = Alert.query.filter_by(from_user_id=user_id)\
+        .filter(Alert.timestamp >= today_start)\
+        .order_by(Alert.timestamp.desc()).first()
         
     if last_notif and not is_test:
         # Global Cooldown: 1 Hour
@@ -465,8 +989,8 @@ def check_infestation_threshold(user_id, municipality, is_test=False):
         # If we already sent a High alert, and this is another High alert...
         if last_notif.level == 'High' and level == 'High':
             # Check max limit (3)
-            high_count = Notification.query.filter_by(from_user_id=user_id, level='High')\
-                .filter(Notification.timestamp >= today_start).count()
+            high_count = Alert.query.filter_by(from_user_id=user_id, level='High')\
+                .filter(Alert.timestamp >= today_start).count()
             if high_count >= 3:
                 return # Limit reached
     
@@ -487,36 +1011,42 @@ def check_infestation_threshold(user_id, municipality, is_test=False):
         msg = f"CRITICAL: High Pest Activity ({pests} pests detected today) in {triggering_user.street_barangay}, {municipality}. Immediate check recommended."
     elif level == 'Medium':
         # Check if we already sent a Medium alert today?
-        medium_count = Notification.query.filter_by(from_user_id=user_id, level='Medium')\
-            .filter(Notification.timestamp >= today_start).count()
+        medium_count = Alert.query.filter_by(from_user_id=user_id, level='Medium')\
+            .filter(Alert.timestamp >= today_start).count()
         if medium_count >= 1:
             return # One warning is enough unless it becomes High
             
         msg = f"WARNING: Elevated Pest Activity ({pests} pests detected today) in {triggering_user.street_barangay}, {municipality}."
     elif level == 'Low':
         # Check if we already sent a Low alert today?
-        low_count = Notification.query.filter_by(from_user_id=user_id, level='Low')\
-            .filter(Notification.timestamp >= today_start).count()
+        low_count = Alert.query.filter_by(from_user_id=user_id, level='Low')\
+            .filter(Alert.timestamp >= today_start).count()
         if low_count >= 1:
             return # One info alert is enough
             
         msg = f"INFO: Minor Pest Activity ({pests} pests detected today) in {triggering_user.street_barangay}, {municipality}. Monitor situation."
         
     if msg:
-        # Send to ALL farmers in the area
-        for farmer in nearby_farmers:
-            new_notif = Notification(
-                user_id=farmer.id,  # TO: this farmer
-                from_user_id=user_id,  # FROM: the farmer who triggered it
-                message=msg,
-                level=level
-            )
-            db.session.add(new_notif)
-        
+        # Send to ALL farmers in the area (one alert, one receipt per farmer)
+        create_alert(msg, level, [farmer.id for farmer in nearby_farmers], from_user_id=user_id)
         db.session.commit()
         print(f"DEBUG: Auto-Alert ({level}) broadcast to {len(nearby_farmers)} farmers in {municipality} (triggered by User {user_id})")
 
 
+# Background threshold evaluation (see tasks.py)
+@task_queue.task('check_threshold')
+def run_threshold_check(user_id):
+    user = User.query.get(int(user_id))
+    if user:
+        check_infestation_threshold(user.id, user.municipality)
+
+def enqueue_threshold_check(user_id):
+    """
+    Queues a "user changed" event; repeated events for the same user are coalesced.
+    """
+    if user_id and str(user_id).isdigit():
+        task_queue.enqueue('check_threshold', user_id)
+
 
 # --- Web Routes ---
 
@@ -580,6 +1110,8 @@ def register():
             longitude=final_lng
         )
         db.session.add(new_user)
+        db.session.flush()
+        invalidate_on_commit(new_user.id) # New farm marker on the heatmap
         db.session.commit()
         login_user(new_user)
         return redirect(url_for('dashboard'))
@@ -641,796 +1173,102 @@ def count_insects():
 
 @app.route('/dashboard')
 @login_required
+@replica_reads
 def dashboard():
-    # 1. Fetch Records
-    detections = DetectionRecord.query.filter_by(user_id=current_user.id).order_by(DetectionRecord.timestamp.desc()).all()
-    counts = CountingRecord.query.filter_by(user_id=current_user.id).order_by(CountingRecord.timestamp.desc()).all()
+    # 1. Stats (the timeline is paged from /api/timeline, charts from /api/charts)
+    stats = get_farmer_stats(current_user.id)
     recommendations = Recommendation.query.filter_by(user_id=current_user.id).order_by(Recommendation.timestamp.desc()).all()
-    
-    # 2. Unified Timeline List
-    # We will wrap them in dictionaries to normalize attributes for the template
-    timeline = []
-    
-    # Process Detections
-    for d in detections:
-        timeline.append({
-            'type': 'Identify',
-            'timestamp': d.timestamp,
-            'desc': d.insect_name,
-            'count': 1,
-            'status': 'Beneficial' if d.is_beneficial else 'Pest',
-            'image': d.image_file
-        })
-        
-    # Process Counts
-    for c in counts:
-        # Determine main insect or Mixed
-        desc = "Mixed Count"
-        pest_status = "Pest" # default
-        
-        # Try to parse breakdown for better description
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                # If only one type, use that name
-                if len(data) == 1:
-                    name = list(data.keys())[0]
-                    desc = name
-                    pest_status = 'Beneficial' if is_beneficial(name) else 'Pest'
-            except:
-                pass
-                
-        timeline.append({
-            'type': 'Count',
-            'timestamp': c.timestamp,
-            'desc': desc,
-            'count': c.total_count,
-            'status': pest_status,
-            'image': c.image_file
-        })
-        
-    # Sort by timestamp descending
-    timeline.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    # 3. Calculate Verification Stats (Charts)
-    daily_stats = {}
-    insect_stats = {}
-    
-    # Helper to accumulate
-    def add_stat(date_str, insect_name, count):
-        daily_stats[date_str] = daily_stats.get(date_str, 0) + count
-        insect_stats[insect_name] = insect_stats.get(insect_name, 0) + count
-        
-    # Iterate Detections
-    for d in detections:
-        d_str = d.timestamp.strftime('%Y-%m-%d')
-        add_stat(d_str, d.insect_name, 1)
-        
-    # Iterate Counts
-    for c in counts:
-        d_str = c.timestamp.strftime('%Y-%m-%d')
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                for name, val in data.items():
-                    add_stat(d_str, name, val)
-            except:
-                add_stat(d_str, 'Mixed', c.total_count)
-        else:
-            add_stat(d_str, 'Mixed', c.total_count)
-            
-    # 2. Unified Timeline List
-    timeline = []
-    
-    for d in detections:
-        timeline.append({
-            'type': 'Identify',
-            'timestamp': d.timestamp,
-            'desc': d.insect_name,
-            'count': 1,
-            'status': 'Beneficial' if d.is_beneficial else 'Pest',
-            'image': d.image_file
-        })
-        
-    for c in counts:
-        parsed = False
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                for name, val in data.items():
-                    # Sanitize count
-                    safe_count = 0
-                    if isinstance(val, (int, float)):
-                        safe_count = int(val)
-                    elif isinstance(val, str) and val.isdigit():
-                        safe_count = int(val)
-                    elif isinstance(val, dict):
-                        safe_count = int(val.get('count', 0))
-                        
-                    timeline.append({
-                        'type': 'Count',
-                        'timestamp': c.timestamp,
-                        'desc': name,
-                        'count': safe_count,
-                        'status': 'Beneficial' if is_beneficial(name) else 'Pest',
-                        'image': c.image_file
-                    })
-                parsed = True
-            except:
-                pass
-        
-        if not parsed:
-            timeline.append({
-                'type': 'Count',
-                'timestamp': c.timestamp,
-                'desc': "Mixed Count",
-                'count': c.total_count,
-                'status': 'Pest',
-                'image': c.image_file
-            })
-        
-    timeline.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    # 3. Stats for Charts
-    daily_stats = {}
-    insect_stats = {}
-    total_pests = 0
-    total_beneficials = 0
-    
-    def add_stat(date_str, insect_name, count):
-        daily_stats[date_str] = daily_stats.get(date_str, 0) + count
-        insect_stats[insect_name] = insect_stats.get(insect_name, 0) + count
-        
-    for d in detections:
-        add_stat(d.timestamp.strftime('%Y-%m-%d'), d.insect_name, 1)
-        if d.is_beneficial:
-            total_beneficials += 1
-        else:
-            total_pests += 1
-        
-    for c in counts:
-        d_str = c.timestamp.strftime('%Y-%m-%d')
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                for name, val in data.items():
-                    # Sanitize count
-                    safe_count = 0
-                    if isinstance(val, (int, float)):
-                        safe_count = int(val)
-                    elif isinstance(val, str) and val.isdigit():
-                        safe_count = int(val)
-                    elif isinstance(val, dict):
-                        safe_count = int(val.get('count', 0))
-                    add_stat(d_str, name, safe_count)
-                    if is_beneficial(name):
-                        total_beneficials += safe_count
-                    else:
-                        total_pests += safe_count
-            except:
-                add_stat(d_str, 'Mixed', c.total_count)
-                total_pests += c.total_count
-        else:
-            add_stat(d_str, 'Mixed', c.total_count)
-            total_pests += c.total_count
-            
-    sorted_dates = sorted(daily_stats.keys())
-    chart_daily = {
-        'labels': sorted_dates,
-        'counts': [daily_stats[d] for d in sorted_dates]
-    }
-    
-    chart_insects = {
-        'labels': list(insect_stats.keys()),
-        'counts': list(insect_stats.values())
-    }
 
-    # Fetch Notifications
-    notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.timestamp.desc()).all()
-    unread_count = sum(1 for n in notifications if not n.is_read)
+    # 2. Fetch Notifications
+    notifications = [inbox_item_json(alert, is_read) for alert, is_read in get_inbox(current_user.id, include_read=True)]
+    unread_count = sum(1 for n in notifications if not n['is_read'])
 
     return render_template('dashboard_farmer.html', 
-                           timeline=timeline,
                            notifications=notifications,
                            unread_count=unread_count,
-                           chart_daily=chart_daily,
-                           pests=total_pests,
-                           beneficials=total_beneficials,
-                           chart_insects=chart_insects,
-                           insect_breakdown=insect_stats, # Pass raw stats for display
-                           recommendations=recommendations)
+                           recommendations=recommendations,
+                           **stats.template_context())
 
 @app.route('/admin/farmer/<int:user_id>')
 @login_required
+@replica_reads
 def admin_farmer_view(user_id):
     if current_user.role not in ['admin', 'developer']:
         return redirect(url_for('dashboard'))
         
     target_user = User.query.get_or_404(user_id)
     
-    # 1. Fetch Records for Target User
-    detections = DetectionRecord.query.filter_by(user_id=target_user.id).order_by(DetectionRecord.timestamp.desc()).all()
-    counts = CountingRecord.query.filter_by(user_id=target_user.id).order_by(CountingRecord.timestamp.desc()).all()
-    recommendations = Recommendation.query.filter_by(user_id=target_user.id).order_by(Recommendation.timestamp.desc()).all()
-    
     # Reuse Logic from dashboard() but scoped to target_user
-    # 2. Unified Timeline List
-    timeline = []
-    
-    for d in detections:
-        timeline.append({
-            'type': 'Identify',
-            'timestamp': d.timestamp,
-            'desc': d.insect_name,
-            'count': 1,
-            'status': 'Beneficial' if d.is_beneficial else 'Pest',
-            'image': d.image_file
-        })
-        
-    for c in counts:
-        parsed = False
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                # If breakdown exists, we can split it or keep as one. 
-                # Farmer dashboard splits them in timeline if possible.
-                for name, val in data.items():
-                    safe_count = 0
-                    if isinstance(val, (int, float)): safe_count = int(val)
-                    elif isinstance(val, str) and val.isdigit(): safe_count = int(val)
-                    elif isinstance(val, dict): safe_count = int(val.get('count', 0))
-                        
-                    timeline.append({
-                        'type': 'Count',
-                        'timestamp': c.timestamp,
-                        'desc': name,
-                        'count': safe_count,
-                        'status': 'Beneficial' if is_beneficial(name) else 'Pest',
-                        'image': c.image_file
-                    })
-                parsed = True
-            except:
-                pass
-        
-        if not parsed:
-            timeline.append({
-                'type': 'Count',
-                'timestamp': c.timestamp,
-                'desc': "Mixed Count",
-                'count': c.total_count,
-                'status': 'Pest',
-                'image': c.image_file
-            })
-        
-    timeline.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    # 3. Stats for Charts
-    daily_stats = {}
-    insect_stats = {}
-    total_pests = 0
-    total_beneficials = 0
-    
-    def add_stat(date_str, insect_name, count):
-        daily_stats[date_str] = daily_stats.get(date_str, 0) + count
-        insect_stats[insect_name] = insect_stats.get(insect_name, 0) + count
-        
-    for d in detections:
-        add_stat(d.timestamp.strftime('%Y-%m-%d'), d.insect_name, 1)
-        if d.is_beneficial:
-            total_beneficials += 1
-        else:
-            total_pests += 1
-        
-    for c in counts:
-        d_str = c.timestamp.strftime('%Y-%m-%d')
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                for name, val in data.items():
-                    safe_count = 0
-                    if isinstance(val, (int, float)): safe_count = int(val)
-                    elif isinstance(val, str) and val.isdigit(): safe_count = int(val)
-                    elif isinstance(val, dict): safe_count = int(val.get('count', 0))
-                    
-                    add_stat(d_str, name, safe_count)
-                    if is_beneficial(name):
-                        total_beneficials += safe_count
-                    else:
-                        total_pests += safe_count
-            except:
-                add_stat(d_str, 'Mixed', c.total_count)
-                total_pests += c.total_count
-        else:
-            add_stat(d_str, 'Mixed', c.total_count)
-            total_pests += c.total_count
-            
-    sorted_dates = sorted(daily_stats.keys())
-    chart_daily = {
-        'labels': sorted_dates,
-        'counts': [daily_stats[d] for d in sorted_dates]
-    }
-    
-    chart_insects = {
-        'labels': list(insect_stats.keys()),
-        'counts': list(insect_stats.values())
-    }
+    stats = get_farmer_stats(target_user.id)
+    recommendations = Recommendation.query.filter_by(user_id=target_user.id).order_by(Recommendation.timestamp.desc()).all()
 
     return render_template('admin_farmer_view.html', 
                            farmer=target_user,
-                           timeline=timeline,
-                           chart_daily=chart_daily,
-                           pests=total_pests,
-                           beneficials=total_beneficials,
-                           chart_insects=chart_insects,
-                           insect_breakdown=insect_stats,
-                           recommendations=recommendations)
+                           recommendations=recommendations,
+                           **stats.template_context())
 
 @app.route('/admin/dashboard')
 @login_required
+@replica_reads
 def admin_dashboard():
     if current_user.role != 'admin':
         return redirect(url_for('dashboard'))
     
-    # 1. Heatmap Data
-    users = User.query.all()
-    map_data = []
-    
-    # Daily Filter Start
-    # 1. Determine Timeframe
-    timeframe = request.args.get('timeframe', 'daily') # daily, weekly, monthly, past3ds, custom
-    
-    now_ph = datetime.utcnow() + timedelta(hours=8)
-    
-    # Default message for display
-    current_range_display = "Today"
-
-    if timeframe == 'weekly':
-        start_date = now_ph - timedelta(days=7)
-        current_range_display = "Last 7 Days"
-    elif timeframe == 'monthly':
-        start_date = now_ph - timedelta(days=30)
-        current_range_display = "Last 30 Days"
-    elif timeframe == 'past3ds':
-        start_date = now_ph - timedelta(days=3)
-        current_range_display = "Past 3 Days"
-    elif timeframe == 'custom':
-        s_str = request.args.get('start_date')
-        e_str = request.args.get('end_date')
-        if s_str and e_str:
-            try:
-                start_date = datetime.strptime(s_str, '%Y-%m-%d')
-                # End date should be end of that day
-                end_date_obj = datetime.strptime(e_str, '%Y-%m-%d')
-                # We need to filter by range, so for single day end date needs to be next day 00:00 or modify query
-                # Simpler: use the provided end date + 23:59:59
-                current_range_display = f"{s_str} to {e_str}"
-            except:
-                # Fallback
-                start_date = now_ph.replace(hour=0, minute=0, second=0, microsecond=0)
-                current_range_display = "Invalid Date Range (Showing Today)"
-        else:
-            start_date = now_ph.replace(hour=0, minute=0, second=0, microsecond=0)
-    else: # daily
-        start_date = now_ph.replace(hour=0, minute=0, second=0, microsecond=0)
-        current_range_display = "Today"
-
-    for u in users:
-        u_pests = 0
-        u_beneficials = 0
-        
-        # Base query for detections
-        d_query = DetectionRecord.query.filter_by(user_id=u.id)
-        c_query = CountingRecord.query.filter_by(user_id=u.id)
-        
-        # Apply Date Filters
-        if timeframe == 'custom' and request.args.get('start_date') and request.args.get('end_date'):
-             try:
-                s_date = datetime.strptime(request.args.get('start_date'), '%Y-%m-%d')
-                e_date = datetime.strptime(request.args.get('end_date'), '%Y-%m-%d') + timedelta(days=1) # Include the end date fully
-                
-                d_query = d_query.filter(DetectionRecord.timestamp >= s_date).filter(DetectionRecord.timestamp < e_date)
-                c_query = c_query.filter(CountingRecord.timestamp >= s_date).filter(CountingRecord.timestamp < e_date)
-             except:
-                 pass
-        else:
-             d_query = d_query.filter(DetectionRecord.timestamp >= start_date)
-             c_query = c_query.filter(CountingRecord.timestamp >= start_date)
-        
-        # Execute
-        u_detections = d_query.all()
-        u_counts = c_query.all()
-            
-        for d in u_detections:
-            if d.is_beneficial:
-                u_beneficials += 1
-            else:
-                u_pests += 1
-        
-        for c in u_counts:
-             if c.breakdown:
-                try:
-                    data = json.loads(c.breakdown)
-                    for insect, count_obj in data.items():
-                        # Extract count logic
-                        safe_count = 0
-                        if isinstance(count_obj, (int, float)):
-                            safe_count = int(count_obj)
-                        elif isinstance(count_obj, str) and count_obj.isdigit():
-                            safe_count = int(count_obj)
-                        elif isinstance(count_obj, dict):
-                             # Fallback extraction similar to logs
-                             for v in count_obj.values():
-                                if isinstance(v, (int, float)):
-                                    safe_count = int(v)
-                                    break
-                        
-                        if is_beneficial(insect):
-                            u_beneficials += safe_count
-                        else:
-                            u_pests += safe_count
-                except:
-                    pass
-        
-        # Determine color (New Logic)
-        color = 'gray'
-        if u_pests == 0 and u_beneficials == 0:
-            color = 'gray'
-        elif u_beneficials > u_pests:
-            color = 'green'
-        else:
-            # Pests are dominant or equal
-            if u_pests > 15:
-                color = 'red'
-            elif u_pests > 5: # 6 to 15
-                color = 'orange'
-            else: # 1 to 5
-                color = 'yellow'
-
-        if u.latitude and u.longitude:
-            map_data.append({
-                "lat": u.latitude,
-                "lng": u.longitude,
-                "name": u.full_name,
-                "color": color,
-                "pests": u_pests,
-                "beneficials": u_beneficials
-            })
+    # 1. Filter options (shared with the developer dashboard, see analytics.py)
+    # The heatmap (/api/heatmap), report logs (/api/logs) and charts (/api/charts) are fetched by the page
+    timeframe = parse_timeframe(request.args)
+    data = get_dashboard_data()
 
-    # 2. Report Logs Data
-    # We want to combine DetectionRecord and CountingRecord into one list for the logs
-    detections = DetectionRecord.query.all()
-    counts = CountingRecord.query.all()
-    
-    # Standardize data structure for the template
-    all_logs = []
-    
-    for d in detections:
-        all_logs.append({
-            "type": "Identify",
-            "id": d.id,
-            "timestamp": d.timestamp,
-            "user": d.user,
-            "insect_name": d.insect_name,
-            "is_beneficial": d.is_beneficial,
-            "count_val": 1,
-            "confidence": d.confidence,
-            "image_file": d.image_file,
-            "raw_obj": d # Keep raw object for delete action if needed, though we need separate delete endpoints or universal logic
-        })
-        
-    for c in counts:
-        # Split counting record into individual rows per insect if possible
-        parsed = False
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                # data = {"Aphids": 5, "Beetle": 2}
-                for insect, count_obj in data.items():
-                    # Sanitize count to ensure it's an integer
-                    safe_count = 0
-                    try:
-                        # Case 1: Already a number
-                        if isinstance(count_obj, (int, float)):
-                            safe_count = int(count_obj)
-                        # Case 2: String number
-                        elif isinstance(count_obj, str) and count_obj.isdigit():
-                            safe_count = int(count_obj)
-                        # Case 3: Dictionary (e.g. {"count": 5} or {"value": 5})
-                        elif isinstance(count_obj, dict):
-                            # Try common keys
-                            if 'count' in count_obj:
-                                safe_count = int(count_obj['count'])
-                            elif 'value' in count_obj:
-                                safe_count = int(count_obj['value'])
-                            elif 'qty' in count_obj:
-                                safe_count = int(count_obj['qty'])
-                            else:
-                                # Fallback: Grab the first numeric value found
-                                for v in count_obj.values():
-                                    if isinstance(v, (int, float)):
-                                        safe_count = int(v)
-                                        break
-                                    elif isinstance(v, str) and v.isdigit():
-                                        safe_count = int(v)
-                                        break
-                    except:
-                        pass
-
-                    all_logs.append({
-                        "type": "Count",
-                        "id": c.id,
-                        "timestamp": c.timestamp,
-                        "user": c.user,
-                        "insect_name": insect,
-                        "is_beneficial": is_beneficial(insect), # Now we can allow specific status
-                        "count_val": safe_count,
-                        "confidence": None,
-                        "image_file": c.image_file,
-                        "raw_obj": c
-                    })
-                parsed = True
-            except:
-                pass # Fallback to single row if parsing fails
-
-        if not parsed:    
-            all_logs.append({
-                "type": "Count",
-                "id": c.id,
-                "timestamp": c.timestamp,
-                "user": c.user,
-                "insect_name": "Unknown/Error", # Or raw string
-                "is_beneficial": None, 
-                "count_val": c.total_count,
-                "confidence": None,
-                "image_file": c.image_file,
-                "raw_obj": c
-            })
-
-    # Sort by timestamp desc
-    all_logs.sort(key=lambda x: x['timestamp'], reverse=True)
-
-    # 3. Farmer Management Data
+    # 2. Farmer Management Data
     all_farmers = User.query.filter_by(role='farmer').all()
 
-    # 4. Calculate Global Stats for Charts
-    daily_stats = {}
-    insect_stats = {}
-    
-    def add_global_stat(date_str, insect_name, count):
-        daily_stats[date_str] = daily_stats.get(date_str, 0) + count
-        insect_stats[insect_name] = insect_stats.get(insect_name, 0) + count
-        
-    for log in all_logs:
-        d_str = log['timestamp'].strftime('%Y-%m-%d')
-        # Use insect_name from log
-        i_name = log['insect_name']
-        c_val = log['count_val']
-        add_global_stat(d_str, i_name, c_val)
-        
-    sorted_dates = sorted(daily_stats.keys())
-    chart_daily = {
-        'labels': sorted_dates,
-        'counts': [daily_stats[d] for d in sorted_dates]
-    }
-    
-    chart_insects = {
-        'labels': list(insect_stats.keys()),
-        'counts': list(insect_stats.values())
-    }
-
-    # 5. Fetch Recommendations
+    # 3. Fetch Recommendations
     recommendations = Recommendation.query.order_by(Recommendation.timestamp.desc()).all()
     
-    # 6. Fetch Recent Notifications (for Admin Log)
+    # 4. Fetch Recent Notifications (for Admin Log)
     # Handled by JS
     recent_notifications = []
 
-    # 7. Extract Unique Filter Data
-    unique_insects = sorted(list(set(log['insect_name'] for log in all_logs)))
+    # 5. Barangay Filter Options
     unique_barangays = sorted(list(NAIC_BARANGAY_COORDS.keys()))
 
     return render_template('dashboard_admin.html', 
-                           map_data=map_data, 
-                           logs=all_logs, 
                            farmers=all_farmers,
-                           chart_daily=chart_daily,
-                           chart_insects=chart_insects,
                            recommendations=recommendations,
-                           unique_insects=unique_insects,
                            unique_barangays=unique_barangays,
-                           current_timeframe=timeframe,
-                           current_range_display=current_range_display,
+                           current_timeframe=timeframe.name,
+                           current_range_display=timeframe.display,
                            start_date=request.args.get('start_date', ''),
                            end_date=request.args.get('end_date', ''),
-                           notifications=recent_notifications)
+                           notifications=recent_notifications,
+                           **data.template_context())
 
 @app.route('/developer/dashboard')
 @login_required
+@replica_reads
 def developer_dashboard():
     # Strict Role Check
     if current_user.role != 'developer':
         return redirect(url_for('dashboard'))
     
-    # Reuse Logic from Admin Dashboard (since it's a superset)
-    # We can actually just call admin_dashboard logic if we refactor, but for now duplicate the call flow or better yet:
-    # Let's extract the "get admin data" part or purely copy-paste?
-    # To keep code clean, let's just reuse the same template rendering logic but with a flag? 
-    # Or just copy-paste the logic since we want to be safe.
-    
-    # ---------------- COPY FROM ADMIN DASHBOARD LOGIC ----------------
-    users = User.query.all()
-    map_data = []
-    
-    # Daily Filter Start
-    # 1. Determine Timeframe
-    timeframe = request.args.get('timeframe', 'daily') # daily, weekly, monthly, past3ds, custom
-    
-    now_ph = datetime.utcnow() + timedelta(hours=8)
-    
-    # Default message for display
-    current_range_display = "Today"
-    
-    # Initialize Dates
-    start_date = now_ph.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_date = None # Only used for custom range
-
-    if timeframe == 'weekly':
-        start_date = now_ph - timedelta(days=7)
-        current_range_display = "Last 7 Days"
-    elif timeframe == 'monthly':
-        start_date = now_ph - timedelta(days=30)
-        current_range_display = "Last 30 Days"
-    elif timeframe == 'past3ds':
-        start_date = now_ph - timedelta(days=3)
-        current_range_display = "Past 3 Days"
-    elif timeframe == 'custom':
-        s_str = request.args.get('start_date')
-        e_str = request.args.get('end_date')
-        if s_str and e_str:
-            try:
-                start_date = datetime.strptime(s_str, '%Y-%m-%d')
-                # End date is inclusive of the day, so +1 day
-                end_date = datetime.strptime(e_str, '%Y-%m-%d') + timedelta(days=1)
-                current_range_display = f"{s_str} to {e_str}"
-            except:
-                # Fallback to Today if parsing fails
-                start_date = now_ph.replace(hour=0, minute=0, second=0, microsecond=0)
-                end_date = None
-                current_range_display = "Invalid Date Range"
-        else:
-            # Fallback if params missing
-            start_date = now_ph.replace(hour=0, minute=0, second=0, microsecond=0)
-    else: 
-        # daily (already set default)
-        pass
-
-    for u in users:
-        u_pests = 0
-        u_beneficials = 0
-        d_query = DetectionRecord.query.filter_by(user_id=u.id)
-        c_query = CountingRecord.query.filter_by(user_id=u.id)
-        
-        # Apply Filter Safe Logic
-        if timeframe == 'custom' and end_date:
-            d_query = d_query.filter(DetectionRecord.timestamp >= start_date).filter(DetectionRecord.timestamp < end_date)
-            c_query = c_query.filter(CountingRecord.timestamp >= start_date).filter(CountingRecord.timestamp < end_date)
-        else:
-            d_query = d_query.filter(DetectionRecord.timestamp >= start_date)
-            c_query = c_query.filter(CountingRecord.timestamp >= start_date)
-        
-        u_detections = d_query.all()
-        u_counts = c_query.all()
-            
-        for d in u_detections:
-            if d.is_beneficial: u_beneficials += 1
-            else: u_pests += 1
-        
-        for c in u_counts:
-             if c.breakdown:
-                try:
-                    data = json.loads(c.breakdown)
-                    for insect, count_obj in data.items():
-                        safe_count = 0
-                        if isinstance(count_obj, (int, float)): safe_count = int(count_obj)
-                        elif isinstance(count_obj, str) and count_obj.isdigit(): safe_count = int(count_obj)
-                        elif isinstance(count_obj, dict):
-                             for v in count_obj.values():
-                                if isinstance(v, (int, float)):
-                                    safe_count = int(v)
-                                    break
-                        if is_beneficial(insect): u_beneficials += safe_count
-                        else: u_pests += safe_count
-                except:
-                    pass
-
-        color = 'gray'
-        if u_pests == 0 and u_beneficials == 0: color = 'gray'
-        elif u_beneficials > u_pests: color = 'green'
-        else:
-            if u_pests > 15: color = 'red'
-            elif u_pests > 5: color = 'orange'
-            else: color = 'yellow'
-
-        if u.latitude and u.longitude:
-            map_data.append({
-                "lat": u.latitude, "lng": u.longitude, "name": u.full_name,
-                "color": color, "pests": u_pests, "beneficials": u_beneficials
-            })
-
-    # Logs
-    detections = DetectionRecord.query.all()
-    counts = CountingRecord.query.all()
-    all_logs = []
-    
-    for d in detections:
-        all_logs.append({
-            "type": "Identify", "id": d.id, "timestamp": d.timestamp, "user": d.user,
-            "insect_name": d.insect_name, "is_beneficial": d.is_beneficial, "count_val": 1,
-            "confidence": d.confidence, "image_file": d.image_file, "raw_obj": d
-        })
-        
-    for c in counts:
-        parsed = False
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                for insect, count_obj in data.items():
-                    safe_count = 0
-                    if isinstance(count_obj, (int, float)): safe_count = int(count_obj)
-                    elif isinstance(count_obj, str) and count_obj.isdigit(): safe_count = int(count_obj)
-                    elif isinstance(count_obj, dict):
-                        if 'count' in count_obj: safe_count = int(count_obj['count'])
-                        elif 'value' in count_obj: safe_count = int(count_obj['value'])
-                        elif 'qty' in count_obj: safe_count = int(count_obj['qty'])
-                        else:
-                            for v in count_obj.values():
-                                if isinstance(v, (int, float)): safe_count = int(v); break
-                                elif isinstance(v, str) and v.isdigit(): safe_count = int(v); break
-                    
-                    all_logs.append({
-                        "type": "Count", "id": c.id, "timestamp": c.timestamp, "user": c.user,
-                        "insect_name": insect, "is_beneficial": is_beneficial(insect),
-                        "count_val": safe_count, "confidence": None, "image_file": c.image_file, "raw_obj": c
-                    })
-                parsed = True
-            except: pass
-        if not parsed:    
-            all_logs.append({
-                "type": "Count", "id": c.id, "timestamp": c.timestamp, "user": c.user,
-                "insect_name": "Mixed Count", "is_beneficial": None, 
-                "count_val": c.total_count, "confidence": None, "image_file": c.image_file, "raw_obj": c
-            })
+    # Same data as the admin dashboard (see analytics.py)
+    timeframe = parse_timeframe(request.args)
+    data = get_dashboard_data()
 
-    all_logs.sort(key=lambda x: x['timestamp'], reverse=True)
     all_farmers = User.query.filter_by(role='farmer').all()
-    daily_stats = {}
-    insect_stats = {}
-    
-    for log in all_logs:
-        d_str = log['timestamp'].strftime('%Y-%m-%d')
-        i_name = log['insect_name']
-        c_val = log['count_val']
-        daily_stats[d_str] = daily_stats.get(d_str, 0) + c_val
-        insect_stats[i_name] = insect_stats.get(i_name, 0) + c_val
-        
-    sorted_dates = sorted(daily_stats.keys())
-    chart_daily = {'labels': sorted_dates, 'counts': [daily_stats[d] for d in sorted_dates]}
-    chart_insects = {'labels': list(insect_stats.keys()), 'counts': list(insect_stats.values())}
     recommendations = Recommendation.query.order_by(Recommendation.timestamp.desc()).all()
     # Handled by JS
     recent_notifications = []
-    unique_insects = sorted(list(set(log['insect_name'] for log in all_logs)))
     unique_barangays = sorted(list(NAIC_BARANGAY_COORDS.keys()))
 
     return render_template('dashboard_developer.html', 
-                           map_data=map_data, logs=all_logs, farmers=all_farmers,
-                           chart_daily=chart_daily, chart_insects=chart_insects,
-                           recommendations=recommendations, unique_insects=unique_insects,
-                           unique_barangays=unique_barangays, current_timeframe=timeframe,
-                           current_range_display=current_range_display,
+                           farmers=all_farmers, recommendations=recommendations,
+                           unique_barangays=unique_barangays, current_timeframe=timeframe.name,
+                           current_range_display=timeframe.display,
                            start_date=request.args.get('start_date', ''),
                            end_date=request.args.get('end_date', ''),
-                           notifications=recent_notifications)
+                           notifications=recent_notifications,
+                           **data.template_context())
 
 @app.route('/admin/recommendation/status', methods=['POST'])
 @login_required
@@ -1463,20 +1301,20 @@ def delete_record(record_type, record_id):
         record = CountingRecord.query.get_or_404(record_id)
     
     if record:
-        try:
-            if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], record.image_file)):
-                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], record.image_file))
-        except:
-            pass 
-
+        image_file = record.image_file
+        remove_from_tally(record)
+        invalidate_on_commit(record.user_id)
         db.session.delete(record)
         db.session.commit()
+        # Images are deduplicated, so only remove the file once nothing else uses it
+        release_images([image_file])
         flash('Record deleted successfully.', 'success')
     
     return redirect(url_for('developer_dashboard', _anchor='logs') if current_user.role == 'developer' else url_for('admin_dashboard', _anchor='logs'))
 
 @app.route('/admin/export_data', methods=['POST'])
 @login_required
+@replica_reads
 def export_data():
     if current_user.role not in ['admin', 'developer']:
         return jsonify({"error": "Unauthorized"}), 403
@@ -1506,7 +1344,7 @@ def export_data():
         q_count = q_count.filter(CountingRecord.timestamp <= end_date_str + ' 23:59:59')
         
     detections = q_detect.order_by(DetectionRecord.timestamp.desc()).all()
-    counts = q_count.order_by(CountingRecord.timestamp.desc()).all()
+    counts = q_count.options(selectinload(CountingRecord.items)).order_by(CountingRecord.timestamp.desc()).all()
     
     # Generate CSV
     si = io.StringIO()
@@ -1520,54 +1358,11 @@ def export_data():
         status = 'Beneficial' if d.is_beneficial else 'Pest'
         cw.writerow(['Identify', d.id, d.timestamp, d.user.full_name, d.user.municipality, d.insect_name, 1, status])
         
-    # Counts
+    # Counts (one row per insect, matching the logs view)
     for c in counts:
-        # Try to parse
-        insect_name = "Mixed"
-        status = "Pest"
-        if c.breakdown:
-            try:
-                data = json.loads(c.breakdown)
-                # If we want detailed rows for counts, we can loop here
-                # Or just summary. Let's do summary + breakdown string to keep it simple 1-to-1 record
-                # Actually user requested "export data", usually detailed is better.
-                # Let's iterate breakdown to match logs view
-                first = True
-                for name, val in data.items():
-                    s = 'Beneficial' if is_beneficial(name) else 'Pest'
-                    
-                    # Ensure val is an integer count
-                    clean_val = 0
-                    if isinstance(val, (int, float)):
-                        clean_val = int(val)
-                    elif isinstance(val, str) and val.isdigit():
-                        clean_val = int(val)
-                    elif isinstance(val, dict):
-                        # Try to extract count from dictionary
-                        if 'count' in val:
-                            clean_val = int(val['count'])
-                        elif 'value' in val:
-                            clean_val = int(val['value'])
-                        elif 'qty' in val:
-                            clean_val = int(val['qty'])
-                        else:
-                            # Fallback: grab first numeric value
-                            for v in val.values():
-                                if isinstance(v, (int, float)):
-                                    clean_val = int(v)
-                                    break
-                                elif isinstance(v, str) and v.isdigit():
-                                    clean_val = int(v)
-                                    break
-                    
-                    cw.writerow(['Count', c.id, c.timestamp, c.user.full_name, c.user.municipality, name, clean_val, s])
-                    first = False
-                if not first: continue # if we wrote rows, skip the fallback write
-            except:
-                pass
-        
-        # Fallback if no breakdown or parse error
-        cw.writerow(['Count', c.id, c.timestamp, c.user.full_name, c.user.municipality, 'Mixed/Unknown', c.total_count, 'Pest'])
+        for item in c.items:
+            status = 'Beneficial' if item.is_beneficial else 'Pest'
+            cw.writerow(['Count', c.id, c.timestamp, c.user.full_name, c.user.municipality, item.insect_name, item.count, status])
         
     
     # Construct filename
@@ -1620,22 +1415,19 @@ def send_notification():
         if user:
             recipients = [user]
             
-    count = 0
-    recipient_ids = []
-    for r in recipients:
-        n = Notification(user_id=r.id, message=message, level=level)
-        db.session.add(n)
-        recipient_ids.append(r.id)
-        count += 1
-        
+    recipient_ids = [r.id for r in recipients]
+    count = len(recipient_ids)
+    if recipient_ids:
+        create_alert(message, level, recipient_ids)
     db.session.commit()
     
     # Send FCM push notifications
+    push = None
     if recipient_ids:
         title = f"{level} Alert"
-        send_fcm_notification(recipient_ids, title, message, data={'level': level})
+        push = push_sender.send(recipient_ids, title, message, data={'level': level})
     
-    flash(f'Alert sent to {count} farmers.', 'success')
+    flash(f'Alert sent to {count} farmers.' + (f' Push: {push.sent} delivered, {push.failed} failed.' if push else ''), 'success')
     return redirect(url_for('developer_dashboard', _anchor='alerts') if current_user.role == 'developer' else url_for('admin_dashboard', _anchor='alerts'))
 
 @app.route('/admin/batch_delete_notifications', methods=['POST'])
@@ -1645,49 +1437,11 @@ def batch_delete_notifications():
     if current_user.role not in ['admin', 'developer']:
         return jsonify({"error": "Unauthorized"}), 403
         
-    notification_ids = request.form.getlist('notification_ids')
-    
-    count = 0
-    deleted_ids = set() # Track deleted IDs to avoid redundant queries
-    
-    for nid in notification_ids:
-        if nid in deleted_ids:
-            continue
-            
-        note = Notification.query.get(nid)
-        if not note: 
-            continue
-            
-        # If it's part of a broadcast (Auto-Alert), delete the WHOLE group
-        if note.from_user_id:
-            # Find all siblings: Same Source, Message, Level, and Time (within same minute)
-            # Use same grouping logic as api_notifications
-            minute_start = note.timestamp.replace(second=0, microsecond=0)
-            minute_end = minute_start + timedelta(minutes=1)
-            
-            siblings = Notification.query.filter_by(
-                from_user_id=note.from_user_id,
-                message=note.message,
-                level=note.level
-            ).filter(
-                Notification.timestamp >= minute_start,
-                Notification.timestamp < minute_end
-            ).all()
-            
-            for sibling in siblings:
-                sid_str = str(sibling.id)
-                if sid_str not in deleted_ids:
-                    db.session.delete(sibling)
-                    deleted_ids.add(sid_str)
-                    count += 1
-        else:
-            # Manual alert (Single)
-            db.session.delete(note)
-            deleted_ids.add(str(note.id)) # Use note.id to be safe
-            count += 1
-            
+    # Each id is an Alert; its receipts (one per recipient) go with it
+    notification_ids = [nid for nid in request.form.getlist('notification_ids') if nid.isdigit()]
+    count = delete_alerts(notification_ids)
     db.session.commit()
-    flash(f'Deleted {count} notifications.', 'success')
+    flash(f'Deleted {count} alerts.', 'success')
     return redirect(url_for('developer_dashboard', _anchor='alerts') if current_user.role == 'developer' else url_for('admin_dashboard', _anchor='alerts'))
 
 @app.route('/admin/batch_delete_records', methods=['POST'])
@@ -1700,6 +1454,7 @@ def batch_delete_records():
     record_ids = request.form.getlist('record_ids')
     
     deleted_count = 0
+    image_files = []
     for item in record_ids:
         try:
             r_type, r_id = item.split('_')
@@ -1710,18 +1465,17 @@ def batch_delete_records():
                 record = CountingRecord.query.get(r_id)
                 
             if record:
-                # remove file
-                try:
-                    if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], record.image_file)):
-                        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], record.image_file))
-                except:
-                    pass
+                image_files.append(record.image_file)
+                remove_from_tally(record)
+                invalidate_on_commit(record.user_id)
                 db.session.delete(record)
                 deleted_count += 1
         except:
             continue
             
     db.session.commit()
+    # Remove files no remaining record shares
+    release_images(image_files)
     flash(f'Deleted {deleted_count} records.', 'success')
     return redirect(url_for('developer_dashboard', _anchor='logs') if current_user.role == 'developer' else url_for('admin_dashboard', _anchor='logs'))
 
@@ -1742,9 +1496,12 @@ def batch_delete_farmers():
             # Deleting user will delete their records if models configured specifically, 
             # otherwise we might leave orphans or need explicit cleanup.
             # Assuming basic delete for specific user.
+            invalidate_on_commit(user.id)
+            remove_farmer_from_counters(user.id)
             db.session.delete(user)
             count += 1
             
+    invalidate_notifications_on_commit() # Their alerts go with them
     db.session.commit()
     flash(f'Deleted {count} farmers.', 'success')
     return redirect(url_for('developer_dashboard', _anchor='farmers') if current_user.role == 'developer' else url_for('admin_dashboard', _anchor='farmers'))
@@ -1754,17 +1511,16 @@ def batch_delete_farmers():
 def admin_heatmap():
     return redirect(url_for('admin_dashboard'))
 
-from datetime import datetime
-
-
 @app.route('/api/notification/read/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
-    notification = Notification.query.get_or_404(notification_id)
-    if notification.user_id != current_user.id:
+    # notification_id is the Alert id; the caller must be one of its recipients
+    db.get_or_404(Alert, notification_id)
+    receipt = db.session.get(AlertReceipt, (notification_id, current_user.id))
+    if not receipt:
         return jsonify({"error": "Unauthorized"}), 403
     
-    notification.is_read = True
+    mark_read(current_user.id, [notification_id])
     db.session.commit()
     return jsonify({"message": "Marked as read"}), 200
 
@@ -1781,12 +1537,7 @@ def mark_all_notifications_read():
         return jsonify({"error": "User not found"}), 404
     
     # Update all unread notifications for this user
-    notifications = Notification.query.filter_by(user_id=user_id, is_read=False).all()
-    count = 0
-    for n in notifications:
-        n.is_read = True
-        count += 1
-    
+    count = mark_read(user.id)
     db.session.commit()
     
     return jsonify({
@@ -1800,9 +1551,6 @@ def api_notifications():
     # Use request.values to grab params from either Query String or Form Data (robustness)
     user_id = request.values.get('user_id')
     
-    # DEBUG LOG for PythonAnywhere
-    print(f"DEBUG: /api/notifications called. Params: {request.values}, user_id detected: {user_id}")
-    
     # If no user_id provided, try to use current_user (web dashboard)
     if not user_id and current_user.is_authenticated:
         user_id = current_user.id
@@ -1818,116 +1566,26 @@ def api_notifications():
     # For Admin/Developer: Return ALL recent notifications (global log)
     # For Farmer: Return unread notifications for THEM
     if user.role in ['admin', 'developer']:
-        query = Notification.query
-
-        # Apply Filters (Date & Severity)
-        date_str = request.args.get('date')
-        severity = request.args.get('severity')
-
-        if date_str:
-            try:
-                # Local time handling might require adjustment but assuming date string matches DB storage
-                # DB stores UTC+8 usually? Or just naive datetime?
-                # Notification.timestamp = db.Column(db.DateTime, index=True, default=ph_time) -> ph_time returns utc+8
-                filter_date = datetime.strptime(date_str, '%Y-%m-%d')
-                # If date_str is '2026-02-08', we want everything from 00:00 to 23:59 on that day
-                next_day = filter_date + timedelta(days=1)
-                query = query.filter(Notification.timestamp >= filter_date, Notification.timestamp < next_day)
-            except ValueError:
-                pass # Ignore invalid date
-        
-        if severity:
-            query = query.filter(Notification.level == severity)
-            
-        # Fetch up to 1000 recent notifications for grouping
-        # We don't verify ALL history, just recent history for performance
-        notifications = query.order_by(Notification.timestamp.desc()).limit(1000).all()
-        
-        # Group broadcast alerts
-        from collections import defaultdict
-        grouped = defaultdict(list)
-        
-        for n in notifications:
-            if n.from_user_id:  
-                key = (
-                    n.from_user_id,
-                    n.message,
-                    n.level,
-                    n.timestamp.replace(second=0, microsecond=0)
-                )
-                grouped[key].append(n)
-            else:
-                grouped[('manual', n.id, None, None)].append(n)
-        
-        # Build list of unique display items (Groups or Manual)
-        grouped_alerts = []
-        seen_groups = set()
-        
-        for n in notifications:
-            # Re-iterate to maintain sort order (Desc timestamp)
-            if n.from_user_id:
-                key = (
-                    n.from_user_id,
-                    n.message,
-                    n.level,
-                    n.timestamp.replace(second=0, microsecond=0)
-                )
-                
-                if key in seen_groups:
-                    continue
-                seen_groups.add(key)
-                
-                group = grouped[key]
-                from_name = n.from_user.full_name if n.from_user else "System"
-                
-                recipient_count = len(group)
-                if recipient_count > 1:
-                    to_display = f"All Farmers ({recipient_count} recipients)"
-                else:
-                    to_display = group[0].user.full_name if group[0].user else "Unknown"
-                
-                grouped_alerts.append({
-                    'id': n.id,
-                    'message': n.message,
-                    'level': n.level,
-                    'timestamp': n.timestamp.strftime('%Y-%m-%d %H:%M'),
-                    'is_read': all(x.is_read for x in group),
-                    'from_user': from_name,
-                    'recipient_name': to_display
-                })
-            else:
-                # Manual unique alert
-                from_name = "System"
-                to_name = n.user.full_name if n.user else "Unknown"
-                grouped_alerts.append({
-                    'id': n.id,
-                    'message': n.message,
-                    'level': n.level,
-                    'timestamp': n.timestamp.strftime('%Y-%m-%d %H:%M'),
-                    'is_read': n.is_read,
-                    'from_user': from_name,
-                    'recipient_name': to_name
-                })
-        
-        # Apply Pagination on GROUPED results
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', 10, type=int)
-        
-        total_items = len(grouped_alerts)
-        total_pages = (total_items + limit - 1) // limit
-        
-        start = (page - 1) * limit
-        end = start + limit
-        
-        paged_data = grouped_alerts[start:end]
+        # Alert log, newest first, ?date= and ?severity= filters; pages follow ?cursor= (see analytics.py)
+        # ?page= still works for older clients
+        cursor = request.args.get('cursor')
+        page_number = max(request.args.get('page', 1, type=int), 1)
+        try:
+            limit = min(max(int(request.args.get('limit', ALERT_PAGE_SIZE)), 1), MAX_ALERT_PAGE_SIZE)
+            page = get_admin_alert_page(request.args.get('date'), request.args.get('severity'),
+                                        cursor, limit, page_number)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameter: {e}"}), 400
         
         return jsonify({
-            'data': paged_data,
+            'data': [asdict(alert) for alert in page.alerts],
             'pagination': {
-                'current_page': page,
-                'total_pages': total_pages,
-                'total_items': total_items,
-                'limit': limit
+                'current_page': None if cursor else page_number, # Unknown when paging by cursor
+                'total_items': page.total,
+                'total_pages': (page.total + limit - 1) // limit,
+                'limit': limit,
+                'next_cursor': page.next_cursor,
+                'has_more': page.next_cursor is not None
             }
         })
 
@@ -1949,41 +1607,75 @@ def api_notifications():
         # Farmer view
         # Check if client requested to include read notifications (history)
         include_read = request.values.get('include_read', 'false').lower() == 'true'
-        
-        query = Notification.query.filter_by(user_id=user_id)
-        
-        if not include_read:
-            query = query.filter_by(is_read=False)
-            
-        notifications = query.order_by(Notification.timestamp.desc()).all()
-        
-        data = []
-        for n in notifications:
-            from_name = n.from_user.full_name if n.from_user else "System"
-            data.append({
-                'id': n.id,
-                'message': n.message,
-                'level': n.level,
-                'timestamp': n.timestamp.strftime('%Y-%m-%d %H:%M'),
-                'is_read': n.is_read,
-                'from_user': from_name
-            })
-            
-        if is_web_pagination:
-             # Paginate farmer data too? Usually not needed but for consistency:
-             return jsonify({
-                'data': data, # Return all for now or paginate if needed
-                'pagination': {
-                    'current_page': 1,
-                    'total_pages': 1,
-                    'total_items': len(data),
-                    'limit': len(data)
-                }
+        # Delta sync: ?since=<next_since of the last call> returns only what changed
+        since = request.values.get('since')
+
+        # Unchanged inbox: 304 for a client sending the ETag it got last time
+        etag = inbox_etag(user.id, include_read, is_web_pagination, since)
+        if not is_resource_modified(request.environ, etag=etag):
+            response = make_response('', 304)
+        elif since:
+            try:
+                new_items, read_ids, next_since = get_inbox_changes(user.id, since, include_read)
+            except ValueError as e:
+                return jsonify({"error": f"Invalid parameter: {e}"}), 400
+            response = jsonify({
+                'data': [inbox_item_json(alert, is_read) for alert, is_read in new_items],
+                'read_ids': read_ids,
+                'next_since': next_since
             })
-        
-        return jsonify(data)
+        else:
+            # 'id' is the Alert id (use it with /api/notification/read/<id>)
+            data = [inbox_item_json(alert, is_read) for alert, is_read in get_inbox(user.id, include_read)]
+
+            if is_web_pagination:
+                 # Paginate farmer data too? Usually not needed but for consistency:
+                 response = jsonify({
+                    'data': data, # Return all for now or paginate if needed
+                    'pagination': {
+                        'current_page': 1,
+                        'total_pages': 1,
+                        'total_items': len(data),
+                        'limit': len(data)
+                    }
+                })
+            else:
+                response = jsonify(data)
+
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
 
 
+@app.route('/api/notifications/stream', methods=['GET'])
+def api_notifications_stream():
+    """
+    Server-Sent Events replacing notification polling: an 'alert' event (id = alert id,
+    data shaped like /api/notifications items) for every new alert addressed to the user,
+    every alert for admins/developers. Resumes after the Last-Event-ID header (or
+    ?last_event_id=) on reconnect. See alert_stream.py.
+    """
+    user_id = request.values.get('user_id')
+    if not user_id and current_user.is_authenticated:
+        user_id = current_user.id
+    user = User.query.get(user_id) if user_id else None
+    if not user:
+        return jsonify({"error": "user_id parameter required"}), 400
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+
+    user_id, is_admin = user.id, user.role in ['admin', 'developer']
+    db.session.close() # The stream outlives the request; don't keep its connection
+    response = Response(alert_stream.events(user_id, is_admin, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Tell nginx not to buffer the events
+    return response
+
 @app.route('/test_alert', methods=['POST'])
 @login_required
 def test_alert():
@@ -2000,13 +1692,12 @@ def test_alert():
         
     # Create a dummy counting record to simulate infestation
     # This will be picked up by check_infestation_threshold
-    record = CountingRecord(
-        user_id=target_user.id,
-        total_count=pests_to_add,
-        image_file='test_alert_simulation.jpg', # Dummy file
-        breakdown=json.dumps({"Simulated Pest": pests_to_add})
+    create_count(
+        target_user.id,
+        pests_to_add,
+        json.dumps({"Simulated Pest": pests_to_add}),
+        'test_alert_simulation.jpg' # Dummy file
     )
-    db.session.add(record)
     db.session.commit()
     
     # Trigger Check with test flag to bypass cooldown
@@ -0,0 +1,47 @@
+"""
+Backfill script to populate the CountItem table for existing CountingRecords
+Run this ONCE after deploying the normalized count table.
+Safe to re-run: records that already have CountItem rows are skipped.
+"""
+import sys
+from app import app, db, build_count_items
+from models import CountingRecord, CountItem
+
+CHUNK_SIZE = 1000
+
+def backfill_count_items(chunk_size=CHUNK_SIZE):
+    with app.app_context():
+        db.create_all() # Make sure the count_item table exists
+
+        total = 0
+        last_id = 0
+        while True:
+            # Walk the table in primary key order so each chunk is a cheap range scan
+            chunk = CountingRecord.query.filter(CountingRecord.id > last_id)\
+                .order_by(CountingRecord.id).limit(chunk_size).all()
+            if not chunk:
+                break
+
+            chunk_ids = [c.id for c in chunk]
+            done_ids = set(row[0] for row in db.session.query(CountItem.counting_record_id)
+                           .filter(CountItem.counting_record_id.in_(chunk_ids)).distinct())
+
+            processed = 0
+            for record in chunk:
+                if record.id in done_ids:
+                    continue
+                build_count_items(record)
+                processed += 1
+
+            db.session.commit()
+            db.session.expunge_all() # Keep memory flat across chunks
+
+            total += processed
+            last_id = chunk_ids[-1]
+            print(f"  -> Processed up to record {last_id} ({processed} backfilled in this chunk)")
+
+        print(f"✓ Backfill complete! {total} counting records split into CountItem rows.")
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else CHUNK_SIZE
+    backfill_count_items(size)
@@ -0,0 +1,127 @@
+"""
+Write-throughput benchmark for the SQLite connection settings in db_config.py
+Simulates concurrent sync uploads (insert a DetectionRecord + bump the farmer's
+DailyTally per transaction) while dashboard readers scan the table, once with
+SQLite's stock settings and once with the tuned pragmas. Uses throwaway database
+files, so it never touches spim.db.
+Usage: python benchmark_db_writes.py [writers] [transactions_per_writer] [readers]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+from datetime import date
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from models import db, User, DetectionRecord, DailyTally, ph_time
+
+# What the app ran with before db_config: SQLite defaults plus pysqlite's 5 s lock timeout
+BASELINE_PRAGMAS = {
+    'SPIM_SQLITE_JOURNAL_MODE': 'DELETE',
+    'SPIM_SQLITE_BUSY_TIMEOUT': '5000',
+    'SPIM_SQLITE_SYNCHRONOUS': 'FULL',
+    'SPIM_SQLITE_MMAP_SIZE': '0',
+    'SPIM_SQLITE_CACHE_SIZE': '-2000',
+}
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run(label, env, writers, per_writer, readers):
+    saved = {key: os.environ.get(key) for key in BASELINE_PRAGMAS}
+    os.environ.update(env) # db_config.set_sqlite_pragmas reads these on every new connection
+    tmp_dir = tempfile.mkdtemp(prefix='spim_bench_')
+    path = os.path.join(tmp_dir, 'bench.db')
+    engine = create_engine(f"sqlite:///{path}", pool_size=writers + readers)
+    try:
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert(), [
+                {'id': i + 1, 'full_name': f'Farmer {i}', 'username': f'bench{i}', 'password_hash': 'x',
+                 'municipality': 'Naic', 'street_barangay': 'Sapa', 'role': 'farmer'}
+                for i in range(writers)
+            ])
+
+        latencies = []
+        errors = []
+        done = threading.Event()
+        lock = threading.Lock()
+        reads = [0]
+
+        def writer(user_id):
+            for n in range(per_writer):
+                start = time.perf_counter()
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(DetectionRecord.__table__.insert().values(
+                            user_id=user_id, insect_name='Aphids', confidence=0.9,
+                            image_file=f'bench/{user_id}_{n}.jpg', is_beneficial=False, timestamp=ph_time()))
+                        stmt = insert(DailyTally.__table__).values(
+                            user_id=user_id, day=date.today(), pests=1, beneficials=0)
+                        conn.execute(stmt.on_conflict_do_update(
+                            index_elements=['user_id', 'day'],
+                            set_={'pests': DailyTally.__table__.c.pests + 1}))
+                except OperationalError as e:
+                    with lock:
+                        errors.append(str(e.orig))
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        def reader():
+            while not done.is_set():
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(select(DetectionRecord.user_id, func.count())
+                                     .group_by(DetectionRecord.user_id)).all()
+                    with lock:
+                        reads[0] += 1
+                except OperationalError as e:
+                    with lock:
+                        errors.append(str(e.orig))
+
+        reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+        writer_threads = [threading.Thread(target=writer, args=(i + 1,)) for i in range(writers)]
+        for t in reader_threads:
+            t.start()
+        started = time.perf_counter()
+        for t in writer_threads:
+            t.start()
+        for t in writer_threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for t in reader_threads:
+            t.join()
+
+        committed = len(latencies)
+        print(f"{label:<10} {committed / elapsed:>9.1f} {committed:>9} {len(errors):>7} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} {reads[0]:>8}")
+        if errors:
+            print(f"           first error: {errors[0]}")
+    finally:
+        engine.dispose()
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    writers = args[0] if len(args) > 0 else 8
+    per_writer = args[1] if len(args) > 1 else 200
+    readers = args[2] if len(args) > 2 else 2
+
+    print(f"{writers} writers x {per_writer} transactions, {readers} dashboard readers")
+    print(f"{'settings':<10} {'writes/s':>9} {'commits':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'reads':>8}")
+    run('baseline', BASELINE_PRAGMAS, writers, per_writer, readers)
+    run('tuned', {}, writers, per_writer, readers)
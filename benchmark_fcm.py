@@ -0,0 +1,80 @@
+"""
+Broadcast benchmark for push notifications (push.py), run against FakeMessaging so
+it needs no Firebase project. It sends one alert to every farmer twice. The first
+run uses the old per-user loop (a User lookup, one messaging.send per token and a
+commit per invalid token). The second uses multicast chunks on the thread pool.
+Uses a throwaway database file, so it never touches spim.db.
+Usage: python benchmark_fcm.py [farmers] [latency_ms] [invalid_percent]
+"""
+import os
+import sys
+import time
+import tempfile
+from flask import Flask
+from models import db, User
+from push import PushSender, FakeMessaging
+
+def seed(farmers, invalid_percent):
+    db.drop_all()
+    db.create_all()
+    invalid_every = int(100 / invalid_percent) if invalid_percent else 0
+    db.session.execute(User.__table__.insert(), [
+        {'id': i + 1, 'full_name': f'Farmer {i}', 'username': f'bench{i}', 'password_hash': 'x',
+         'municipality': 'Naic', 'street_barangay': 'Sapa', 'role': 'farmer',
+         'fcm_token': f"{'invalid' if invalid_every and i % invalid_every == 0 else 'token'}-{i}"}
+        for i in range(farmers)
+    ])
+    db.session.commit()
+    return [i + 1 for i in range(farmers)]
+
+def per_user_loop(backend, user_ids, title, body, data):
+    # send_fcm_notification as it was before push.py
+    from firebase_admin import messaging
+    sent = 0
+    for user_id in user_ids:
+        user = db.session.get(User, user_id)
+        if not user or not user.fcm_token:
+            continue
+        try:
+            backend.send(messaging.Message(notification=messaging.Notification(title=title, body=body),
+                                           data=data, token=user.fcm_token))
+            sent += 1
+        except Exception as e:
+            if 'registration-token-not-registered' in str(e) or 'invalid-registration-token' in str(e):
+                user.fcm_token = None
+                db.session.commit()
+    return sent
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    farmers = args[0] if len(args) > 0 else 2000
+    latency = (args[1] if len(args) > 1 else 20) / 1000
+    invalid_percent = args[2] if len(args) > 2 else 5
+
+    tmp_dir = tempfile.mkdtemp(prefix='spim_bench_')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    db.init_app(app)
+    try:
+        with app.app_context():
+            print(f"{farmers} farmers, {latency * 1000:.0f} ms per FCM call, {invalid_percent}% invalid tokens")
+            print(f"{'sender':<10} {'seconds':>8} {'sent':>6} {'calls':>6} {'cleared':>8}")
+
+            user_ids = seed(farmers, invalid_percent)
+            backend = FakeMessaging(latency=latency)
+            started = time.perf_counter()
+            sent = per_user_loop(backend, user_ids, 'High Alert', 'Benchmark', {'level': 'High'})
+            elapsed = time.perf_counter() - started
+            cleared = User.query.filter(User.fcm_token.is_(None)).count()
+            print(f"{'per-user':<10} {elapsed:>8.2f} {sent:>6} {backend.calls:>6} {cleared:>8}")
+
+            user_ids = seed(farmers, invalid_percent)
+            backend = FakeMessaging(latency=latency)
+            sender = PushSender()
+            sender.init_app(app, backend=backend)
+            result = sender.send(user_ids, 'High Alert', 'Benchmark', {'level': 'High'})
+            print(f"{'multicast':<10} {result.seconds:>8.2f} {result.sent:>6} {backend.calls:>6} {result.tokens_cleared:>8}")
+    finally:
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
@@ -0,0 +1,254 @@
+"""
+Result cache for the expensive dashboard computations in analytics.py.
+
+Tiers, chosen with app.config['RESULT_CACHE'] (env SPIM_RESULT_CACHE):
+    sqlite - per-process LRU with a TTL in front of a SQLite file shared by every
+             server worker on the host (app.config['RESULT_CACHE_PATH'], default
+             instance/result_cache.db), so one worker's result serves them all (default)
+    memory - the per-process LRU alone. Invalidations only reach the process that
+             made them, so use it only when a single process serves the app
+
+Entries carry tags ('records', 'records:12', 'notifications', ...) and
+invalidate(tags) drops every entry with one of them. With the sqlite tier each
+invalidation is also appended to a log in the shared file; workers replay new log
+rows before every lookup, so none of them keeps serving a result another worker
+invalidated.
+
+RESULT_CACHE_TTL (seconds) and RESULT_CACHE_MAX_ENTRIES (per process; the shared
+file holds 4x as many) bound both tiers. stats() reports this process's hit/miss
+counters.
+"""
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+ALL_TAGS = '*' # Logged by invalidate(None)
+SHARED_MAX_FACTOR = 4
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entry (
+    key TEXT PRIMARY KEY,
+    tags TEXT NOT NULL,
+    expires REAL NOT NULL,
+    value BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_cache_entry_expires ON cache_entry (expires);
+CREATE TABLE IF NOT EXISTS cache_invalidation (
+    generation INTEGER PRIMARY KEY AUTOINCREMENT,
+    tags TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+def encode_tags(tags):
+    # '|records|records:12|' so a tag can be matched with instr() on '|tag|'
+    return '|' + '|'.join(sorted(tags)) + '|'
+
+def decode_tags(text):
+    return None if text == ALL_TAGS else set(text.strip('|').split('|'))
+
+class ResultCache:
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = 'memory'
+        self.ttl = 60
+        self.max_entries = 256
+        self.path = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (expires, tags, value), least recently used first
+        self._generation = 0 # Bumped by every invalidation this process applies
+        self._shared_generation = None # Last shared log row replayed (None until first sync)
+        self._local = threading.local() # One SQLite connection per thread
+        self._counters = dict(hits=0, shared_hits=0, misses=0, evictions=0, invalidations=0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESULT_CACHE', 'sqlite')
+        app.config.setdefault('RESULT_CACHE_TTL', 60)
+        app.config.setdefault('RESULT_CACHE_MAX_ENTRIES', 256)
+        app.config.setdefault('RESULT_CACHE_PATH', os.path.join(app.instance_path, 'result_cache.db'))
+        self.app = app
+        self.backend = app.config['RESULT_CACHE']
+        self.ttl = int(app.config['RESULT_CACHE_TTL'])
+        self.max_entries = int(app.config['RESULT_CACHE_MAX_ENTRIES'])
+        self.path = app.config['RESULT_CACHE_PATH']
+        if self.backend not in ('memory', 'sqlite'):
+            raise ValueError(f"Unknown RESULT_CACHE backend: {self.backend}")
+
+    @property
+    def shared(self):
+        return self.backend == 'sqlite'
+
+    def get_or_compute(self, key, tags, compute):
+        """
+        Returns the cached value for `key` or stores compute() under it with `tags`.
+        A value computed while an invalidation happened is returned but not stored,
+        since it may predate the change.
+        """
+        self.sync()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[2]
+            generation = self._generation
+            shared_generation = self._shared_generation
+
+        if self.shared:
+            found = self._shared_get(key, now)
+            if found is not None:
+                expires, value = found
+                self._store(key, tags, expires, value, generation)
+                with self._lock:
+                    self._counters['shared_hits'] += 1
+                return value
+
+        with self._lock:
+            self._counters['misses'] += 1
+        value = compute()
+        expires = time.time() + self.ttl
+        if self._store(key, tags, expires, value, generation) and self.shared:
+            self._shared_put(key, tags, expires, value, shared_generation)
+        return value
+
+    def invalidate(self, tags=None):
+        """
+        Drops entries carrying any of `tags` (every entry if None), in this process
+        and, with the sqlite tier, in the shared file and every other worker.
+        """
+        tags = set(tags) if tags is not None else None
+        self._drop(tags)
+        if self.shared:
+            conn = self._connection()
+            now = time.time()
+            with conn:
+                conn.execute("INSERT INTO cache_invalidation (tags, created) VALUES (?, ?)",
+                             (ALL_TAGS if tags is None else encode_tags(tags), now))
+                self._shared_delete(conn, tags)
+                # Old log rows are only needed by workers idle for longer than an entry lives;
+                # the newest row is kept so they can still tell they missed something
+                conn.execute("DELETE FROM cache_invalidation WHERE created < ? "
+                             "AND generation < (SELECT MAX(generation) FROM cache_invalidation)",
+                             (now - 2 * self.ttl,))
+
+    def sync(self):
+        """
+        Replays invalidations other workers logged in the shared file since the last call.
+        """
+        if not self.shared:
+            return
+        with self._lock:
+            seen = self._shared_generation
+        rows = self._connection().execute(
+            "SELECT generation, tags FROM cache_invalidation WHERE generation > ? ORDER BY generation",
+            (seen or 0,)).fetchall()
+        if seen is None:
+            # First lookup in this process: nothing cached locally yet, just start from here
+            with self._lock:
+                self._shared_generation = rows[-1][0] if rows else 0
+            return
+        if not rows:
+            return
+        if rows[0][0] != seen + 1:
+            self._drop(None) # The log was pruned past our position; start over
+        else:
+            for _, text in rows:
+                self._drop(decode_tags(text))
+        with self._lock:
+            self._shared_generation = max(self._shared_generation or 0, rows[-1][0])
+
+    def stats(self):
+        """
+        Hit/miss counters for this process (each server worker counts its own lookups).
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters['hits'] + counters['shared_hits'] + counters['misses']
+        stats = {
+            'backend': self.backend,
+            'pid': os.getpid(),
+            'ttl': self.ttl,
+            'max_entries': self.max_entries,
+            'entries': entries,
+            **counters,
+            'hit_rate': round((counters['hits'] + counters['shared_hits']) / lookups, 3) if lookups else None,
+        }
+        if self.shared:
+            stats['shared_entries'] = self._connection().execute(
+                "SELECT COUNT(*) FROM cache_entry WHERE expires > ?", (time.time(),)).fetchone()[0]
+        return stats
+
+    # --- Local tier (LRU + TTL) ---
+    def _store(self, key, tags, expires, value, generation):
+        with self._lock:
+            if self._generation != generation:
+                return False
+            self._entries[key] = (expires, set(tags), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+            return True
+
+    def _drop(self, tags):
+        with self._lock:
+            self._generation += 1
+            self._counters['invalidations'] += 1
+            if tags is None:
+                self._entries.clear()
+                return
+            for key in [k for k, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]:
+                del self._entries[key]
+
+    # --- Shared tier (SQLite file) ---
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # Connections are not reused across fork, so each server worker opens its own
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SHARED_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _shared_get(self, key, now):
+        row = self._connection().execute(
+            "SELECT expires, value FROM cache_entry WHERE key = ? AND expires > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        try:
+            return row[0], pickle.loads(row[1])
+        except Exception:
+            return None # Written by an older version of the code; recompute
+
+    def _shared_put(self, key, tags, expires, value, shared_generation):
+        conn = self._connection()
+        with conn:
+            # Skipped if another worker logged an invalidation while we computed
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entry (key, tags, expires, value) SELECT ?, ?, ?, ? "
+                "WHERE COALESCE((SELECT MAX(generation) FROM cache_invalidation), 0) = ?",
+                (key, encode_tags(tags), expires, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 shared_generation or 0))
+            conn.execute("DELETE FROM cache_entry WHERE expires <= ?", (time.time(),))
+            conn.execute("DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry "
+                         "ORDER BY expires DESC LIMIT -1 OFFSET ?)", (self.max_entries * SHARED_MAX_FACTOR,))
+
+    def _shared_delete(self, conn, tags):
+        if tags is None:
+            conn.execute("DELETE FROM cache_entry")
+            return
+        for tag in tags:
+            conn.execute("DELETE FROM cache_entry WHERE instr(tags, ?) > 0", (f"|{tag}|",))
+
+result_cache = ResultCache()
@@ -1,4 +1,5 @@
-from app import app, db, DetectionRecord, CountingRecord
+from app import app, db, DetectionRecord, CountingRecord, build_count_items
+from tallies import rebuild_daily_tallies, reconcile_counters
 from utils import INSECT_TYPES
 import json
 
@@ -51,6 +52,7 @@ def cleanup():
                                         total += int(v)
                                         break
                         c.total_count = total
+                        build_count_items(c)
                     else:
                         should_delete = True
                 except:
@@ -61,6 +63,8 @@ def cleanup():
                 deleted_cnt += 1
 
         db.session.commit()
+        rebuild_daily_tallies() # Breakdowns were rewritten and records deleted
+        reconcile_counters(fix=True)
         print(f"Cleanup complete. Deleted {deleted_det} detection records and {deleted_cnt} counting records.")
 
 if __name__ == "__main__":
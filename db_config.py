@@ -0,0 +1,125 @@
+"""
+Database engine configuration from the environment.
+
+    SPIM_DATABASE_URL          Primary database (falls back to DATABASE_URL, then sqlite:///spim.db)
+    SPIM_DATABASE_REPLICA_URL  Optional read replica for dashboard pages (see replica_reads)
+
+SQLite (default) - every new connection gets:
+    SPIM_SQLITE_JOURNAL_MODE   WAL      readers don't block the writer and vice versa
+    SPIM_SQLITE_BUSY_TIMEOUT   5000     ms to wait for the write lock instead of "database is locked"
+    SPIM_SQLITE_SYNCHRONOUS    NORMAL   safe with WAL, avoids an fsync per commit
+    SPIM_SQLITE_MMAP_SIZE      268435456 (256 MB)
+    SPIM_SQLITE_CACHE_SIZE     -65536   page cache, negative = KiB (64 MB)
+
+PostgreSQL (postgresql://..., needs psycopg2) - pooled connections:
+    SPIM_DB_POOL_SIZE 10, SPIM_DB_MAX_OVERFLOW 20, SPIM_DB_POOL_TIMEOUT 30 (s),
+    SPIM_DB_POOL_RECYCLE 1800 (s); connections are pinged before use.
+"""
+import os
+import sqlite3
+from contextvars import ContextVar
+from functools import wraps
+from sqlalchemy import event, Select
+from sqlalchemy.engine import Engine
+from flask_sqlalchemy.session import Session
+
+DEFAULT_DATABASE_URL = 'sqlite:///spim.db'
+REPLICA_BIND = 'replica'
+
+SQLITE_DEFAULTS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -65536,
+}
+
+POOL_DEFAULTS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+}
+
+def env_setting(name, default):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return int(value) if isinstance(default, int) else value
+
+def database_url(name, fallback=None):
+    url = os.environ.get(name) or fallback
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):] # Heroku-style URLs
+    return url
+
+def sqlite_pragmas():
+    return {key: env_setting(f"SPIM_SQLITE_{key.upper()}", default) for key, default in SQLITE_DEFAULTS.items()}
+
+def engine_options(url):
+    if url.startswith('sqlite'):
+        # Pragmas are applied per connection by set_sqlite_pragmas below
+        return {}
+    options = {key: env_setting(f"SPIM_DB_{key.upper()}", default) for key, default in POOL_DEFAULTS.items()}
+    options['pool_pre_ping'] = True
+    return options
+
+def configure_database(app):
+    """
+    Fills the SQLALCHEMY_* settings from the environment. Call before db.init_app(app).
+    """
+    url = database_url('SPIM_DATABASE_URL', os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URL)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+
+    replica_url = database_url('SPIM_DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: {'url': replica_url, **engine_options(replica_url)}
+        }
+    return url
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    pragmas = sqlite_pragmas()
+    cursor = dbapi_connection.cursor()
+    # busy_timeout first, so switching the journal mode waits for other connections too
+    cursor.execute(f"PRAGMA busy_timeout={int(pragmas['busy_timeout'])}")
+    cursor.execute(f"PRAGMA journal_mode={pragmas['journal_mode']}")
+    cursor.execute(f"PRAGMA synchronous={pragmas['synchronous']}")
+    cursor.execute(f"PRAGMA mmap_size={int(pragmas['mmap_size'])}")
+    cursor.execute(f"PRAGMA cache_size={int(pragmas['cache_size'])}")
+    cursor.close()
+
+
+# --- Read replica routing ---
+_replica_reads = ContextVar('replica_reads', default=False)
+
+class RoutingSession(Session):
+    """
+    Sends plain SELECTs to the replica engine while replica_reads is active.
+    Flushes, writes and everything outside replica_reads use the primary.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _replica_reads.get() and not self._flushing \
+                and (clause is None or isinstance(clause, Select)):
+            engines = self._db.engines
+            if REPLICA_BIND in engines:
+                return engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_reads(view):
+    """
+    Decorator for read-only views (dashboards). Their queries may be served by
+    SPIM_DATABASE_REPLICA_URL and can lag the primary by the replication delay.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
@@ -0,0 +1,37 @@
+"""
+Backfill script to create thumbnail/preview variants for existing uploads
+Goes through every StoredImage (uploads and recommendations) and generates missing
+WebP variants on a pool of worker threads. Safe to re-run: existing variants are skipped.
+Run migrate_image_store.py first so legacy flat uploads are registered.
+Usage: python generate_thumbnails.py [--overwrite] [workers]
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from app import app
+from models import StoredImage
+from images import generate_variants, Image
+
+def generate_one(job, overwrite):
+    with app.app_context():
+        return generate_variants(job[0], job[1], overwrite)
+
+def generate_thumbnails(workers=None, overwrite=False):
+    if Image is None:
+        print("✗ Pillow is not installed (pip install Pillow).")
+        return
+
+    with app.app_context():
+        jobs = [(row.folder, row.path) for row in StoredImage.query.with_entities(StoredImage.folder, StoredImage.path)]
+    print(f"Generating variants for {len(jobs)} images...")
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        written = sum(pool.map(lambda job: generate_one(job, overwrite), jobs))
+
+    print(f"✓ Done! {written} variant files written.")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    overwrite = '--overwrite' in args
+    numbers = [int(a) for a in args if a.isdigit()]
+    generate_thumbnails(numbers[0] if numbers else None, overwrite)
@@ -0,0 +1,86 @@
+"""
+Thumbnail and preview generation for uploaded images.
+Variants are WebP files stored next to the original in the same storage backend:
+    2026/10/ab/<hash>.jpg -> 2026/10/ab/<hash>_thumb.webp, .../<hash>_preview.webp
+New uploads are processed on the background task queue. Pillow is optional;
+without it no variants are made and pages fall back to the original images.
+"""
+import io
+import os
+from tasks import task_queue
+from storage_backends import get_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    print("[WARNING] Pillow not installed. Thumbnails will not be generated.")
+
+# Largest first, so each variant is resized from the previous one
+VARIANTS = {
+    'preview': (800, 800),
+    'thumb': (160, 160),
+}
+WEBP_QUALITY = 80
+
+def variant_path(path, variant):
+    base, _ = os.path.splitext(path)
+    return f"{base}_{variant}.webp"
+
+def is_variant(path):
+    return any(path.endswith(f"_{variant}.webp") for variant in VARIANTS)
+
+def generate_variants(folder, path, overwrite=False):
+    """
+    Writes the missing thumbnail/preview variants for one stored image.
+    Returns the number of variant files written.
+    """
+    if Image is None:
+        return 0
+    storage = get_storage()
+
+    written = 0
+    try:
+        todo = [(variant, size) for variant, size in VARIANTS.items()
+                if overwrite or not storage.exists(folder, variant_path(path, variant))]
+        if not todo:
+            return 0
+
+        with storage.open(folder, path) as source, Image.open(source) as img:
+            # Let the JPEG decoder downscale while decoding instead of loading full resolution
+            img.draft('RGB', todo[0][1])
+            img = ImageOps.exif_transpose(img) # Phone photos carry rotation in EXIF
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGB')
+
+            for variant, size in todo:
+                img.thumbnail(size)
+                buf = io.BytesIO()
+                img.save(buf, 'WEBP', quality=WEBP_QUALITY)
+                storage.save_bytes(folder, variant_path(path, variant), buf.getvalue())
+                written += 1
+    except FileNotFoundError:
+        pass # Original was deleted before the task ran
+    except (OSError, ValueError) as e:
+        print(f"✗ Could not create variants for {path}: {e}")
+    return written
+
+def remove_variants(folder, path):
+    storage = get_storage()
+    for variant in VARIANTS:
+        try:
+            storage.delete(folder, variant_path(path, variant))
+        except OSError:
+            pass
+
+def enqueue_variants(path, folder='UPLOAD_FOLDER'):
+    """
+    Queues variant generation for a newly stored image (call after commit).
+    """
+    if Image is not None and path:
+        task_queue.enqueue('image_variants', f"{folder}:{path}")
+
+@task_queue.task('image_variants')
+def run_image_variants(key):
+    folder, path = key.split(':', 1)
+    generate_variants(folder, path)
@@ -0,0 +1,54 @@
+"""
+Migration script: moves the old per-recipient Notification rows into Alert + AlertReceipt
+Rows that were sent together (same sender, message and level within the same minute,
+the grouping the admin log used) become one Alert with a receipt per recipient and
+their read flags. The old notification table is dropped afterwards.
+Also adds alert_receipt.read_at (delta sync) to databases created before it.
+Back up instance/spim.db first, then run this ONCE.
+"""
+from sqlalchemy import MetaData, Table, inspect, insert, text
+from app import app, db
+from models import Alert, AlertReceipt
+
+def migrate_alerts():
+    with app.app_context():
+        db.create_all() # alert / alert_receipt tables
+        if 'read_at' not in [c['name'] for c in inspect(db.engine).get_columns('alert_receipt')]:
+            with db.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE alert_receipt ADD COLUMN read_at DATETIME"))
+            print("✓ Added read_at to alert_receipt (reads before now have no timestamp).")
+        if 'notification' not in inspect(db.engine).get_table_names():
+            print("✓ No notification table left. No migration needed.")
+            return
+
+        notification = Table('notification', MetaData(), autoload_with=db.engine)
+        rows = db.session.execute(notification.select().order_by(notification.c.timestamp, notification.c.id)).all()
+
+        groups = {} # (from_user_id, message, level, minute) -> {'alert': {...}, 'receipts': {user_id: is_read}}
+        for row in rows:
+            minute = row.timestamp.replace(second=0, microsecond=0) if row.timestamp else None
+            group = groups.setdefault((row.from_user_id, row.message, row.level, minute), {
+                'alert': {'from_user_id': row.from_user_id, 'message': row.message,
+                          'level': row.level or 'Low', 'timestamp': row.timestamp},
+                'receipts': {},
+            })
+            # A farmer who got the same alert twice keeps one receipt, read only if both were
+            receipts = group['receipts']
+            receipts[row.user_id] = receipts.get(row.user_id, True) and bool(row.is_read)
+
+        receipt_count = 0
+        for group in groups.values():
+            alert_id = db.session.execute(insert(Alert).values(**group['alert'])).inserted_primary_key[0]
+            db.session.execute(insert(AlertReceipt), [
+                {'alert_id': alert_id, 'user_id': user_id, 'is_read': is_read}
+                for user_id, is_read in group['receipts'].items()
+            ])
+            receipt_count += len(group['receipts'])
+
+        notification.drop(db.session.connection())
+        db.session.commit()
+        print(f"✓ Migrated {len(rows)} notification rows into {len(groups)} alerts ({receipt_count} receipts).")
+        print("  The notification table was dropped.")
+
+if __name__ == "__main__":
+    migrate_alerts()
@@ -0,0 +1,76 @@
+"""
+Migration script to move existing uploads into the content-addressed image store
+Hashes every flat file referenced by DetectionRecord, CountingRecord and Recommendation,
+keeps one copy per SHA-256 in the configured storage backend under
+<YYYY>/<MM>/<hash[:2]>/<hash>.<ext>, deletes duplicates and repoints the records.
+Safe to re-run: already migrated paths are skipped.
+To move images stored by an earlier version of this script, use migrate_storage.py.
+"""
+import os
+import hashlib
+from app import app, db
+from models import DetectionRecord, CountingRecord, Recommendation, StoredImage
+from storage import hashed_path, CHUNK_SIZE
+from storage_backends import get_storage
+
+def file_digest(full_path):
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def migrate_folder(folder, columns):
+    root = app.config[folder] # Legacy files are always local
+    storage = get_storage()
+    known_paths = set(row[0] for row in db.session.query(StoredImage.path).filter_by(folder=folder))
+
+    legacy_paths = set()
+    for column in columns:
+        legacy_paths.update(row[0] for row in db.session.query(column).distinct() if row[0])
+    legacy_paths -= known_paths
+
+    moved = 0
+    deduped = 0
+    missing = 0
+    for old_path in sorted(legacy_paths):
+        old_full = os.path.join(root, old_path)
+        if not os.path.isfile(old_full):
+            missing += 1
+            continue
+
+        sha = file_digest(old_full)
+        image = StoredImage.query.filter_by(sha256=sha, folder=folder).first()
+        if image and storage.exists(folder, image.path):
+            os.remove(old_full) # Duplicate bytes, keep the stored copy
+            deduped += 1
+        else:
+            new_path = image.path if image else hashed_path(sha, old_path)
+            size = os.path.getsize(old_full)
+            storage.save_file(folder, new_path, old_full)
+            if not image:
+                image = StoredImage(sha256=sha, folder=folder, path=new_path, size=size)
+                db.session.add(image)
+            moved += 1
+
+        # Repoint every record that used the old filename
+        for column in columns:
+            column.class_.query.filter(column == old_path)\
+                .update({column: image.path}, synchronize_session=False)
+        db.session.commit()
+
+    print(f"  {folder}: {moved} moved, {deduped} duplicates removed, {missing} missing files skipped")
+
+def migrate_image_store():
+    with app.app_context():
+        db.create_all() # Make sure the stored_image table exists
+        print("Migrating uploads into the content-addressed store...")
+        migrate_folder('UPLOAD_FOLDER', [DetectionRecord.image_file, CountingRecord.image_file])
+        migrate_folder('RECOMMENDATION_FOLDER', [Recommendation.image_path])
+        print("✓ Migration complete!")
+
+if __name__ == "__main__":
+    migrate_image_store()
@@ -0,0 +1,20 @@
+"""
+Migration script to add the (timestamp, id) indexes used by the paginated report logs (/api/logs),
+farmer timelines (/api/timeline) and admin alert log (/api/notifications)
+db.create_all() only creates indexes for new tables, so run this ONCE on an existing database
+"""
+from app import app, db
+from models import DetectionRecord, CountingRecord, Alert
+
+def migrate_log_indexes():
+    with app.app_context():
+        for model in (DetectionRecord, CountingRecord, Alert):
+            for index in model.__table__.indexes:
+                try:
+                    index.create(db.engine, checkfirst=True)
+                    print(f"✓ Index '{index.name}' is in place.")
+                except Exception as e:
+                    print(f"✗ Could not create index '{index.name}': {e}")
+
+if __name__ == "__main__":
+    migrate_log_indexes()
@@ -0,0 +1,35 @@
+"""
+Migration script: adds barangay/municipality to detection_record and counting_record
+and stamps existing records with their farmer's current location, which is what their
+rollup rows and counters were keyed by. Afterwards a profile change no longer moves
+old records between locations (see tallies.py).
+Back up instance/spim.db first, then run this ONCE, followed by
+python reconcile_counters.py --fix for farmers who had already moved.
+"""
+from sqlalchemy import inspect, text, select, update
+from app import app, db
+from models import User, DetectionRecord, CountingRecord
+
+def migrate_record_locations():
+    with app.app_context():
+        for model in (DetectionRecord, CountingRecord):
+            table = model.__tablename__
+            columns = [c['name'] for c in inspect(db.engine).get_columns(table)]
+            with db.engine.begin() as conn:
+                if 'barangay' not in columns:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN barangay VARCHAR(200)"))
+                if 'municipality' not in columns:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN municipality VARCHAR(100)"))
+
+            stamped = db.session.execute(
+                update(model)
+                .where(model.barangay.is_(None), model.municipality.is_(None))
+                .values(barangay=select(User.street_barangay).where(User.id == model.user_id).scalar_subquery(),
+                        municipality=select(User.municipality).where(User.id == model.user_id).scalar_subquery())
+            ).rowcount
+            db.session.commit()
+            print(f"✓ {table}: stamped {stamped} records with their farmer's location.")
+        print("  Now run: python reconcile_counters.py --fix")
+
+if __name__ == "__main__":
+    migrate_record_locations()
@@ -0,0 +1,88 @@
+"""
+Migration script to move stored images into the sharded layout and/or another storage backend
+Every StoredImage (and its thumbnail/preview variants) is moved from
+<hash[:2]>/<hash>.<ext> to <YYYY>/<MM>/<hash[:2]>/<hash>.<ext> (month of first upload),
+and the records pointing at it are updated.
+
+With --from local the images are copied from the local upload folders into the
+configured backend (e.g. SPIM_STORAGE_BACKEND=s3). Local copies are kept unless
+--delete-source is given. Safe to re-run: images already in place are skipped.
+Legacy flat uploads must be registered first with migrate_image_store.py.
+
+Usage: python migrate_storage.py [--from local] [--delete-source]
+"""
+import sys
+from app import app, db
+from models import DetectionRecord, CountingRecord, Recommendation, StoredImage
+from storage import hashed_path, is_sharded_path
+from storage_backends import get_storage, make_backend
+from images import VARIANTS, variant_path
+
+RECORD_COLUMNS = {
+    'UPLOAD_FOLDER': [DetectionRecord.image_file, CountingRecord.image_file],
+    'RECOMMENDATION_FOLDER': [Recommendation.image_path],
+}
+
+def copy_object(source, target, folder, old_key, new_key):
+    """
+    Copies one object between backends/keys. Returns False if the source is missing.
+    """
+    if not source.exists(folder, old_key):
+        return False
+    with source.open(folder, old_key) as f:
+        target.save_bytes(folder, new_key, f.read())
+    return True
+
+def migrate_storage(from_backend=None, delete_source=False):
+    with app.app_context():
+        target = get_storage()
+        source = make_backend(from_backend, app.config) if from_backend else target
+        same_backend = source is target
+        move = same_backend or delete_source
+        print(f"Migrating stored images ({source.name} -> {target.name})...")
+
+        moved = 0
+        skipped = 0
+        missing = 0
+        for image_id, in db.session.query(StoredImage.id).order_by(StoredImage.id).all():
+            image = db.session.get(StoredImage, image_id)
+            folder = image.folder
+            old_key = image.path
+            new_key = old_key if is_sharded_path(old_key) else hashed_path(image.sha256, old_key, image.created_at)
+
+            if new_key == old_key and (same_backend or target.exists(folder, new_key)):
+                skipped += 1
+                continue
+
+            if target.exists(folder, new_key) and not source.exists(folder, old_key):
+                pass # Copied by an earlier run that stopped before updating the rows
+            elif not copy_object(source, target, folder, old_key, new_key):
+                missing += 1
+                print(f"  ✗ Missing {folder}:{old_key}")
+                continue
+            for variant in VARIANTS:
+                copy_object(source, target, folder, variant_path(old_key, variant), variant_path(new_key, variant))
+
+            if new_key != old_key:
+                image.path = new_key
+                for column in RECORD_COLUMNS[folder]:
+                    column.class_.query.filter(column == old_key)\
+                        .update({column: new_key}, synchronize_session=False)
+            db.session.commit()
+
+            # Old copies are only removed once the rows point at the new key
+            if move:
+                for key in [old_key] + [variant_path(old_key, v) for v in VARIANTS]:
+                    try:
+                        source.delete(folder, key)
+                    except OSError:
+                        pass
+            moved += 1
+            db.session.expunge_all()
+
+        print(f"✓ Migration complete! {moved} moved, {skipped} already in place, {missing} missing files skipped.")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    from_backend = args[args.index('--from') + 1] if '--from' in args else None
+    migrate_storage(from_backend, delete_source='--delete-source' in args)
@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, timedelta
+from db_config import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession}) # Engine settings come from db_config.configure_database
 
 def ph_time():
     return datetime.utcnow() + timedelta(hours=8)
@@ -28,22 +29,45 @@ class DetectionRecord(db.Model):
     image_file = db.Column(db.String(255), nullable=False) # Path to image
     timestamp = db.Column(db.DateTime, default=ph_time)
     is_beneficial = db.Column(db.Boolean, default=False)
+    # Farmer's location when recorded; rollups and counters are keyed by it (tallies.py)
+    barangay = db.Column(db.String(200), nullable=True)
+    municipality = db.Column(db.String(100), nullable=True)
 
     user = db.relationship('User', backref=db.backref('detections', lazy=True, cascade="all, delete-orphan"))
 
-class Notification(db.Model):
+    # Report logs and farmer timelines page through records newest first by (timestamp, id)
+    __table_args__ = (
+        db.Index('ix_detection_record_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_detection_record_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+
+class Alert(db.Model):
+    # One alert as sent (manual or auto-alert); each recipient gets an AlertReceipt instead of a copy
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # TO: recipient
-    from_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # FROM: who triggered it (null for manual alerts)
+    from_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # FROM: farmer who triggered it (null for manual alerts)
     message = db.Column(db.String(255), nullable=False)
     level = db.Column(db.String(20), nullable=False, default='Low') # Low, Medium, High
-    is_read = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.DateTime, index=True, default=ph_time)
+    timestamp = db.Column(db.DateTime, default=ph_time)
 
-    # Relationships
-    user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('notifications', lazy=True, cascade="all, delete-orphan"))
     from_user = db.relationship('User', foreign_keys=[from_user_id])
 
+    __table_args__ = (
+        db.Index('ix_alert_timestamp_id', 'timestamp', 'id'), # Admin alert log pages newest first
+        db.Index('ix_alert_from_user_timestamp', 'from_user_id', 'timestamp'), # Auto-alert cooldowns
+    )
+
+class AlertReceipt(db.Model):
+    # An alert delivered to one farmer (TO), with that farmer's read flag
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    is_read = db.Column(db.Boolean, nullable=False, default=False)
+    read_at = db.Column(db.DateTime, nullable=True) # When is_read was set; delta sync reports reads after a watermark
+
+    alert = db.relationship('Alert', backref=db.backref('receipts', lazy=True, cascade="all, delete-orphan", passive_deletes=True))
+    user = db.relationship('User', backref=db.backref('alert_receipts', lazy=True, cascade="all, delete-orphan"))
+
+    __table_args__ = (db.Index('ix_alert_receipt_user_alert', 'user_id', 'alert_id'),) # A farmer's inbox
+
 
 class CountingRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,9 +76,123 @@ class CountingRecord(db.Model):
     image_file = db.Column(db.String(255), nullable=False) # Path to image
     timestamp = db.Column(db.DateTime, default=ph_time)
     breakdown = db.Column(db.Text, nullable=True) # JSON string
+    # Farmer's location when recorded; rollups and counters are keyed by it (tallies.py)
+    barangay = db.Column(db.String(200), nullable=True)
+    municipality = db.Column(db.String(100), nullable=True)
 
     user = db.relationship('User', backref=db.backref('counts', lazy=True, cascade="all, delete-orphan"))
 
+    __table_args__ = (
+        db.Index('ix_counting_record_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_counting_record_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+
+class CountItem(db.Model):
+    # One row per insect in a CountingRecord breakdown, parsed once at ingest
+    id = db.Column(db.Integer, primary_key=True)
+    counting_record_id = db.Column(db.Integer, db.ForeignKey('counting_record.id'), nullable=False, index=True)
+    insect_name = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    is_beneficial = db.Column(db.Boolean, default=False)
+
+    record = db.relationship('CountingRecord', backref=db.backref('items', lazy=True, cascade="all, delete-orphan"))
+
+class StoredImage(db.Model):
+    # Content-addressed upload, stored once per SHA-256 in each upload folder
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    folder = db.Column(db.String(50), nullable=False, default='UPLOAD_FOLDER') # app.config key the path is relative to
+    path = db.Column(db.String(255), nullable=False) # e.g. "2026/10/ab/ab12...ef.jpg", what records store in image_file
+    size = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=ph_time)
+
+    __table_args__ = (db.UniqueConstraint('sha256', 'folder', name='uq_stored_image_sha_folder'),)
+
+class IdempotencyKey(db.Model):
+    # Client-generated key for a sync upload, so retries replay the original response
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False)
+    endpoint = db.Column(db.String(50), nullable=False) # sync_identify, sync_count
+    record_id = db.Column(db.Integer, nullable=True) # DetectionRecord/CountingRecord created by the first request
+    status_code = db.Column(db.Integer, nullable=False, default=201)
+    response = db.Column(db.Text, nullable=True) # JSON body returned the first time
+    created_at = db.Column(db.DateTime, index=True, default=ph_time)
+
+    __table_args__ = (db.UniqueConstraint('key', 'endpoint', name='uq_idempotency_key_endpoint'),)
+
+class ChunkedUpload(db.Model):
+    # Resumable sync image upload; chunks are appended to <UPLOAD_FOLDER>/.tmp/chunks/<id>.part
+    id = db.Column(db.String(32), primary_key=True) # uuid4 hex, returned to the client as upload_id
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=True)
+    total_size = db.Column(db.Integer, nullable=True) # Declared at init, checked on finalize
+    sha256 = db.Column(db.String(64), nullable=True) # Optional expected digest, checked on finalize
+    chunk_size = db.Column(db.Integer, nullable=False)
+    next_chunk = db.Column(db.Integer, nullable=False, default=0)
+    received_bytes = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='uploading') # uploading, complete
+    record_type = db.Column(db.String(20), nullable=True) # detection, count (set on finalize)
+    record_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=ph_time)
+    updated_at = db.Column(db.DateTime, index=True, default=ph_time, onupdate=ph_time)
+
+class TaskEvent(db.Model):
+    # Pending background task, consumed by worker.py when TASK_QUEUE is 'db'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=ph_time)
+
+    __table_args__ = (db.UniqueConstraint('name', 'key', name='uq_task_event_name_key'),)
+
+class IngestWatermark(db.Model):
+    # Bumped in the same transaction as every record/farmer change, one row per shard of farmers
+    # (see analytics.py); the shards summed version /api/heatmap's ETag
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=ph_time)
+
+class DailyTally(db.Model):
+    # Running pest/beneficial totals per farmer per local (PH) day, kept in step by ingest and deletes
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    pests = db.Column(db.Integer, nullable=False, default=0)
+    beneficials = db.Column(db.Integer, nullable=False, default=0)
+
+    user = db.relationship('User', backref=db.backref('daily_tallies', lazy=True, cascade="all, delete-orphan"))
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='uq_daily_tally_user_day'),)
+
+class DailyRollup(db.Model):
+    # Insect totals per local (PH) day, farmer and insect, with the farmer's barangay/municipality
+    # copied in, so charts and the heatmap group these rows instead of the record tables.
+    # Keyed by the location stamped on each record. Kept in step by ingest and deletes (tallies.py);
+    # check with reconcile_counters.py, rebuild with rebuild_daily_tallies.py
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    barangay = db.Column(db.String(200), nullable=False, default='')
+    municipality = db.Column(db.String(100), nullable=False, default='')
+    insect_name = db.Column(db.String(100), nullable=False)
+    pests = db.Column(db.Integer, nullable=False, default=0) # Summed count where the insect was flagged a pest
+    beneficials = db.Column(db.Integer, nullable=False, default=0)
+    entries = db.Column(db.Integer, nullable=False, default=0) # Detections + count items summed in; row is dropped at 0
+
+    user = db.relationship('User', backref=db.backref('daily_rollups', lazy=True, cascade="all, delete-orphan"))
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'user_id', 'barangay', 'municipality', 'insect_name', name='uq_daily_rollup_key'),
+        db.Index('ix_daily_rollup_user_day', 'user_id', 'day'),
+    )
+
+class InsectCounter(db.Model):
+    # Running pest/beneficial totals over every record, one row for all farms ('*') and one per
+    # farmer municipality. Kept in step by ingest and deletes (tallies.py); check with reconcile_counters.py
+    municipality = db.Column(db.String(100), primary_key=True)
+    pests = db.Column(db.Integer, nullable=False, default=0)
+    beneficials = db.Column(db.Integer, nullable=False, default=0)
+
 class Recommendation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
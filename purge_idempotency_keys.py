@@ -0,0 +1,19 @@
+"""
+Deletes sync idempotency keys older than the retry window (default 7 days)
+Clients only retry recent uploads, so old keys can be dropped to keep the table small.
+Usage: python purge_idempotency_keys.py [days]
+"""
+import sys
+from datetime import timedelta
+from app import app, db
+from models import IdempotencyKey, ph_time
+
+def purge_idempotency_keys(days=7):
+    with app.app_context():
+        cutoff = ph_time() - timedelta(days=days)
+        deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        print(f"✓ Deleted {deleted} idempotency keys older than {days} days.")
+
+if __name__ == "__main__":
+    purge_idempotency_keys(int(sys.argv[1]) if len(sys.argv) > 1 else 7)
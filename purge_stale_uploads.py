@@ -0,0 +1,14 @@
+"""
+Deletes resumable uploads that were abandoned mid-way (default: untouched for 48 hours)
+together with their partial temp files, and old finished upload rows.
+Usage: python purge_stale_uploads.py [hours]
+"""
+import sys
+from app import app
+from uploads import purge_stale_uploads, STALE_UPLOAD_HOURS
+
+if __name__ == "__main__":
+    hours = int(sys.argv[1]) if len(sys.argv) > 1 else STALE_UPLOAD_HOURS
+    with app.app_context():
+        deleted = purge_stale_uploads(hours)
+        print(f"✓ Deleted {deleted} uploads idle for more than {hours} hours.")
@@ -0,0 +1,159 @@
+"""
+Push notifications (Firebase Cloud Messaging) for alerts.
+
+A broadcast looks up every recipient's token in one query and sends them as
+multicast messages of up to 500 tokens (the FCM limit). Several chunks are in
+flight at once on a small thread pool, and tokens FCM rejects are cleared with
+one UPDATE. Each call returns a PushResult summary.
+
+FCM_BACKEND 'fake' (SPIM_FCM_BACKEND=fake) swaps Firebase for FakeMessaging,
+which answers like FCM after a simulated delay. Use it for local runs and for
+benchmark_fcm.py.
+"""
+import time
+import uuid
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+import firebase_admin
+from firebase_admin import messaging
+from models import db, User
+
+MULTICAST_LIMIT = 500 # Tokens per multicast message (FCM maximum)
+INVALID_TOKEN_ERRORS = ('registration-token-not-registered', 'invalid-registration-token')
+
+@dataclass(frozen=True)
+class PushResult:
+    recipients: int # Users asked for
+    tokens: int # Distinct device tokens found
+    sent: int
+    failed: int
+    tokens_cleared: int # Invalid tokens removed from their users
+    chunks: int
+    seconds: float
+
+    def __str__(self):
+        return (f"{self.sent}/{self.tokens} delivered, {self.failed} failed, {self.tokens_cleared} tokens cleared "
+                f"({self.recipients} recipients, {self.chunks} chunks, {self.seconds:.2f}s)")
+
+
+class FakeMessaging:
+    """
+    Stands in for firebase_admin.messaging: every call takes `latency` seconds plus
+    `per_token` seconds per token. Tokens starting with 'invalid' fail as unregistered.
+    """
+    def __init__(self, latency=0.1, per_token=0.0005):
+        self.latency = latency
+        self.per_token = per_token
+        self.calls = 0
+
+    def _respond(self, token):
+        if token.startswith('invalid'):
+            error = messaging.UnregisteredError('Requested entity was not found. (registration-token-not-registered)')
+            return messaging.SendResponse(None, error)
+        return messaging.SendResponse({'name': f'projects/fake/messages/{uuid.uuid4().hex}'}, None)
+
+    def send(self, message):
+        self.calls += 1
+        time.sleep(self.latency + self.per_token)
+        response = self._respond(message.token)
+        if response.exception:
+            raise response.exception
+        return response.message_id
+
+    def send_each_for_multicast(self, multicast_message):
+        self.calls += 1
+        time.sleep(self.latency + self.per_token * len(multicast_message.tokens))
+        return messaging.BatchResponse([self._respond(token) for token in multicast_message.tokens])
+
+
+class PushSender:
+    def __init__(self, app=None):
+        self.backend = None
+        self.max_workers = 2
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        app.config.setdefault('FCM_BACKEND', 'firebase')
+        # Chunks in flight per broadcast. firebase-admin already sends each chunk with one thread per token.
+        app.config.setdefault('FCM_MAX_WORKERS', 2)
+        self.max_workers = app.config['FCM_MAX_WORKERS']
+        if backend is not None:
+            self.backend = backend
+        elif app.config['FCM_BACKEND'] == 'fake':
+            self.backend = FakeMessaging()
+            print("✓ FCM: using the fake messaging backend")
+        else:
+            self.backend = messaging
+
+    def send(self, user_ids, title, body, data=None):
+        """
+        Pushes a notification to the users' devices and clears the tokens FCM rejects
+        (commits). Returns a PushResult, or None if Firebase isn't initialized.
+        """
+        if not isinstance(user_ids, list):
+            user_ids = [user_ids]
+        if self.backend is messaging and not firebase_admin._apps:
+            print("⚠ FCM: Firebase not initialized, skipping push notification")
+            return None
+
+        started = time.perf_counter()
+        tokens = sorted({token for (token,) in db.session.query(User.fcm_token)
+                         .filter(User.id.in_(user_ids), User.fcm_token.isnot(None), User.fcm_token != '')})
+        chunks = [tokens[i:i + MULTICAST_LIMIT] for i in range(0, len(tokens), MULTICAST_LIMIT)]
+
+        sent, invalid, failed = 0, [], 0
+        if chunks:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                results = pool.map(lambda chunk: self._send_chunk(chunk, title, body, data), chunks)
+                for chunk_sent, chunk_invalid, chunk_failed in results:
+                    sent += chunk_sent
+                    invalid += chunk_invalid
+                    failed += chunk_failed
+
+        cleared = 0
+        if invalid:
+            cleared = User.query.filter(User.fcm_token.in_(invalid))\
+                .update({'fcm_token': None}, synchronize_session=False)
+            db.session.commit()
+
+        result = PushResult(len(user_ids), len(tokens), sent, failed, cleared, len(chunks),
+                            time.perf_counter() - started)
+        print(f"{'✓' if failed == len(invalid) else '✗'} FCM broadcast: {result}")
+        return result
+
+    def _send_chunk(self, tokens, title, body, data):
+        """
+        (sent, invalid tokens, failed) for one multicast message. Runs on the pool, so no DB access.
+        """
+        message = messaging.MulticastMessage(
+            tokens=tokens,
+            notification=messaging.Notification(
+                title=title,
+                body=body,
+            ),
+            data=data or {},
+            android=messaging.AndroidConfig(
+                priority='high',
+                notification=messaging.AndroidNotification(
+                    channel_id='SPIM_ALERTS',
+                    priority='max',
+                    sound='default',
+                )
+            )
+        )
+        try:
+            response = self.backend.send_each_for_multicast(message)
+        except Exception as e:
+            print(f"✗ FCM chunk of {len(tokens)} tokens failed: {e}")
+            return 0, [], len(tokens)
+
+        invalid = []
+        for token, send_response in zip(tokens, response.responses):
+            error = send_response.exception
+            if error is not None and (isinstance(error, messaging.UnregisteredError)
+                                      or any(code in str(error) for code in INVALID_TOKEN_ERRORS)):
+                invalid.append(token)
+        return response.success_count, invalid, response.failure_count
+
+push_sender = PushSender()
@@ -0,0 +1,12 @@
+"""
+Rebuilds the per-farmer daily tallies and the chart/heatmap rollup (DailyTally, DailyRollup) from scratch
+Run once after upgrading, or whenever records were changed outside the app.
+"""
+from app import app, db
+from tallies import rebuild_daily_tallies
+
+if __name__ == "__main__":
+    with app.app_context():
+        db.create_all() # Make sure the tally/rollup tables exist
+        days, rollup_rows = rebuild_daily_tallies()
+        print(f"✓ Rebuilt {days} farmer-day tallies ({rollup_rows} rollup rows).")
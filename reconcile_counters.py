@@ -0,0 +1,35 @@
+"""
+Checks the running pest/beneficial counters (InsectCounter, read by /api/stats/dashboard)
+and the daily tables (DailyTally, DailyRollup, read by the threshold check, charts and
+heatmap) against the detection and counting records, and prints every row that drifted.
+Run with --fix to rewrite them from the records (also needed once after upgrading).
+Usage: python reconcile_counters.py [--fix]
+"""
+import sys
+from app import app, db
+from tallies import reconcile_counters, reconcile_daily_tallies, ALL_MUNICIPALITIES
+
+if __name__ == "__main__":
+    fix = '--fix' in sys.argv[1:]
+    with app.app_context():
+        db.create_all() # Make sure the counters table exists
+        drift = reconcile_counters(fix=fix)
+        for municipality, stored, expected in drift:
+            label = 'All farms' if municipality == ALL_MUNICIPALITIES else (municipality or '(none)')
+            print(f"✗ {label}: stored {stored[0]} pests / {stored[1]} beneficials, "
+                  f"records have {expected[0]} / {expected[1]}")
+
+        daily_drift = reconcile_daily_tallies(fix=fix)
+        for table, key, stored, expected in daily_drift[:50]:
+            print(f"✗ {table} {key}: stored {stored}, records have {expected}")
+        if len(daily_drift) > 50:
+            print(f"  ... and {len(daily_drift) - 50} more daily rows")
+
+        rows = len(drift) + len(daily_drift)
+        if not rows:
+            print("✓ Counters and daily rollups match the records.")
+        elif fix:
+            print(f"✓ Rewrote the counters and daily rollups ({rows} rows had drifted).")
+        else:
+            print(f"✗ {rows} rows drifted. Run with --fix to rewrite them.")
+            sys.exit(1)
@@ -1,4 +1,5 @@
-from app import app, db, User, DetectionRecord, CountingRecord, NAIC_BARANGAY_COORDS, check_infestation_threshold
+from app import app, db, User, DetectionRecord, CountingRecord, NAIC_BARANGAY_COORDS, check_infestation_threshold, build_count_items
+from tallies import add_to_tally
 import random
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
@@ -84,6 +85,7 @@ def seed_data():
                     timestamp=record_time
                 )
                 db.session.add(record)
+                add_to_tally(record)
                 
             # If we still need more pests for the scenario, add them as a Group Count
             if pests_to_add > 0:
@@ -98,7 +100,9 @@ def seed_data():
                     breakdown=json.dumps(breakdown),
                     timestamp=record_time
                 )
+                build_count_items(c_record)
                 db.session.add(c_record)
+                add_to_tally(c_record)
 
             # Add some beneficials too (just for realism)
             for _ in range(random.randint(0, 3)):
@@ -115,6 +119,7 @@ def seed_data():
                     timestamp=record_time
                 )
                 db.session.add(record)
+                add_to_tally(record)
             
             # Commit all records for this user
             db.session.commit()
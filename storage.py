@@ -0,0 +1,182 @@
+"""
+Content-addressed image storage for sync and recommendation uploads.
+Uploads are streamed to a local temp file while their SHA-256 is computed and stored
+once per hash under <YYYY>/<MM>/<hash[:2]>/<hash>.<ext> in the configured storage
+backend (see storage_backends.py). Re-uploading the same bytes reuses the stored file.
+"""
+import os
+import uuid
+import hashlib
+from flask import current_app
+from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
+from models import db, StoredImage, DetectionRecord, CountingRecord, Recommendation, ph_time
+from images import variant_path, remove_variants
+from storage_backends import get_storage
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_EXTENSION = '.jpg'
+TMP_DIR_NAME = '.tmp'
+
+def image_extension(filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return ext or DEFAULT_EXTENSION
+
+def hashed_path(sha, filename, when=None):
+    """
+    Storage key for a digest, e.g. "2026/10/ab/ab12...ef.jpg".
+    Sharded by month of first upload, then by hash prefix, so no directory grows unbounded.
+    """
+    when = when or ph_time()
+    return f"{when:%Y/%m}/{sha[:2]}/{sha}{image_extension(filename)}"
+
+def is_sharded_path(path):
+    """
+    True for keys in the <YYYY>/<MM>/<hash[:2]>/ layout.
+    """
+    parts = path.split('/')
+    return len(parts) == 4 and parts[0].isdigit() and len(parts[0]) == 4 \
+        and parts[1].isdigit() and len(parts[1]) == 2
+
+def store_image(file, folder='UPLOAD_FOLDER'):
+    """
+    Streams an uploaded file to disk while hashing it and records it in StoredImage.
+    Returns (image, created). created is False when the same bytes were already
+    stored, in which case the temp copy is dropped and the existing path is reused.
+    The StoredImage row is only added to the session; the caller commits.
+    """
+    root = current_app.config[folder]
+    tmp_dir = os.path.join(root, TMP_DIR_NAME)
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+    stream = file.stream
+    if stream.seekable():
+        stream.seek(0) # The same file part may be referenced twice (batch sync)
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_path, 'wb') as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+
+    return place_image(tmp_path, digest.hexdigest(), size, file.filename, folder)
+
+def file_sha256(path):
+    """
+    Returns (sha256 hex digest, size) of a file on disk.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+def store_local_file(src_path, filename, folder='UPLOAD_FOLDER', sha=None):
+    """
+    Same as store_image for a file already on disk under the upload folder
+    (e.g. an assembled chunked upload). The file is moved, not copied.
+    Pass sha if the file was already hashed.
+    """
+    if sha is None:
+        sha, size = file_sha256(src_path)
+    else:
+        size = os.path.getsize(src_path)
+    return place_image(src_path, sha, size, filename, folder)
+
+def place_image(tmp_path, sha, size, filename, folder):
+    """
+    Moves a hashed temp file to its content-addressed path, or drops it if the
+    digest is already stored (also when a concurrent request stores it first).
+    Returns (image, created).
+    """
+    storage = get_storage()
+    image = StoredImage.query.filter_by(sha256=sha, folder=folder).first()
+    if image and storage.exists(folder, image.path):
+        os.remove(tmp_path)
+        return image, False
+
+    rel_path = image.path if image else hashed_path(sha, filename)
+    storage.save_file(folder, rel_path, tmp_path)
+
+    if image:
+        return image, False # Row existed but the file had gone missing; restored it
+
+    try:
+        # Savepoint: a concurrent upload of the same bytes may have committed the row meanwhile
+        with db.session.begin_nested():
+            image = StoredImage(sha256=sha, folder=folder, path=rel_path, size=size)
+            db.session.add(image)
+    except IntegrityError:
+        image = StoredImage.query.filter_by(sha256=sha, folder=folder).one()
+        if image.path != rel_path:
+            storage.delete(folder, rel_path) # Same bytes, stored under the other request's path
+        return image, False
+    return image, True
+
+def is_image_referenced(path, folder='UPLOAD_FOLDER'):
+    if folder == 'RECOMMENDATION_FOLDER':
+        return Recommendation.query.filter_by(image_path=path).first() is not None
+    return DetectionRecord.query.filter_by(image_file=path).first() is not None \
+        or CountingRecord.query.filter_by(image_file=path).first() is not None
+
+def release_images(paths, folder='UPLOAD_FOLDER'):
+    """
+    Deletes stored images that no record references anymore.
+    Call after the referencing records have been deleted and committed,
+    since deduplicated files can be shared by several records.
+    Returns the number of files removed.
+    """
+    storage = get_storage()
+    removed = 0
+    for path in set(p for p in paths if p):
+        if is_image_referenced(path, folder):
+            continue
+        StoredImage.query.filter_by(folder=folder, path=path).delete()
+        try:
+            if storage.delete(folder, path):
+                removed += 1
+        except OSError as e:
+            print(f"✗ Could not delete image {path}: {e}")
+        remove_variants(folder, path)
+    db.session.commit()
+    return removed
+
+def discard_files(paths, folder='UPLOAD_FOLDER'):
+    """
+    Removes files written by a request whose transaction was rolled back.
+    Files that a concurrent request has since committed to StoredImage are kept.
+    """
+    storage = get_storage()
+    for path in paths:
+        if StoredImage.query.filter_by(folder=folder, path=path).first():
+            continue
+        try:
+            storage.delete(folder, path)
+        except OSError:
+            pass
+        remove_variants(folder, path)
+
+def image_url(path, variant=None, folder='UPLOAD_FOLDER'):
+    """
+    Public URL for a stored image. With a variant ('thumb' or 'preview') the
+    downscaled WebP is used once it exists, otherwise the original.
+    """
+    if not path:
+        return ''
+    storage = get_storage()
+    if variant:
+        small = variant_path(path, variant)
+        if storage.exists(folder, small):
+            path = small
+    return storage.url(folder, path)
@@ -0,0 +1,175 @@
+"""
+Storage backends for uploaded images. Keys are the relative paths that records store
+(e.g. "2026/10/ab/ab12...ef.jpg"); `folder` is the app.config key naming the upload
+area ('UPLOAD_FOLDER' or 'RECOMMENDATION_FOLDER').
+
+Chosen with app.config['STORAGE_BACKEND'] (env SPIM_STORAGE_BACKEND):
+    local - files under the configured folders, served from /static (default)
+    s3    - any S3-compatible object store. Set SPIM_S3_ENDPOINT_URL to use a local
+            stand-in such as MinIO (docker run -p 9000:9000 minio/minio server /data).
+
+All backend methods raise OSError (FileNotFoundError for missing keys) on failure.
+"""
+import io
+import os
+from flask import current_app, url_for
+
+try:
+    import boto3
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:
+    boto3 = None
+
+# Where each upload area lives under /static (local) or the bucket prefix (s3)
+FOLDER_PREFIXES = {
+    'UPLOAD_FOLDER': 'uploads/',
+    'RECOMMENDATION_FOLDER': 'uploads/recommendations/',
+}
+
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+}
+
+def content_type(key):
+    return CONTENT_TYPES.get(os.path.splitext(key)[1].lower(), 'application/octet-stream')
+
+class LocalStorage:
+    name = 'local'
+
+    def __init__(self, config):
+        self.config = config
+
+    def full_path(self, folder, key):
+        return os.path.join(self.config[folder], key)
+
+    def save_file(self, folder, key, src_path):
+        """
+        Moves a local temp file to `key`. The temp file must be on the same filesystem.
+        """
+        dest = self.full_path(folder, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src_path, dest)
+
+    def save_bytes(self, folder, key, data):
+        dest = self.full_path(folder, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + '.part'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, dest)
+
+    def open(self, folder, key):
+        return open(self.full_path(folder, key), 'rb')
+
+    def exists(self, folder, key):
+        return os.path.isfile(self.full_path(folder, key))
+
+    def delete(self, folder, key):
+        try:
+            os.remove(self.full_path(folder, key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def url(self, folder, key):
+        return url_for('static', filename=FOLDER_PREFIXES[folder] + key)
+
+class S3Storage:
+    name = 's3'
+
+    def __init__(self, config, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("STORAGE_BACKEND is 's3' but boto3 is not installed (pip install boto3)")
+            client = boto3.client(
+                's3',
+                endpoint_url=config.get('S3_ENDPOINT_URL') or None,
+                region_name=config.get('S3_REGION') or None
+            ) # Credentials come from the usual AWS_* environment variables
+        self.client = client
+        self.bucket = config['S3_BUCKET']
+        self.prefix = config.get('S3_PREFIX', '')
+        self.public_url = (config.get('S3_PUBLIC_URL') or '').rstrip('/')
+        self.url_expiry = config.get('S3_URL_EXPIRY', 3600)
+        self._known = set() # Keys seen to exist, so page renders don't HEAD every variant again
+
+    def object_key(self, folder, key):
+        return f"{self.prefix}{FOLDER_PREFIXES[folder]}{key}"
+
+    def _call(self, method, **kwargs):
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, **kwargs)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(kwargs.get('Key')) from e
+            raise OSError(f"S3 {method} failed: {e}") from e
+        except BotoCoreError as e:
+            raise OSError(f"S3 {method} failed: {e}") from e
+
+    def save_file(self, folder, key, src_path):
+        with open(src_path, 'rb') as f:
+            self.save_bytes(folder, key, f)
+        os.remove(src_path)
+
+    def save_bytes(self, folder, key, data):
+        self._call('put_object', Key=self.object_key(folder, key), Body=data, ContentType=content_type(key))
+        self._known.add((folder, key))
+
+    def open(self, folder, key):
+        body = self._call('get_object', Key=self.object_key(folder, key))['Body']
+        return io.BytesIO(body.read())
+
+    def exists(self, folder, key):
+        if (folder, key) in self._known:
+            return True
+        try:
+            self._call('head_object', Key=self.object_key(folder, key))
+        except FileNotFoundError:
+            return False
+        self._known.add((folder, key))
+        return True
+
+    def delete(self, folder, key):
+        self._known.discard((folder, key))
+        self._call('delete_object', Key=self.object_key(folder, key))
+        return True
+
+    def url(self, folder, key):
+        if self.public_url:
+            return f"{self.public_url}/{self.object_key(folder, key)}"
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self.object_key(folder, key)},
+            ExpiresIn=self.url_expiry
+        )
+
+BACKENDS = {
+    'local': LocalStorage,
+    's3': S3Storage,
+}
+
+def init_storage(app):
+    """
+    Creates the configured backend and attaches it to the app.
+    """
+    app.config.setdefault('STORAGE_BACKEND', 'local')
+    app.config.setdefault('S3_BUCKET', None)
+    app.config.setdefault('S3_ENDPOINT_URL', None)
+    app.config.setdefault('S3_REGION', None)
+    app.config.setdefault('S3_PREFIX', '')
+    app.config.setdefault('S3_PUBLIC_URL', None)
+    app.extensions['spim_storage'] = make_backend(app.config['STORAGE_BACKEND'], app.config)
+
+def make_backend(name, config):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    return BACKENDS[name](config)
+
+def get_storage():
+    return current_app.extensions['spim_storage']
@@ -0,0 +1,259 @@
+"""
+Per-farmer daily pest tallies (DailyTally), the per-insect rollup (DailyRollup) and
+the all-time pest/beneficial counters (InsectCounter).
+
+Ingest adds each new record to its owner's tally for the record's local (PH) day and
+deletes subtract it again, inside the same transaction as the record change. The
+threshold check then reads a single row instead of recounting the whole day, and
+charts/heatmap group a few rollup rows per farmer-day instead of every record.
+Increments are INSERT ... ON CONFLICT DO UPDATE statements, so concurrent uploads
+for the same farmer and day don't lose updates.
+
+Rollup rows and counters are keyed by the location stamped on each record when it is
+first tallied (the farmer's barangay/municipality at the time), so a later change to
+the farmer's profile doesn't leave deletes subtracting from rows that don't exist.
+
+If the tables drift (records changed outside the app), run: python reconcile_counters.py --fix
+(or python rebuild_daily_tallies.py for the daily tables alone)
+"""
+from datetime import date
+from sqlalchemy import func
+from models import db, User, DetectionRecord, CountingRecord, CountItem, DailyTally, DailyRollup, InsectCounter
+
+ALL_MUNICIPALITIES = '*' # InsectCounter row summing every farm
+
+def upsert_insert(model):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def increment(model, keys, counters, rows):
+    """
+    Adds each row's counters to the existing row with the same keys, or inserts it.
+    """
+    if not rows:
+        return
+    stmt = upsert_insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + stmt.excluded[name] for name in counters}
+    )
+    db.session.execute(stmt)
+
+def record_insects(record):
+    """
+    (insect_name, is_beneficial, count) entries a record contributes to the tally.
+    """
+    if isinstance(record, DetectionRecord):
+        return [(record.insect_name, bool(record.is_beneficial), 1)]
+    return [(item.insect_name, bool(item.is_beneficial), item.count or 0) for item in record.items]
+
+def record_location(record):
+    """
+    (barangay, municipality) a record is tallied under. Stamped from the farmer's
+    profile the first time; records from before the stamp get it on their next use.
+    """
+    if record.barangay is None and record.municipality is None:
+        user = db.session.get(User, int(record.user_id))
+        record.barangay = (user.street_barangay if user else '') or ''
+        record.municipality = (user.municipality if user else '') or ''
+    return record.barangay or '', record.municipality or ''
+
+def apply_to_tally(record, sign=1):
+    """
+    Adds (sign=1) or subtracts (sign=-1) one detection/counting record. The record
+    needs user_id and timestamp set. Runs in the caller's transaction.
+    """
+    user_id = int(record.user_id)
+    day = record.timestamp.date()
+    barangay, municipality = record_location(record)
+
+    per_insect = {}
+    for name, beneficial, count in record_insects(record):
+        entry = per_insect.setdefault(name, {'pests': 0, 'beneficials': 0, 'entries': 0})
+        entry['beneficials' if beneficial else 'pests'] += sign * count
+        entry['entries'] += sign
+
+    increment(DailyTally, ['user_id', 'day'], ['pests', 'beneficials'],
+              [{'user_id': user_id, 'day': day,
+                'pests': sum(e['pests'] for e in per_insect.values()),
+                'beneficials': sum(e['beneficials'] for e in per_insect.values())}])
+    increment(DailyRollup, ['day', 'user_id', 'barangay', 'municipality', 'insect_name'],
+              ['pests', 'beneficials', 'entries'],
+              [{'day': day, 'user_id': user_id, 'barangay': barangay, 'municipality': municipality,
+                'insect_name': name, **entry} for name, entry in per_insect.items()])
+    add_to_counters(municipality,
+                    sum(e['pests'] for e in per_insect.values()),
+                    sum(e['beneficials'] for e in per_insect.values()))
+    if sign < 0:
+        # Drop rollup rows nothing contributes to any more, so charts don't keep empty days
+        DailyRollup.query.filter(DailyRollup.user_id == user_id, DailyRollup.day == day,
+                                 DailyRollup.entries <= 0).delete(synchronize_session=False)
+
+def add_to_tally(record):
+    apply_to_tally(record, 1)
+
+def remove_from_tally(record):
+    apply_to_tally(record, -1)
+
+def add_to_counters(municipality, pests, beneficials):
+    """
+    Adds to the all-farms counter and the municipality's (negative values subtract).
+    """
+    if not (pests or beneficials):
+        return
+    increment(InsectCounter, ['municipality'], ['pests', 'beneficials'],
+              [{'municipality': key, 'pests': pests, 'beneficials': beneficials}
+               for key in (ALL_MUNICIPALITIES, municipality or '')])
+
+def remove_farmer_from_counters(user_id):
+    """
+    Subtracts everything a farmer contributed, before the farmer (and with them their
+    records and rollup rows) is deleted. Runs in the caller's transaction.
+    """
+    rows = db.session.query(DailyRollup.municipality, func.sum(DailyRollup.pests), func.sum(DailyRollup.beneficials))\
+        .filter(DailyRollup.user_id == user_id).group_by(DailyRollup.municipality).all()
+    for municipality, pests, beneficials in rows:
+        add_to_counters(municipality, -int(pests or 0), -int(beneficials or 0))
+
+def get_counters(municipality=None):
+    """
+    (pests, beneficials) over all farms, or one municipality's farms.
+    """
+    row = db.session.get(InsectCounter, ALL_MUNICIPALITIES if municipality is None else municipality)
+    return (row.pests, row.beneficials) if row else (0, 0)
+
+def pests_on(user_id, day):
+    return db.session.query(DailyTally.pests).filter_by(user_id=user_id, day=day).scalar() or 0
+
+def as_date(value):
+    # SQLite returns func.date() as a string
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def record_location_columns(model):
+    # The stamped location, falling back to the farmer's profile for unstamped records
+    return (func.coalesce(model.barangay, User.street_barangay, ''),
+            func.coalesce(model.municipality, User.municipality, ''))
+
+def count_daily_tallies():
+    """
+    DailyTally and DailyRollup rows recomputed from the records with GROUP BY queries:
+    ({(user_id, day): (pests, beneficials)},
+     {(day, user_id, barangay, municipality, insect_name): (pests, beneficials, entries)}).
+    """
+    detection_location = record_location_columns(DetectionRecord)
+    count_location = record_location_columns(CountingRecord)
+    detection_rows = db.session.query(
+        DetectionRecord.user_id, func.date(DetectionRecord.timestamp), *detection_location,
+        DetectionRecord.insect_name, DetectionRecord.is_beneficial,
+        func.count(DetectionRecord.id), func.count(DetectionRecord.id)
+    ).outerjoin(User, User.id == DetectionRecord.user_id)\
+     .group_by(DetectionRecord.user_id, func.date(DetectionRecord.timestamp), *detection_location,
+               DetectionRecord.insect_name, DetectionRecord.is_beneficial)
+    count_rows = db.session.query(
+        CountingRecord.user_id, func.date(CountingRecord.timestamp), *count_location,
+        CountItem.insect_name, CountItem.is_beneficial,
+        func.sum(CountItem.count), func.count(CountItem.id)
+    ).join(CountItem, CountItem.counting_record_id == CountingRecord.id)\
+     .outerjoin(User, User.id == CountingRecord.user_id)\
+     .group_by(CountingRecord.user_id, func.date(CountingRecord.timestamp), *count_location,
+               CountItem.insect_name, CountItem.is_beneficial)
+
+    tallies = {}
+    rollups = {}
+    for rows in (detection_rows, count_rows):
+        for user_id, day, barangay, municipality, name, beneficial, count, entries in rows:
+            day = as_date(day)
+            rollup = rollups.setdefault((day, user_id, barangay, municipality, name), [0, 0, 0])
+            tally = tallies.setdefault((user_id, day), [0, 0])
+            column = 1 if beneficial else 0
+            rollup[column] += count or 0
+            rollup[2] += entries
+            tally[column] += count or 0
+    return ({key: tuple(value) for key, value in tallies.items()},
+            {key: tuple(value) for key, value in rollups.items()})
+
+def rebuild_daily_tallies():
+    """
+    Rewrites DailyTally and DailyRollup from the records. Returns the row counts.
+    """
+    tallies, rollups = count_daily_tallies()
+    DailyRollup.query.delete()
+    DailyTally.query.delete()
+    db.session.bulk_insert_mappings(DailyTally, [
+        {'user_id': user_id, 'day': day, 'pests': pests, 'beneficials': beneficials}
+        for (user_id, day), (pests, beneficials) in tallies.items()
+    ])
+    db.session.bulk_insert_mappings(DailyRollup, [
+        {'day': day, 'user_id': user_id, 'barangay': barangay, 'municipality': municipality,
+         'insect_name': name, 'pests': pests, 'beneficials': beneficials, 'entries': entries}
+        for (day, user_id, barangay, municipality, name), (pests, beneficials, entries) in rollups.items()
+    ])
+    db.session.commit()
+    return len(tallies), len(rollups)
+
+def reconcile_daily_tallies(fix=False):
+    """
+    Compares DailyTally and DailyRollup with the records. Returns [(table, key, stored,
+    expected)] for every row that differs; with fix=True both tables are rebuilt.
+    """
+    expected_tallies, expected_rollups = count_daily_tallies()
+    stored_tallies = {(row.user_id, row.day): (row.pests, row.beneficials) for row in DailyTally.query}
+    stored_rollups = {(row.day, row.user_id, row.barangay, row.municipality, row.insect_name):
+                      (row.pests, row.beneficials, row.entries) for row in DailyRollup.query}
+
+    drift = []
+    for table, stored, expected, empty in (('DailyTally', stored_tallies, expected_tallies, (0, 0)),
+                                           ('DailyRollup', stored_rollups, expected_rollups, (0, 0, 0))):
+        drift += [(table, key, stored.get(key, empty), expected.get(key, empty))
+                  for key in sorted(set(stored) | set(expected), key=str)
+                  if stored.get(key, empty) != expected.get(key, empty)]
+    if fix and drift:
+        rebuild_daily_tallies()
+    return drift
+
+def count_counters():
+    """
+    InsectCounter values recomputed from the records: {municipality: (pests, beneficials)},
+    including the ALL_MUNICIPALITIES row.
+    """
+    detection_municipality = record_location_columns(DetectionRecord)[1]
+    count_municipality = record_location_columns(CountingRecord)[1]
+    detection_rows = db.session.query(
+        detection_municipality, DetectionRecord.is_beneficial, func.count(DetectionRecord.id)
+    ).select_from(DetectionRecord).outerjoin(User, User.id == DetectionRecord.user_id)\
+     .group_by(detection_municipality, DetectionRecord.is_beneficial)
+    count_rows = db.session.query(
+        count_municipality, CountItem.is_beneficial, func.sum(CountItem.count)
+    ).select_from(CountItem).join(CountingRecord, CountingRecord.id == CountItem.counting_record_id)\
+     .outerjoin(User, User.id == CountingRecord.user_id)\
+     .group_by(count_municipality, CountItem.is_beneficial)
+
+    totals = {ALL_MUNICIPALITIES: [0, 0]}
+    for rows in (detection_rows, count_rows):
+        for municipality, beneficial, count in rows:
+            for key in (ALL_MUNICIPALITIES, municipality or ''):
+                totals.setdefault(key, [0, 0])[1 if beneficial else 0] += int(count or 0)
+    return {key: tuple(value) for key, value in totals.items()}
+
+def reconcile_counters(fix=False):
+    """
+    Compares InsectCounter with the records. Returns [(municipality, stored, expected)]
+    for every row that differs; with fix=True the table is rewritten and committed.
+    """
+    expected = count_counters()
+    stored = {row.municipality: (row.pests, row.beneficials) for row in InsectCounter.query}
+    drift = [(key, stored.get(key, (0, 0)), expected.get(key, (0, 0)))
+             for key in sorted(set(expected) | set(stored))
+             if stored.get(key, (0, 0)) != expected.get(key, (0, 0))]
+    if fix and drift:
+        InsectCounter.query.delete()
+        db.session.bulk_insert_mappings(InsectCounter, [
+            {'municipality': key, 'pests': pests, 'beneficials': beneficials}
+            for key, (pests, beneficials) in expected.items()
+        ])
+        db.session.commit()
+    return drift
@@ -0,0 +1,143 @@
+"""
+Background work queue for jobs that should not run on the request path
+(infestation threshold checks, alert fan-out, ...).
+
+Backends, chosen with app.config['TASK_QUEUE'] (env SPIM_TASK_QUEUE):
+    thread - in-process worker pool (default)
+    db     - events are stored in the TaskEvent table and run by a separate
+             worker process (python worker.py)
+    inline - run immediately in the caller (scripts, debugging)
+
+Events are coalesced per (task, key): enqueueing a user that is already waiting
+is a no-op, and a user enqueued while their task is running gets exactly one rerun.
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from models import db, TaskEvent
+
+class TaskQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.handlers = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()
+        self._running = set()
+        self._rerun = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TASK_QUEUE', 'thread')
+        app.config.setdefault('TASK_WORKERS', 2)
+        app.config.setdefault('TASK_POLL_INTERVAL', 1.0)
+        self.app = app
+
+    @property
+    def backend(self):
+        return self.app.config['TASK_QUEUE']
+
+    def task(self, name):
+        """
+        Decorator registering a handler. Handlers receive the event key as a string
+        and run inside an application context.
+        """
+        def decorator(func):
+            self.handlers[name] = func
+            return func
+        return decorator
+
+    def enqueue(self, name, key):
+        """
+        Schedules handler `name` for `key`. Returns False if the event was coalesced
+        into one that is already waiting.
+        """
+        if name not in self.handlers:
+            raise KeyError(f"Unknown task: {name}")
+        key = str(key)
+
+        if self.backend == 'inline':
+            self.handlers[name](key)
+            return True
+        if self.backend == 'db':
+            return self._enqueue_db(name, key)
+        return self._enqueue_thread(name, key)
+
+    # --- In-process worker pool ---
+    def _enqueue_thread(self, name, key):
+        event = (name, key)
+        with self._lock:
+            if event in self._pending:
+                return False
+            if event in self._running:
+                self._rerun.add(event)
+                return False
+            self._pending.add(event)
+            if self._executor is None:
+                # Created lazily so each forked server worker gets its own pool
+                self._executor = ThreadPoolExecutor(max_workers=self.app.config['TASK_WORKERS'],
+                                                    thread_name_prefix='spim-task')
+        self._executor.submit(self._run_thread_event, event)
+        return True
+
+    def _run_thread_event(self, event):
+        with self._lock:
+            self._pending.discard(event)
+            self._running.add(event)
+        try:
+            self._run(*event)
+        finally:
+            with self._lock:
+                self._running.discard(event)
+                rerun = event in self._rerun
+                self._rerun.discard(event)
+            if rerun:
+                self._enqueue_thread(*event)
+
+    def _run(self, name, key):
+        with self.app.app_context():
+            try:
+                self.handlers[name](key)
+            except Exception as e:
+                db.session.rollback()
+                print(f"✗ Task {name}({key}) failed: {e}")
+
+    # --- Separate worker process (TaskEvent table) ---
+    def _enqueue_db(self, name, key):
+        if TaskEvent.query.filter_by(name=name, key=key).first():
+            return False
+        db.session.add(TaskEvent(name=name, key=key))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback() # Another request queued the same event first
+            return False
+        return True
+
+    def run_worker(self, batch_size=50):
+        """
+        Worker process loop for the db backend. Each event is claimed by deleting
+        its row, so several workers can poll the same table.
+        """
+        print(f"[OK] Task worker started ({len(self.handlers)} handlers)")
+        while True:
+            with self.app.app_context():
+                events = TaskEvent.query.order_by(TaskEvent.id).limit(batch_size).all()
+                claimed = []
+                for event in events:
+                    if TaskEvent.query.filter_by(id=event.id).delete() == 1:
+                        claimed.append((event.name, event.key))
+                db.session.commit()
+
+            for name, key in claimed:
+                if name in self.handlers:
+                    self._run(name, key)
+                else:
+                    print(f"✗ No handler for task {name}, dropping event")
+
+            if not claimed:
+                time.sleep(self.app.config['TASK_POLL_INTERVAL'])
+
+task_queue = TaskQueue()
@@ -86,5 +86,35 @@ def test_notifications():
     except urllib.error.HTTPError as e:
         print(f"Error: {e.code} - {e.read().decode('utf-8')}")
 
+    # 5. Delta sync: ?since= returns only changes, If-None-Match an unchanged inbox costs a 304
+    print(f"Testing /api/notifications?user_id={user_id}&since=0")
+    try:
+        with urllib.request.urlopen(f"{BASE_URL}/api/notifications?user_id={user_id}&since=0") as response:
+            json_data = json.loads(response.read().decode('utf-8'))
+            etag = response.headers.get('ETag')
+            print(f"Response Body (Delta): {json_data}")
+            if 'next_since' in json_data and 'read_ids' in json_data:
+                print("SUCCESS: Returned delta with next_since")
+            else:
+                print("FAILURE: Delta response is missing next_since/read_ids")
+
+        url = f"{BASE_URL}/api/notifications?user_id={user_id}&since={json_data['next_since']}"
+        with urllib.request.urlopen(url) as response:
+            json_data = json.loads(response.read().decode('utf-8'))
+            etag = response.headers.get('ETag')
+            print(f"Response Body (Nothing new): {json_data}")
+
+        req = urllib.request.Request(url, headers={'If-None-Match': etag})
+        try:
+            urllib.request.urlopen(req)
+            print("FAILURE: Unchanged inbox was sent again")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                print("SUCCESS: Unchanged inbox answered 304 Not Modified")
+            else:
+                raise
+    except urllib.error.HTTPError as e:
+        print(f"Error: {e.code} - {e.read().decode('utf-8')}")
+
 if __name__ == "__main__":
     test_notifications()
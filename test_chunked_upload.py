@@ -0,0 +1,75 @@
+import json
+import hashlib
+import urllib.request
+import urllib.error
+
+from test_api import post_json, BASE_URL
+
+CHUNK_SIZE = 4096
+
+def put_chunk(url, data):
+    req = urllib.request.Request(url, data=data, method='PUT',
+                                 headers={'Content-Type': 'application/octet-stream'})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.getcode(), response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode('utf-8')
+
+def test_chunked_upload():
+    # 1. Login (user created by test_api.py)
+    print("Logging in...")
+    login_data = {"username": "testfarmer_urllib", "password": "password123"}
+    status, text = post_json(f"{BASE_URL}/api/login", login_data)
+    print(f"Login: {status} - {text}")
+
+    try:
+        user_id = json.loads(text).get('user_id')
+    except:
+        print("Login failed to parse JSON")
+        return
+
+    with open('test_image.jpg', 'rb') as f:
+        img_data = f.read()
+
+    # 2. Start the upload
+    print("Testing Resumable Upload...")
+    init_data = {"user_id": user_id, "filename": "test_image.jpg", "total_size": len(img_data),
+                 "chunk_size": CHUNK_SIZE, "sha256": hashlib.sha256(img_data).hexdigest()}
+    status, text = post_json(f"{BASE_URL}/api/upload/init", init_data)
+    print(f"Init: {status} - {text}")
+    upload_id = json.loads(text)['upload_id']
+
+    # 3. Send the chunks, resending the first one as a reconnecting client would
+    chunks = [img_data[i:i + CHUNK_SIZE] for i in range(0, len(img_data), CHUNK_SIZE)]
+    for n, chunk in enumerate(chunks):
+        status, text = put_chunk(f"{BASE_URL}/api/upload/{upload_id}/chunk/{n}", chunk)
+        print(f"Chunk {n}: {status}")
+    status, text = put_chunk(f"{BASE_URL}/api/upload/{upload_id}/chunk/0", chunks[0])
+    print(f"Resent chunk 0: {status} - {text}")
+
+    # 4. Finalize
+    status, text = post_json(f"{BASE_URL}/api/upload/{upload_id}/finalize",
+                             {"type": "identify", "insect_name": "Aphids", "confidence": 0.9})
+    print(f"Finalize: {status} - {text}")
+    if status == 201 and json.loads(text).get('record_type') == 'detection':
+        print("SUCCESS: Chunked upload saved as a detection")
+    else:
+        print("FAILURE: Chunked upload was not saved")
+
+    # 5. Count upload finalized with breakdown as a JSON object (not a string)
+    print("Testing Count Finalize with a breakdown object...")
+    status, text = post_json(f"{BASE_URL}/api/upload/init", init_data)
+    upload_id = json.loads(text)['upload_id']
+    for n, chunk in enumerate(chunks):
+        put_chunk(f"{BASE_URL}/api/upload/{upload_id}/chunk/{n}", chunk)
+    status, text = post_json(f"{BASE_URL}/api/upload/{upload_id}/finalize",
+                             {"type": "count", "total_count": 7, "breakdown": {"Aphids": 5, "Pygmy Grasshopper": 2}})
+    print(f"Finalize (count): {status} - {text}")
+    if status == 201 and json.loads(text).get('record_type') == 'count':
+        print("SUCCESS: Count upload with a breakdown object saved")
+    else:
+        print("FAILURE: Count upload with a breakdown object was not saved")
+
+if __name__ == "__main__":
+    test_chunked_upload()
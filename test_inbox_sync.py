@@ -0,0 +1,84 @@
+"""
+Inbox delta sync with out-of-order commits: ids and timestamps are assigned before
+commit, so an alert (or a read) can become visible after a newer one was already
+synced. The next ?since call must still deliver it, exactly once. Runs in-process on
+a throwaway database, so no server is needed and spim.db is never touched.
+Usage: python test_inbox_sync.py
+"""
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from flask import Flask
+from db_config import configure_database
+from models import db, ph_time, User, Alert, AlertReceipt
+from cache import result_cache
+from alerts import get_inbox_changes
+
+def test_late_commits():
+    tmp_dir = tempfile.mkdtemp(prefix='spim_test_')
+    os.environ['SPIM_DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'test.db')}"
+    app = Flask(__name__)
+    app.instance_path = tmp_dir
+    configure_database(app)
+    db.init_app(app)
+    result_cache.init_app(app)
+
+    failures = []
+    def check(label, got, expected):
+        print(f"{label}: {got}")
+        if got != expected:
+            failures.append(f"{label}: expected {expected}, got {got}")
+
+    try:
+        with app.app_context():
+            db.create_all()
+            farmer = User(full_name='Sync Farmer', username='sync_farmer', password_hash='x',
+                          municipality='Test', street_barangay='Test')
+            db.session.add(farmer)
+            db.session.commit()
+
+            def send(alert_id, timestamp):
+                db.session.add(Alert(id=alert_id, message=f'alert {alert_id}', timestamp=timestamp))
+                db.session.add(AlertReceipt(alert_id=alert_id, user_id=farmer.id))
+                db.session.commit()
+
+            def sync(cursor):
+                items, read_ids, cursor = get_inbox_changes(farmer.id, cursor, include_read=True)
+                return [alert.id for alert, _ in items], read_ids, cursor
+
+            now = ph_time()
+            send(10, now - timedelta(seconds=2))
+            send(20, now)
+            new_ids, _, cursor = sync('0')
+            check("First sync", new_ids, [20, 10])
+
+            # Alert 15 got its id and timestamp before 20 but committed after the client synced
+            send(15, now - timedelta(seconds=1))
+            new_ids, _, cursor = sync(cursor)
+            check("Late lower-id alert", new_ids, [15])
+            new_ids, _, cursor = sync(cursor)
+            check("No repeats", new_ids, [])
+
+            # Reads: 20 is synced as read, then a read of 10 stamped earlier commits
+            AlertReceipt.query.filter_by(alert_id=20).update({'is_read': True, 'read_at': now})
+            db.session.commit()
+            _, read_ids, cursor = sync(cursor)
+            check("Read", read_ids, [20])
+            AlertReceipt.query.filter_by(alert_id=10).update({'is_read': True, 'read_at': now - timedelta(seconds=1)})
+            db.session.commit()
+            _, read_ids, cursor = sync(cursor)
+            check("Late read", read_ids, [10])
+            _, read_ids, cursor = sync(cursor)
+            check("No repeated reads", read_ids, [])
+
+        if failures:
+            for failure in failures:
+                print(f"FAILURE: {failure}")
+        else:
+            print("SUCCESS: Late commits were delivered once")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    test_late_commits()
@@ -0,0 +1,72 @@
+"""
+Content-addressed storage under concurrency: two sessions store the same bytes at
+once. The second insert hits the (sha256, folder) unique constraint and must reuse
+the first row instead of failing. Runs in-process on a throwaway database and
+upload folder, so no server is needed and spim.db is never touched.
+Usage: python test_storage.py
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+from flask import Flask
+from db_config import configure_database
+from models import db, StoredImage
+from storage_backends import init_storage
+from storage import place_image
+
+def write_tmp(folder, data, name):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def test_concurrent_place_image():
+    tmp_dir = tempfile.mkdtemp(prefix='spim_test_')
+    os.environ['SPIM_DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'test.db')}"
+    app = Flask(__name__)
+    configure_database(app)
+    app.config['UPLOAD_FOLDER'] = os.path.join(tmp_dir, 'uploads')
+    app.config['STORAGE_BACKEND'] = 'local'
+    os.makedirs(app.config['UPLOAD_FOLDER'])
+    db.init_app(app)
+    init_storage(app)
+
+    data = b'same image bytes'
+    sha = hashlib.sha256(data).hexdigest()
+    results = {}
+    try:
+        with app.app_context():
+            db.create_all()
+
+            # Session A stores the image but hasn't committed when session B stores it too
+            image_a, created_a = place_image(write_tmp(tmp_dir, data, 'a'), sha, len(data), 'a.jpg', 'UPLOAD_FOLDER')
+
+            def second_upload():
+                with app.app_context():
+                    try:
+                        image_b, created_b = place_image(write_tmp(tmp_dir, data, 'b'), sha, len(data), 'b.jpg', 'UPLOAD_FOLDER')
+                        db.session.commit()
+                        results['b'] = (image_b.id, created_b)
+                    except Exception as e:
+                        results['b'] = e
+
+            thread = threading.Thread(target=second_upload)
+            thread.start()
+            thread.join(0.5) # B's insert waits for A's transaction
+            db.session.commit()
+            thread.join()
+
+            print(f"Session A: id={image_a.id} created={created_a}")
+            print(f"Session B: {results['b']}")
+            rows = StoredImage.query.filter_by(sha256=sha).count()
+            if results['b'] == (image_a.id, False) and created_a and rows == 1:
+                print("SUCCESS: Second upload reused the stored image")
+            else:
+                print(f"FAILURE: Expected one shared StoredImage row, found {rows}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    test_concurrent_place_image()
@@ -0,0 +1,48 @@
+import json
+
+from test_api import post_json, post_multipart, BASE_URL
+
+def test_batch_sync():
+    # 1. Login (user created by test_api.py)
+    print("Logging in...")
+    login_data = {"username": "testfarmer_urllib", "password": "password123"}
+    status, text = post_json(f"{BASE_URL}/api/login", login_data)
+    print(f"Login: {status} - {text}")
+
+    try:
+        user_id = json.loads(text).get('user_id')
+    except:
+        print("Login failed to parse JSON")
+        return
+
+    with open('test_image.jpg', 'rb') as f:
+        img_data = f.read()
+
+    # 2. Send a mixed offline queue in one request (one invalid item on purpose)
+    print("Testing Batch Sync...")
+    items = [
+        {"type": "identify", "client_id": "q-1", "insect_name": "Aphids", "confidence": 0.91, "image": "img_0"},
+        {"type": "count", "client_id": "q-2", "total_count": 7,
+         "breakdown": {"Aphids": 5, "Pygmy Grasshopper": 2}, "image": "img_1"},
+        {"type": "identify", "client_id": "q-3", "insect_name": "Aphids", "image": "img_missing"}
+    ]
+    fields = {'user_id': user_id, 'items': json.dumps(items)}
+    files = {
+        'img_0': ('batch_0.jpg', img_data, 'image/jpeg'),
+        'img_1': ('batch_1.jpg', img_data, 'image/jpeg')
+    }
+    status, text = post_multipart(f"{BASE_URL}/api/sync/batch", fields, files)
+    print(f"Batch: {status} - {text}")
+
+    try:
+        res_json = json.loads(text)
+        statuses = [r['status'] for r in res_json['results']]
+        if statuses == ['created', 'created', 'error']:
+            print("SUCCESS: Per-item statuses match")
+        else:
+            print(f"FAILURE: Unexpected statuses {statuses}")
+    except (json.JSONDecodeError, KeyError):
+        print("FAILURE: Could not decode batch response")
+
+if __name__ == "__main__":
+    test_batch_sync()
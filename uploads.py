@@ -0,0 +1,126 @@
+"""
+Resumable (chunked) uploads for sync images over unreliable mobile links.
+
+Protocol (see api_documentation.md, "Resumable Uploads"):
+    POST /api/upload/init                 -> upload_id, chunk_size
+    PUT  /api/upload/<id>/chunk/<n>       -> appends chunk n (0-based) to the temp file
+    GET  /api/upload/<id>                 -> next_chunk / received_bytes to resume from
+    POST /api/upload/<id>/finalize        -> stores the image and creates the record
+
+Chunks must arrive in order. Progress is kept in the ChunkedUpload row, so a client
+that reconnects only resends from next_chunk. Re-sending an already stored chunk is
+acknowledged without writing it again.
+"""
+import os
+import uuid
+from datetime import timedelta
+from flask import current_app
+from models import db, ChunkedUpload, ph_time
+from storage import TMP_DIR_NAME
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 2 * 1024 * 1024
+MAX_UPLOAD_SIZE = 32 * 1024 * 1024
+STALE_UPLOAD_HOURS = 48
+
+def part_path(upload):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], TMP_DIR_NAME, 'chunks', f"{upload.id}.part")
+
+def create_upload(user_id, filename=None, total_size=None, sha256=None, chunk_size=None):
+    """
+    Adds a ChunkedUpload to the session and creates its empty temp file (caller commits).
+    """
+    chunk_size = min(chunk_size or DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE)
+    upload = ChunkedUpload(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        total_size=total_size,
+        sha256=sha256.lower() if sha256 else None,
+        chunk_size=chunk_size
+    )
+    path = part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    db.session.add(upload)
+    return upload
+
+def upload_status(upload):
+    return {
+        "upload_id": upload.id,
+        "status": upload.status,
+        "chunk_size": upload.chunk_size,
+        "next_chunk": upload.next_chunk,
+        "received_bytes": upload.received_bytes,
+        "total_size": upload.total_size,
+    }
+
+def append_chunk(upload, index, data):
+    """
+    Appends chunk `index` to the upload. Returns 'stored', 'duplicate' (already
+    received, nothing written) or 'out_of_order' (the client must resume from
+    next_chunk). Commits the new offset.
+    """
+    # Re-read the progress under a row lock: `upload` was loaded before the body arrived,
+    # and a slow retry of this chunk must not cut off chunks committed since.
+    upload = ChunkedUpload.query.filter_by(id=upload.id).with_for_update().populate_existing().one()
+    if index < upload.next_chunk:
+        db.session.rollback()
+        return 'duplicate'
+    if index > upload.next_chunk:
+        db.session.rollback()
+        return 'out_of_order'
+
+    # Claim the offset before writing. The UPDATE holds the row (on SQLite the database)
+    # until commit, so a concurrent retry of the same chunk finds it taken and writes nothing.
+    offset = upload.received_bytes
+    claimed = ChunkedUpload.query.filter_by(id=upload.id, next_chunk=index, received_bytes=offset).update({
+        'next_chunk': index + 1,
+        'received_bytes': offset + len(data),
+        'updated_at': ph_time()
+    })
+    if not claimed:
+        db.session.rollback()
+        return 'duplicate'
+    try:
+        with open(part_path(upload), 'r+b') as f:
+            # Drop bytes from an append whose offset never got committed (crash, dropped
+            # request); offset is the committed received_bytes, so nothing stored is lost
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError:
+        db.session.rollback()
+        raise
+    db.session.commit()
+    return 'stored'
+
+def reset_upload(upload):
+    """
+    Empties the temp file so the client can start over (e.g. checksum mismatch).
+    """
+    open(part_path(upload), 'wb').close()
+    upload.next_chunk = 0
+    upload.received_bytes = 0
+    db.session.commit()
+
+def remove_part_file(upload):
+    try:
+        os.remove(part_path(upload))
+    except OSError:
+        pass
+
+def purge_stale_uploads(hours=STALE_UPLOAD_HOURS):
+    """
+    Deletes unfinished uploads not touched for `hours` and their temp files,
+    plus the rows of finished uploads past the same age.
+    """
+    cutoff = ph_time() - timedelta(hours=hours)
+    stale = ChunkedUpload.query.filter(ChunkedUpload.updated_at < cutoff).all()
+    for upload in stale:
+        remove_part_file(upload)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
@@ -1,3 +1,4 @@
+import json
 
 # Source of Truth for Insect Types
 INSECT_TYPES = {
@@ -32,3 +33,45 @@ def is_beneficial(insect_name):
     # Normalize to lowercase and remove spaces
     normalized = insect_name.lower().strip().replace(" ", "")
     return INSECT_TYPES.get(normalized) == "BENEFICIAL"
+
+# Label used when a counting record has no readable breakdown
+MIXED_COUNT_LABEL = "Mixed Count"
+
+def extract_count(value):
+    """
+    Coerces a single breakdown value into an integer count.
+    Accepts numbers, digit strings and dicts like {"count": 5}, {"value": 5} or {"qty": 5}.
+    Returns 0 if no count can be found.
+    """
+    try:
+        if isinstance(value, (int, float)):
+            return int(value)
+        if isinstance(value, str) and value.isdigit():
+            return int(value)
+        if isinstance(value, dict):
+            # Try common keys first
+            for key in ('count', 'value', 'qty'):
+                if key in value:
+                    return extract_count(value[key])
+            # Fallback: Grab the first numeric value found
+            for v in value.values():
+                if isinstance(v, (int, float)) or (isinstance(v, str) and v.isdigit()):
+                    return int(v)
+    except (TypeError, ValueError):
+        pass
+    return 0
+
+def parse_breakdown(breakdown):
+    """
+    Parses a CountingRecord breakdown JSON string into a list of (insect_name, count) pairs.
+    Returns None if the breakdown is missing or malformed.
+    """
+    if not breakdown:
+        return None
+    try:
+        data = json.loads(breakdown)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    return [(str(name), extract_count(val)) for name, val in data.items()]
@@ -0,0 +1,9 @@
+"""
+Background worker process for the 'db' task queue backend
+Runs infestation threshold checks and alert fan-out outside the web server.
+Usage: SPIM_TASK_QUEUE=db python worker.py   (start the web app with the same setting)
+"""
+from app import app, task_queue
+
+if __name__ == "__main__":
+    task_queue.run_worker()